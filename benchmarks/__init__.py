@@ -0,0 +1,6 @@
+"""Synthetic data generator and benchmark suite for budget_envelopes.
+
+Generate data:   python -m benchmarks.generate --transactions 100000 -o data/bench
+Run the suite:   python -m benchmarks.run --scale small --scale medium
+Compare runs:    python -m benchmarks.compare before.json after.json
+"""
@@ -0,0 +1,42 @@
+"""Compare two benchmark results (see benchmarks/run.py) stage by stage."""
+import json
+
+import click
+
+
+def compare(before: dict, after: dict) -> list:
+    # (scale, stage, measure, before, after, after / before) of all stages in both
+    rows = []
+    for scale, scale_results in after["scales"].items():
+        before_stages = before["scales"].get(scale, {}).get("stages", {})
+        for stage, measured in scale_results["stages"].items():
+            if stage not in before_stages:
+                continue
+            for measure in ["seconds", "peak_bytes", "result_bytes"]:
+                old, new = before_stages[stage].get(measure), measured.get(measure)
+                if old and new is not None:
+                    rows.append((scale, stage, measure, old, new, new / old))
+    return rows
+
+
+@click.command()
+@click.argument("before", type=click.File("r"))
+@click.argument("after", type=click.File("r"))
+@click.option(
+    "--threshold",
+    default=1.1,
+    help="Ratio after / before from which a measure is flagged as regression",
+)
+def main(before, after, threshold):
+    """Compare the benchmark results BEFORE and AFTER."""
+    for scale, stage, measure, old, new, ratio in compare(
+        json.load(before), json.load(after)
+    ):
+        flag = "  REGRESSION" if ratio > threshold else ""
+        click.echo(
+            f"{scale:8} {stage:18} {measure:12} {old:14.4f} {new:14.4f} {ratio:6.2f}x{flag}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""Deterministic synthetic budgets and transactions of configurable size."""
+import os
+
+import click
+import numpy
+import pandas
+
+BUDGET_PERIODS = ["m", "q", "h", "y"]
+DEBIT = "DBT"
+CREDIT = "CRD"
+# files written by generate, with the reader options to read them
+BUDGETS_CSV = "budgets.csv"
+TRANSACTIONS_CSV = "transactions.csv"
+TRANSACTIONS_JSON = "transactions.json"
+CSV_FIELDS = dict(amount_field="amount", date_field=["when"], envelope_field="category")
+JSON_FIELDS = dict(
+    amount_field="amount",
+    date_field=["valuta", "bookingdate"],
+    envelope_field="envelope",
+    debit_flag_field="type",
+    debit_flag=DEBIT,
+)
+
+
+def envelope_names(envelopes: int, depth: int, rng: numpy.random.Generator) -> list:
+    # names of leaf envelopes with up to depth levels, e.g. 'E3:E3.1:E3.1.2'
+    names = []
+    for i in range(envelopes):
+        levels = rng.integers(1, depth + 1)
+        path = [f"E{i % max(envelopes // 4, 1)}"]
+        for level in range(1, levels):
+            path.append(f"{path[-1]}.{rng.integers(1, 4)}")
+        names.append(":".join(path))
+    return sorted(set(names))
+
+
+def generate_budgets(
+    envelopes: list, first_year: int, years: int, rng: numpy.random.Generator
+) -> pandas.DataFrame:
+    # per envelope a budget every year (m/q/h/y periods), plus one-off
+    # adjustments ('o') and transfers between envelopes ('t')
+    rows = []
+    for envelope in envelopes:
+        for year in range(first_year, first_year + years):
+            rows.append(
+                (
+                    envelope,
+                    f"{year}-{rng.integers(1, 13):02d}",
+                    BUDGET_PERIODS[rng.integers(len(BUDGET_PERIODS))],
+                    int(rng.integers(10, 2000)),
+                )
+            )
+    adjustments = max(len(envelopes) * years // 4, 1)
+    for _ in range(adjustments):
+        month = f"{first_year + rng.integers(years)}-{rng.integers(1, 13):02d}"
+        rows.append(
+            (
+                envelopes[rng.integers(len(envelopes))],
+                month,
+                "o",
+                int(rng.integers(-100, 300)),
+            )
+        )
+        source, target = rng.choice(len(envelopes), 2, replace=False)
+        rows.append(
+            (
+                f"{envelopes[source]}->{envelopes[target]}",
+                month,
+                "t",
+                int(rng.integers(5, 300)),
+            )
+        )
+    return pandas.DataFrame(rows, columns=["envelope", "month", "period", "budget"])
+
+
+def generate_transactions(
+    transactions: int,
+    envelopes: list,
+    first_year: int,
+    years: int,
+    rng: numpy.random.Generator,
+) -> pandas.DataFrame:
+    start = pandas.Timestamp(f"{first_year}-01-01")
+    days = (pandas.Timestamp(f"{first_year + years}-01-01") - start).days
+    dates = start + pandas.to_timedelta(
+        rng.integers(0, days * 24 * 60, transactions), unit="min"
+    )
+    # some transactions use envelopes that have no budget
+    names = numpy.array(envelopes + ["Unbudgeted"], dtype=object)
+    return pandas.DataFrame(
+        {
+            "amount": numpy.round(rng.uniform(1, 300, transactions), 2),
+            "date": dates,
+            "envelope": names[rng.integers(len(names), size=transactions)],
+            "type": numpy.where(rng.random(transactions) < 0.8, DEBIT, CREDIT),
+        }
+    )
+
+
+def write_transactions_csv(transactions: pandas.DataFrame, filename: str) -> None:
+    # US dates like '11/10/2023 18:03', credit transactions as negative amounts
+    pandas.DataFrame(
+        {
+            "amount": transactions.amount.where(
+                transactions.type == DEBIT, -transactions.amount
+            ),
+            "when": transactions.date.dt.strftime("%m/%d/%Y %H:%M"),
+            "category": transactions.envelope,
+        }
+    ).to_csv(filename, index=False)
+
+
+def write_transactions_json(
+    transactions: pandas.DataFrame, filename: str, rng: numpy.random.Generator
+) -> None:
+    # array of objects with string amounts, a booking date and for some
+    # transactions a valuta date
+    bookingdates = transactions.date.dt.strftime("%Y-%m-%d")
+    valuta = (transactions.date + pandas.Timedelta(days=1)).dt.strftime("%Y-%m-%d")
+    with_valuta = rng.random(transactions.shape[0]) < 0.3
+    records = pandas.DataFrame(
+        {
+            "amount": transactions.amount.astype(str),
+            "bookingdate": bookingdates,
+            "valuta": valuta.where(with_valuta),
+            "envelope": transactions.envelope,
+            "type": transactions.type,
+        }
+    ).to_dict("records")
+    for record in records:
+        if not isinstance(record["valuta"], str):
+            del record["valuta"]
+    pandas.Series(records).to_json(filename, orient="records")
+
+
+def generate(
+    directory: str,
+    transactions: int = 10000,
+    envelopes: int = 20,
+    depth: int = 3,
+    years: int = 3,
+    first_year: int = 2020,
+    seed: int = 0,
+) -> dict:
+    # write budgets.csv, transactions.csv and transactions.json into directory.
+    # The same arguments always give the same files.
+    rng = numpy.random.default_rng(seed)
+    os.makedirs(directory, exist_ok=True)
+    names = envelope_names(envelopes, depth, rng)
+    files = {
+        BUDGETS_CSV: os.path.join(directory, BUDGETS_CSV),
+        TRANSACTIONS_CSV: os.path.join(directory, TRANSACTIONS_CSV),
+        TRANSACTIONS_JSON: os.path.join(directory, TRANSACTIONS_JSON),
+    }
+    generate_budgets(names, first_year, years, rng).to_csv(
+        files[BUDGETS_CSV], index=False
+    )
+    statements = generate_transactions(transactions, names, first_year, years, rng)
+    write_transactions_csv(statements, files[TRANSACTIONS_CSV])
+    write_transactions_json(statements, files[TRANSACTIONS_JSON], rng)
+    return files
+
+
+@click.command()
+@click.option("--output-dir", "-o", default="data/benchmark", help="Target directory")
+@click.option("--transactions", "-n", default=10000, help="Number of transactions")
+@click.option("--envelopes", "-m", default=20, help="Number of leaf envelopes")
+@click.option("--depth", "-d", default=3, help="Maximum depth of the hierarchy")
+@click.option("--years", "-y", default=3, help="Number of years")
+@click.option("--first-year", default=2020, help="First year of the data")
+@click.option("--seed", default=0, help="Seed of the random number generator")
+def main(output_dir, transactions, envelopes, depth, years, first_year, seed):
+    """Write synthetic budgets and transactions (csv and json)."""
+    files = generate(
+        output_dir, transactions, envelopes, depth, years, first_year, seed
+    )
+    for filename in files.values():
+        click.echo(filename)
+
+
+if __name__ == "__main__":
+    main()
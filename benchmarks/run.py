@@ -0,0 +1,263 @@
+"""Benchmark suite: time and memory of each pipeline stage at several scales.
+
+Each stage is run `repeat` times for its best wall time, then once more under
+tracemalloc for its peak memory. The reading and stats stages are run with the
+plain and the compact dtypes (see budget_envelopes/dtypes.py), the memory saved
+by the compact dtypes is reported per stage. The results are written as json, see
+benchmarks/compare.py to compare the results of two commits.
+"""
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+import click
+import numpy
+import pandas
+
+from budget_envelopes.budget_reader import BudgetReader
+from budget_envelopes.cli import (
+    write_history_and_aggregation_csvs,
+    write_json_current_state,
+)
+from budget_envelopes.envelope_stats_calculator import EnvelopeStatsCalculator
+from budget_envelopes.months import format_month
+from budget_envelopes.plot import plot_month
+from budget_envelopes.transactions_reader import TransactionsReader
+
+from .generate import (
+    BUDGETS_CSV,
+    CSV_FIELDS,
+    JSON_FIELDS,
+    TRANSACTIONS_CSV,
+    TRANSACTIONS_JSON,
+    generate,
+)
+
+# stages run with the plain and the compact dtypes, the latter named <stage>_compact
+COMPACT_SUFFIX = "_compact"
+
+# arguments of generate per scale
+SCALES = {
+    "tiny": dict(transactions=1000, envelopes=10, depth=2, years=2),
+    "small": dict(transactions=10000, envelopes=20, depth=3, years=3),
+    "medium": dict(transactions=100000, envelopes=100, depth=3, years=5),
+    "large": dict(transactions=1000000, envelopes=500, depth=4, years=10),
+}
+
+
+def measure(stage, repeat: int = 3) -> tuple:
+    # best wall time of repeat runs and peak memory of one traced run of
+    # stage(), and the result of stage()
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = stage()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        stage()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(seconds), "peak_bytes": peak}, result
+
+
+def result_bytes(result) -> int:
+    # memory held by the result of a stage
+    if isinstance(result, pandas.DataFrame):
+        return int(result.memory_usage(deep=True).sum())
+    if isinstance(result, TransactionsReader):
+        return result_bytes(result.get_leaf_statements())
+    if isinstance(result, BudgetReader):
+        # the budgets as kept by the reader, e.g. in compact dtypes
+        return result_bytes(result.budgets)
+    if isinstance(result, EnvelopeStatsCalculator):
+        return result_bytes(result._transactions) + result_bytes(result._budgets)
+    return None
+
+
+def memory_reduction(stages: dict) -> dict:
+    # per stage run with both dtypes, the share of the result and peak memory of
+    # the plain dtypes saved by the compact dtypes
+    reduction = {}
+    for name, measured in stages.items():
+        compact = stages.get(name + COMPACT_SUFFIX)
+        if compact is None:
+            continue
+        reduction[name] = {
+            measure: 1 - compact[measure] / measured[measure]
+            for measure in ["result_bytes", "peak_bytes"]
+            if measured.get(measure) and compact.get(measure) is not None
+        }
+    return reduction
+
+
+def run_scale(directory: str, parameters: dict, repeat: int = 3) -> dict:
+    files = generate(directory, **parameters)
+    stages = {}
+
+    def run(name, stage):
+        stages[name], result = measure(stage, repeat)
+        stages[name]["result_bytes"] = result_bytes(result)
+        logging.info(f"{name}: {stages[name]}")
+        return result
+
+    first_month = f"{parameters.get('first_year', 2020)}-01"
+    last_month = format_month(
+        (parameters.get("first_year", 2020) + parameters["years"]) * 12 - 1
+    )
+
+    def read_and_calculate(suffix: str = "", compact_dtypes: bool = False):
+        csv_reader = run(
+            "transactions_csv" + suffix,
+            lambda: TransactionsReader(
+                filename=files[TRANSACTIONS_CSV],
+                extraction_mode="columns",
+                compact_dtypes=compact_dtypes,
+                **CSV_FIELDS,
+            ),
+        )
+        json_reader = run(
+            "transactions_json" + suffix,
+            lambda: TransactionsReader(
+                filename=files[TRANSACTIONS_JSON],
+                extraction_mode="columns",
+                compact_dtypes=compact_dtypes,
+                **JSON_FIELDS,
+            ),
+        )
+        budget_reader = run(
+            "budgets" + suffix,
+            lambda: BudgetReader(
+                filename=files[BUDGETS_CSV], compact_dtypes=compact_dtypes
+            ),
+        )
+
+        def calculator():
+            calculator = EnvelopeStatsCalculator(
+                first_month=first_month,
+                last_month=last_month,
+                engine="matrix",
+                compact_dtypes=compact_dtypes,
+            )
+            calculator.add_budgets(budget_reader)
+            calculator.add_transactions(csv_reader)
+            calculator.add_transactions(json_reader)
+            calculator._merge_inputs()
+            return calculator
+
+        # the merged inputs held by the calculator
+        run("merge_inputs" + suffix, calculator)
+        return run("envelope_stats" + suffix, lambda: calculator().get_envelope_stats())
+
+    stats = read_and_calculate()
+    read_and_calculate(COMPACT_SUFFIX, compact_dtypes=True)
+
+    output_file = os.path.join(directory, "envelope-stats.json")
+    current_state = (
+        stats.query(f"month == '{last_month}'").reset_index().to_dict("records")
+    )
+    run(
+        "write_json",
+        lambda: write_json_current_state(output_file, current_state),
+    )
+    run("write_csv", lambda: write_history_and_aggregation_csvs(output_file, stats))
+    month_stats = stats.reset_index().query(f"month == '{last_month}'")
+    run(
+        "plot_month",
+        lambda: plot_month(month_stats, output_file.replace(".json", ".png")),
+    )
+    return {
+        "parameters": parameters,
+        "stages": stages,
+        "memory_reduction": memory_reduction(stages),
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(scales: list, repeat: int = 3, directory: str = None) -> dict:
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "scales": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            logging.info(f"running scale {scale}: {SCALES[scale]}")
+            results["scales"][scale] = run_scale(
+                os.path.join(directory or tmp, scale), SCALES[scale], repeat
+            )
+    return results
+
+
+@click.command()
+@click.option(
+    "--scale",
+    "-s",
+    type=click.Choice(list(SCALES)),
+    multiple=True,
+    default=["tiny", "small"],
+    help="Scales to run, see SCALES",
+)
+@click.option("--repeat", "-r", default=3, help="Runs per stage, the best is kept")
+@click.option(
+    "--output",
+    "-o",
+    default=None,
+    help="Results json. Default: benchmarks/results/<commit>.json",
+)
+@click.option(
+    "--data-dir",
+    default=None,
+    help="Keep the generated data in this directory instead of a temporary one",
+)
+def main(scale, repeat, output, data_dir):
+    """Time and memory-profile each pipeline stage at several scales."""
+    # the stages' own logging would dominate the output
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("matplotlib").setLevel(logging.ERROR)
+    results = run_suite(list(scale), repeat, data_dir)
+
+    if output is None:
+        output = os.path.join(
+            os.path.dirname(__file__),
+            "results",
+            f"{results['commit'] or 'latest'}.json",
+        )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=4)
+    for name, scale_results in results["scales"].items():
+        for stage, measured in scale_results["stages"].items():
+            click.echo(
+                f"{name:8} {stage:26} {measured['seconds']:9.4f} s "
+                + f"{measured['peak_bytes'] / 1024**2:9.1f} MB peak"
+            )
+        for stage, reduction in scale_results["memory_reduction"].items():
+            click.echo(
+                f"{name:8} {stage:26} compact dtypes save "
+                + f"{reduction.get('result_bytes', 0):6.1%} of the result and "
+                + f"{reduction.get('peak_bytes', 0):6.1%} of the peak memory"
+            )
+    click.echo(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,21 @@
 """Main module."""
+import numpy
 import pandas
 import logging
-
-logging.basicConfig(encoding="utf-8", level=logging.DEBUG)
+from .dtypes import compact_budgets, expand_budgets
+from .envelope_hierarchy import EnvelopeHierarchy
+from .months import month_codes, month_codes_from_dates
+from .parquet import read_parquet_columns
+from .profiling import stage
 
 FILENAME = "filename"
+CACHE = "cache"
+SPARSE_BUDGETS = "sparse_budgets"
+COMPACT_DTYPES = "compact_dtypes"
+BUDGET_COLUMNS = ["envelope", "month", "period", "budget"]
+# budgets for several months are divided into monthly budgets
+PERIOD_MONTHS = {"y": 12, "h": 6, "q": 3}
+TRANSFER_SEPARATOR = "->"
 
 
 class BudgetReader(object):
@@ -15,8 +26,12 @@ class BudgetReader(object):
                 return super().__new__(JSONBudgetReader)
             elif kwargs["filename"].endswith(".csv"):
                 return super().__new__(CSVBudgetReader)
+            elif kwargs["filename"].endswith(".parquet"):
+                return super().__new__(ParquetBudgetReader)
             else:
-                raise Exception("Budget-input: Either .json or .csv-file needed.")
+                raise Exception(
+                    "Budget-input: Either .json, .csv or .parquet-file needed."
+                )
         else:
             # one of the factory products has been instantiated directly
             instance = super().__new__(cls)
@@ -24,103 +39,192 @@ class BudgetReader(object):
 
     def __init__(self, *args, **kwargs):
         self.budgets = None
-        self.budgets_filename = kwargs["filename"]
-        self._read_budgets(kwargs["filename"])
+        self.budgets_filename = kwargs[FILENAME]
+
+        with stage("budget_reader", filename=self.budgets_filename) as record:
+            # unchanged files are loaded from the cache
+            cache = kwargs.get(CACHE)
+            if cache is not None:
+                key = cache.key(self.budgets_filename, {"reader": type(self).__name__})
+                self.budgets = cache.get(key)
+                if self.budgets is not None:
+                    logging.info(
+                        f"budgets of {self.budgets_filename} loaded from cache"
+                    )
+
+            if self.budgets is None:
+                self._read_budgets(kwargs[FILENAME])
+                if cache is not None:
+                    cache.put(key, self.budgets)
+            record["rows"] = self.budgets.shape[0]
+
+        self.compact_dtypes = bool(kwargs.get(COMPACT_DTYPES))
+        if kwargs.get(SPARSE_BUDGETS):
+            # keep only the months in which budgets change (fewer rows)
+            self.budgets = SparseBudgets(self.budgets, self.compact_dtypes)
+            logging.debug(
+                f"budgets of {self.budgets_filename} kept sparse in {len(self.budgets)} envelope-months"
+            )
+        elif self.compact_dtypes:
+            # categorical envelopes, int16 months and amounts in cents
+            self.budgets = compact_budgets(self.budgets)
+
+    def get_budgets(self) -> pandas.DataFrame:
+        # budgets of all envelope-months, also if kept sparse or in compact dtypes
+        if isinstance(self.budgets, SparseBudgets):
+            return self.budgets.to_frame()
+        if self.compact_dtypes:
+            return expand_budgets(self.budgets)
+        return self.budgets
 
     def _read_budgets(self, filename):
         # abstract method
         raise NotImplementedError
 
-    def _calc_parent_budgets(self, budgets: pandas.DataFrame) -> pandas.DataFrame:
-        envelope_products = self._product_budgets(budgets).reset_index()
-        hierarchy_adjusted = envelope_products.apply(
-            self._duplicate_entry_for_parent_envelopes, axis=1
+    def _process_budgets(self, budgets: pandas.DataFrame) -> pandas.DataFrame:
+        # budget file contents (BUDGET_COLUMNS) to monthly budgets and adjustments
+        # per envelope, including parent envelopes
+        if pandas.api.types.is_datetime64_any_dtype(budgets.month):
+            months = month_codes_from_dates(budgets.month)
+        else:
+            months = month_codes(budgets.month)
+        budgets = (
+            budgets.assign(month=months).set_index(["envelope", "month"]).sort_index()
         )
 
-        # return duplicated
-        return (
-            hierarchy_adjusted.explode("envelope")
-            .groupby(["envelope", "month"])
-            .agg(
-                {
-                    "budget": lambda x: x.sum(min_count=1),
-                    "adjustment": lambda x: x.sum(min_count=1),
-                }
-            )
+        # type 'o' (one-off) and 't' (transfer). 't' are converted into 'o'
+        adjustments = budgets.query(f'period in ["o","t"]')
+        adjustments = adjustments.rename(columns={"budget": "adjustment"})
+        adjustments = self._transform_transfers_to_oneoffs(adjustments)
+        # type 'y' (yearly), & 'q'
+        budgets = budgets.query(f'period not in ["o","t"]')
+
+        ## TODO detect contradicting budgets (same month and envelope)
+
+        budgets = budgets.assign(budget_input=budgets.budget)
+
+        # normalize budgets to monthly budgets
+        budgets = self._break_down_to_monthly_budgets(budgets)
+        # add adjustments (only monthly)
+        budgets = budgets.join(adjustments.adjustment, how="outer")
+        # sum up budgets over parent envelopes
+        return self._calc_parent_budgets(budgets)
+
+    def _calc_parent_budgets(self, budgets: pandas.DataFrame) -> pandas.DataFrame:
+        # add up budgets and adjustments to all parent envelopes. Months without
+        # any budget (adjustment) of an envelope or its children stay NaN.
+        envelope_products = self._product_budgets(budgets)
+        hierarchy = EnvelopeHierarchy(
+            envelope_products.index.get_level_values("envelope").unique()
+        )
+        return hierarchy.rollup(
+            envelope_products[["budget", "adjustment"]], min_count=1
         )
 
-    def _break_down_to_monthly_budgets(self, s: pandas.Series):
-        if pandas.isnull(s.budget):
-            s.budget = 0
-        if s.period == "y":  ## budget for a year
-            s["budget"] = round(s.budget / 12)
-        if s.period == "h":  ## budget for half a year
-            s["budget"] = round(s.budget / 6)
-        elif s.period == "q":  ## budget for a quarter year
-            s["budget"] = round(s.budget / 3)
-        return s
+    def _break_down_to_monthly_budgets(
+        self, budgets: pandas.DataFrame
+    ) -> pandas.DataFrame:
+        # yearly ('y'), half-yearly ('h') and quarterly ('q') budgets are divided
+        # by their number of months, all others are monthly already
+        # (set on a float copy, the budgets may be read as integers)
+        budget = budgets.budget.fillna(0).astype(float)
+        months = budgets.period.map(PERIOD_MONTHS)
+        periodic = months.notna()
+        budget.loc[periodic] = numpy.round(budget.loc[periodic] / months.loc[periodic])
+        return budgets.assign(budget=budget)
 
     def _transform_transfers_to_oneoffs(
         self, adj: pandas.DataFrame
     ) -> pandas.DataFrame:
-        # add a sign multiplicator array to transfer entries: [-1,1]. Fro all others simply a 1
-        adj = adj.reset_index().assign(
-            signmultiplicator=lambda df: df.period.apply(
-                lambda v: [-1, 1] if v == "t" else [1]
-            )
+        # a transfer 'A->B' becomes two one-offs: -adjustment for A (debit leg)
+        # and +adjustment for B (credit leg)
+        adj = adj.reset_index()
+        transfer = adj.period == "t"
+        envelopes = adj.envelope.str.split(TRANSFER_SEPARATOR)
+        debit = adj.assign(
+            envelope=envelopes.str[0],
+            adjustment=adj.adjustment.where(~transfer, -adj.adjustment),
         )
-        # split the transfer envelope names and explode them into two lines
-        adj.envelope = adj.envelope.apply(lambda v: v.split("->"))
-        adj = adj.explode(["envelope", "signmultiplicator"])
-        # use signmultiplicator to mark the giving and receiving budget adjustment
-        if adj.shape[0] > 0:
-            adj.adjustment = adj.apply(
-                lambda row: row.adjustment * row.signmultiplicator, axis=1
-            )
+        credit = adj.loc[transfer].assign(envelope=envelopes.loc[transfer].str[-1])
+        # the credit leg follows the debit leg of each transfer
         return (
-            adj.replace("t", "o")
-            .drop("signmultiplicator", axis=1)
+            pandas.concat([debit, credit])
+            .sort_index(kind="stable")
+            .assign(period="o")
             .set_index(["envelope", "month"])
         )
 
     ## make sure all envelopes and budgets are available for all specified months
     def _product_budgets(self, budgets: pandas.DataFrame) -> pandas.DataFrame:
         # make sure each possible index is listed only once (transfers lead to repeated index)
-        budgets = budgets.groupby(["envelope", "month"]).sum(min_count=1)
-
-        # create cross (product) index of motnhs and envelopes
-        budget_months = budgets.reset_index("month").month.unique()
-        budget_envelopes = budgets.reset_index("envelope").envelope.unique()
-        productindex = pandas.MultiIndex.from_product(
-            [budget_envelopes, budget_months], names=["envelope", "month"]
+        budgets = (
+            budgets[["budget", "adjustment"]]
+            .groupby(["envelope", "month"])
+            .sum(min_count=1)
         )
 
-        # fill missing values for budgets, but not adjustments
-        productbudgets = budgets.reindex(productindex).sort_index()
-        propagedbudgets = (
-            productbudgets.reset_index()
-            .groupby("envelope")
-            .apply(lambda gdf: gdf.ffill().bfill())
-            .set_index(["envelope", "month"])
+        # envelope x month matrix of the budgets (the product of envelopes and
+        # months), filled forwards and backwards along the months. Adjustments
+        # are not filled.
+        productbudgets = (
+            budgets.budget.unstack("month")
+            .ffill(axis=1)
+            .bfill(axis=1)
+            .stack(future_stack=True)
+            .to_frame("budget")
         )
-        productbudgets["budget"] = propagedbudgets.budget
-        return productbudgets  # .set_index(['envelope','month'])
+        productbudgets["adjustment"] = budgets.adjustment.reindex(productbudgets.index)
+        return productbudgets
 
-    ## add up budgets to the parent envelopes by
-    ## duplicating each entry
-    def _duplicate_entry_for_parent_envelopes(self, r: pandas.Series):
-        hierarchy = r.envelope.split(":")
-        parent_envelopes = [r.envelope]
-        for _ in hierarchy[::-1]:
-            hierarchy.remove(_)
-            parent_envelope = ":".join(hierarchy)
-            # if parent_envelope == "":
-            #    parent_envelope = "TOTAL"
 
-            parent_envelopes.append(parent_envelope)
+class SparseBudgets(object):
+    """
+    Sparse budgets: only the envelope-months whose budget differs from the month
+    before, or that have an adjustment, are kept. All other months inherit the
+    budget of the month before. Unlike compact dtypes, which keep all rows in
+    smaller dtypes, this keeps fewer rows; both can be combined.
+    Args:
+        budgets (pandas.DataFrame): budgets as read by the BudgetReader, indexed by
+            envelope and month
+        compact_dtypes (bool): keep the changes in compact dtypes (see dtypes.py)
+    Attributes:
+        changes (pandas.DataFrame): the kept envelope-months
+        months (numpy.ndarray): all month codes of the budgets
+    """
+
+    def __init__(self, budgets: pandas.DataFrame, compact_dtypes: bool = False):
+        budget = budgets.budget.unstack("month")
+        previous = budget.shift(1, axis=1)
+        unchanged = (budget == previous) | (budget.isna() & previous.isna())
+        # the first month of each envelope is always kept
+        unchanged.iloc[:, 0] = False
+        changed = ~unchanged.stack(future_stack=True).reindex(budgets.index)
+        self.changes = budgets.loc[changed.to_numpy() | budgets.adjustment.notna()]
+        self.months = budget.columns.to_numpy()
+        self.compact_dtypes = compact_dtypes
+        if compact_dtypes:
+            self.changes = compact_budgets(self.changes)
 
-        r.envelope = parent_envelopes
-        return r
+    def __len__(self) -> int:
+        return self.changes.shape[0]
+
+    def to_frame(self) -> pandas.DataFrame:
+        # the budgets of all envelope-months
+        changes = self.changes
+        if self.compact_dtypes:
+            changes = expand_budgets(changes)
+        budget = (
+            changes.budget.unstack("month")
+            .reindex(columns=self.months)
+            .ffill(axis=1)
+            .stack(future_stack=True)
+        )
+        return pandas.DataFrame(
+            {
+                "budget": budget,
+                "adjustment": changes.adjustment.reindex(budget.index),
+            }
+        )
 
 
 class CSVBudgetReader(BudgetReader):
@@ -135,28 +239,23 @@ class CSVBudgetReader(BudgetReader):
     """
 
     def _read_budgets(self, filename):
-        budgets = (
-            pandas.read_csv(filename).set_index(["envelope", "month"]).sort_index()
-        )
+        self.budgets = self._process_budgets(pandas.read_csv(filename))
 
-        # type 'o' (one-off) and 't' (transfer). 't' are converted into 'o'
-        adjustments = budgets.query(f'period in ["o","t"]')
-        adjustments = adjustments.rename(columns={"budget": "adjustment"})
-        adjustments = self._transform_transfers_to_oneoffs(adjustments)
-        # type 'y' (yearly), & 'q'
-        budgets = budgets.query(f'period not in ["o","t"]')
-
-        ## TODO detect contradicting budgets (same month and envelope)
 
-        budgets.loc[:, "budget_input"] = budgets.budget
+class ParquetBudgetReader(BudgetReader):
+    """
+    Parquet Reader class. Only the budget columns are read from the file.
+    Args:
+        *args (list): list of arguments
+        **kwargs (dict): dict of keyword arguments
+    Attributes:
+        self
+    """
 
-        # normalize budgets to monthly budgets
-        budgets = budgets.apply(self._break_down_to_monthly_budgets, axis=1)
-        # add adjustments (only monthly)
-        budgets = budgets.join(adjustments.adjustment, how="outer")
-        # sum up budgets over parent envelopes
-        added_up_bugdets = self._calc_parent_budgets(budgets)
-        self.budgets = added_up_bugdets
+    def _read_budgets(self, filename):
+        self.budgets = self._process_budgets(
+            read_parquet_columns(filename, BUDGET_COLUMNS)
+        )
 
 
 class JSONBudgetReader(BudgetReader):
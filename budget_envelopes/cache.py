@@ -0,0 +1,152 @@
+"""Content-addressed on-disk cache of parsed transaction and budget files."""
+import hashlib
+import json
+import logging
+import os
+import pickle
+
+import pandas
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "budget-envelopes")
+DEFAULT_MAX_BYTES = 512 * 1024**2
+PARQUET = "parquet"
+PICKLE = "pickle"
+SUFFIXES = {PARQUET: ".parquet", PICKLE: ".pkl"}
+# part of the keys, changed when the cached frames change
+ENTRY_VERSION = 2
+# errors of loading a cache entry that cannot be read any more (pyarrow's
+# ArrowInvalid is a ValueError)
+UNREADABLE_ENTRY_ERRORS = (
+    EOFError,
+    pickle.UnpicklingError,
+    AttributeError,
+    ImportError,
+    ValueError,
+)
+
+
+def default_entry_format() -> str:
+    # parquet needs the optional pyarrow, pickle is the fallback without it
+    try:
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        return PICKLE
+    return PARQUET
+
+
+class ParsedFileCache(object):
+    """
+    Cache of parsed files, keyed by a hash of the file contents, the options
+    used to parse it and the versions of the entries and of pandas. Entries are
+    Parquet files, or pickles if pyarrow is not installed, evicted least
+    recently used first once max_bytes is exceeded. Loading a pickle can run
+    code, so the directory must only be writable by the user (it is created so).
+    Args:
+        directory (str): directory the cache entries are stored in
+        max_bytes (int): size cap of all entries together
+        entry_format (str): 'parquet' or 'pickle', default: parquet if pyarrow
+            is installed
+    Attributes:
+        hits (int): number of entries loaded from the cache
+        misses (int): number of lookups without an entry
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        max_bytes=DEFAULT_MAX_BYTES,
+        entry_format: str = None,
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entry_format = entry_format or default_entry_format()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+
+    def key(self, filename: str, options: dict) -> str:
+        digest = hashlib.sha256()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(2**20), b""):
+                digest.update(block)
+        versions = {"entry": ENTRY_VERSION, "pandas": pandas.__version__}
+        digest.update(
+            json.dumps([options, versions], sort_keys=True, default=str).encode()
+        )
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + SUFFIXES[self.entry_format])
+
+    def get(self, key: str) -> pandas.DataFrame:
+        path = self._path(key)
+        try:
+            if self.entry_format == PARQUET:
+                frame = pandas.read_parquet(path)
+            else:
+                frame = pandas.read_pickle(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except UNREADABLE_ENTRY_ERRORS as e:
+            # truncated, corrupt or written by other pandas or module versions:
+            # the file is parsed again
+            logging.warning(f"removing unreadable cache entry {path}: {e!r}")
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.misses += 1
+            return None
+        # mark as recently used for the eviction
+        os.utime(path)
+        self.hits += 1
+        return frame
+
+    def put(self, key: str, frame: pandas.DataFrame) -> None:
+        # the temporary file is per process, as parallel readers share the cache
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            if self.entry_format == PARQUET:
+                frame.to_parquet(tmp_path)
+            else:
+                frame.to_pickle(tmp_path)
+        except (TypeError, ValueError) as e:
+            # e.g. columns of mixed types parquet cannot store: not cached
+            logging.warning(f"not caching {key}: {e!r}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def _entries(self) -> list:
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(tuple(SUFFIXES.values())):
+                try:
+                    stat = os.stat(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    # evicted by another process meanwhile
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+        return sorted(entries)
+
+    def evict(self) -> None:
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            logging.debug(f"evicted {name} from cache {self.directory}")
+
+    def clear(self) -> None:
+        for _, _, name in self._entries():
+            os.remove(os.path.join(self.directory, name))
+        logging.info(f"cleared cache {self.directory}")
@@ -1,180 +1,592 @@
 """Console script for budget_envelopes."""
+import os
 import sys
-
-print(sys.path)
 import random
 import string
 import click
 import json
-from .plot import plot_month
-from .budget_reader import BudgetReader
-from .envelope_stats_calculator import EnvelopeStatsCalculator
-from .transactions_reader import TransactionsReader
+from . import profiling
+from .ingestion import IngestionError, read_files
 import logging
-import pandas
+from contextlib import contextmanager
 from datetime import datetime
 
+# pandas, matplotlib and the modules using them are imported only when needed,
+# keeping the startup of the cli (e.g. --help) fast
 
-logging.basicConfig(encoding="utf-8", level=logging.DEBUG)
 _current_month = str(datetime.today())[0:7]
 
+
+_input_options = [
+    click.option(
+        "--budgets",
+        "-b",
+        default=None,
+        help="Path to budgets csv file (fixed format)",
+        multiple=True,
+    ),
+    click.option(
+        "--transactions",
+        "-t",
+        default=None,
+        help="Path to file including transactions in either csv, json or ndjson/jsonl format. Json should be an array of objects, ndjson one object per line.",
+        multiple=True,
+    ),
+    click.option(
+        "--amount-field",
+        "-$",
+        help="The field which supplying the amount of the transactions",
+    ),
+    click.option(
+        "--date-field",
+        "-D",
+        multiple=True,
+        help="The field supplying the date of the transaction. Can be supplied multiple times in order of priority (e.g. transaction date, booking date)",
+    ),
+    click.option(
+        "--envelope-field",
+        "-E",
+        help="Field supplying the envelope (category) from which the money is drawn or put into. Must match categories in budgets-file",
+    ),
+    click.option(
+        "--debit-flag-field",
+        help="Field supplying the debit/credit flag. Also supply --debit-flag",
+    ),
+    click.option(
+        "--debit-flag",
+        help="Content of --debit-flag-field when transaction is a debit transaction. Otherwise credit transaction assumed.",
+    ),
+    click.option(
+        "--extraction-mode",
+        type=click.Choice(["rows", "columns"]),
+        default="columns",
+        help="How transactions are extracted from the input files: record by record ('rows') or with whole-column operations ('columns', faster on large files)",
+    ),
+    click.option(
+        "--chunksize",
+        type=int,
+        default=None,
+        help="Read transaction files in chunks of this many transactions, keeping only monthly sums per envelope in memory",
+    ),
+    click.option(
+        "--jobs",
+        "-j",
+        type=click.IntRange(min=1),
+        default=1,
+        help="Number of worker processes reading the budget and transaction files in parallel. The results are the same as reading them one after another.",
+    ),
+    click.option(
+        "--stats-engine",
+        type=click.Choice(["groupby", "matrix"]),
+        default="matrix",
+        help="How the monthly envelope states are calculated: per envelope group ('groupby') or for all envelopes at once on envelope x month arrays ('matrix', faster with many envelopes)",
+    ),
+    click.option(
+        "--compact-dtypes",
+        is_flag=True,
+        help="Keep transactions and budgets in memory with categorical envelopes, small integer months and amounts in integer cents (less memory on large inputs)",
+    ),
+    click.option(
+        "--sparse-budgets",
+        is_flag=True,
+        help="Keep only the envelope-months in which a budget changes of each budget file read, the other months inherit the budget of the month before (fewer rows while the files are kept, e.g. with --watch). Unlike --compact-dtypes, which keeps all envelope-months in smaller dtypes; both can be combined",
+    ),
+    click.option(
+        "--first-month",
+        help="Supply from which month the transctions and budgets should be calculated forwards. The format is '2023-05'",
+    ),
+    click.option(
+        "--last-month",
+        help=f"Supply from which month the transctions and budgets should be calculated forwards. The format is '{_current_month}'."
+        + f" Default value is current Month ({_current_month})",
+        default=_current_month,
+    ),
+    click.option(
+        "--ledger",
+        default=None,
+        help="SQLite database keeping the budgets and transactions of all runs. The given files are added to it (files added before are not added twice) and the stats are calculated from everything stored in it.",
+    ),
+    click.option(
+        "--cache-dir",
+        default=None,
+        help="Directory of the cache of parsed transaction and budget files, stored as Parquet (as pickles without pyarrow, only use a directory no one else can write to). Default: ~/.cache/budget-envelopes",
+    ),
+    click.option(
+        "--cache-size",
+        type=int,
+        default=512,
+        help="Size cap of the cache in MB. Least recently used files are evicted first.",
+    ),
+    click.option(
+        "--no-cache",
+        is_flag=True,
+        help="Parse all files again, without reading from or writing to the cache",
+    ),
+    click.option(
+        "--clear-cache",
+        is_flag=True,
+        help="Remove all files from the cache before running",
+    ),
+    click.option(
+        "--verbose",
+        "-v",
+        is_flag=True,
+        help="Log debug messages",
+    ),
+    click.option(
+        "--session",
+        "-S",
+        help="When adding multiple files per CLI, use a session string that ties the calls together",
+    ),
+]
+
+
+def input_options(command):
+    # options of the budget and transaction files, shared by all commands
+    for option in reversed(_input_options):
+        command = option(command)
+    return command
+
+
+def load_inputs(
+    transactions,
+    budgets,
+    amount_field,
+    envelope_field,
+    date_field,
+    debit_flag_field=None,
+    debit_flag=None,
+    session=None,
+    first_month=None,
+    last_month=None,
+    extraction_mode="columns",
+    chunksize=None,
+    stats_engine="matrix",
+    snapshot_file=None,
+    cache_dir=None,
+    cache_size=512,
+    no_cache=False,
+    clear_cache=False,
+    jobs=1,
+    preaggregate=False,
+    compact_dtypes=False,
+    sparse_budgets=False,
+) -> dict:
+    # the budget and transaction files read (filename -> reader), with the
+    # EnvelopeStatsCalculator arguments, the TransactionsReader and BudgetReader
+    # arguments used for the files (the chunksize separately) and the cache
+    from .budget_reader import BudgetReader
+    from .cache import DEFAULT_CACHE_DIR, ParsedFileCache
+    from .transactions_reader import TransactionsReader
+
+    if session is None:
+        session = "".join(random.choices(string.ascii_uppercase + string.digits, k=15))
+        # logging.info(session)
+
+    calculator_options = dict(
+        first_month=first_month,
+        last_month=last_month,
+        engine=stats_engine,
+        snapshot_file=snapshot_file,
+        preaggregate=preaggregate,
+        compact_dtypes=compact_dtypes,
+    )
+
+    cache = None
+    if not no_cache:
+        cache = ParsedFileCache(cache_dir or DEFAULT_CACHE_DIR, cache_size * 1024**2)
+        if clear_cache:
+            cache.clear()
+
+    reader_options = dict(
+        amount_field=amount_field,
+        date_field=date_field,
+        envelope_field=envelope_field,
+        debit_flag_field=debit_flag_field,
+        debit_flag=debit_flag,
+        session=session,
+        extraction_mode=extraction_mode,
+        compact_dtypes=compact_dtypes,
+    )
+    budget_options = dict(compact_dtypes=compact_dtypes, sparse_budgets=sparse_budgets)
+    # budget and transaction files are read in one go, possibly in parallel
+    tasks = [
+        (BudgetReader, dict(filename=bfile, cache=cache, **budget_options))
+        for bfile in budgets
+    ]
+    for f in transactions:
+        tasks.append(
+            (
+                TransactionsReader,
+                dict(filename=f, chunksize=chunksize, cache=cache, **reader_options),
+            )
+        )
+    try:
+        # with jobs > 1, the stages within the readers run in the worker processes
+        # and are not recorded
+        with profiling.stage("read_files", jobs=jobs) as record:
+            readers = read_files(tasks, jobs)
+            record["files"] = len(readers)
+    except IngestionError as e:
+        raise click.ClickException(str(e))
+
+    return dict(
+        calculator_options=calculator_options,
+        reader_options=reader_options,
+        budget_options=budget_options,
+        chunksize=chunksize,
+        budgets=dict(zip(budgets, readers[: len(budgets)])),
+        transactions=dict(zip(transactions, readers[len(budgets) :])),
+        cache=cache,
+    )
+
+
+def load_calculator(ledger=None, **input_kwargs):
+    # EnvelopeStatsCalculator with all budget and transaction files added, and the
+    # TransactionsReader arguments used for the transaction files
+    from .envelope_stats_calculator import EnvelopeStatsCalculator
+
+    inputs = load_inputs(**input_kwargs)
+    esc = EnvelopeStatsCalculator(**inputs["calculator_options"])
+    if ledger is not None:
+        from .ledger import Ledger
+
+        # the ledger stays open, the calculator reads the budgets from it lazily
+        store = Ledger(ledger)
+        for budgetreader in inputs["budgets"].values():
+            store.add_budgets(budgetreader)
+        for reader in inputs["transactions"].values():
+            store.add_transactions(reader)
+        esc.add_ledger(store)
+        return esc, inputs["reader_options"]
+
+    for budgetreader in inputs["budgets"].values():
+        esc.add_budgets(budgetreader)
+    for reader in inputs["transactions"].values():
+        esc.add_transactions(reader)
+    return esc, inputs["reader_options"]
+
+
+def _setup_logging(verbose: bool) -> None:
+    logging.basicConfig(
+        encoding="utf-8", level=logging.DEBUG if verbose else logging.INFO
+    )
+
+
+class DefaultCommandGroup(click.Group):
+    # runs the default command when the first argument is not a command, so
+    # `budget-envelopes -b ... -t ...` keeps working next to `budget-envelopes serve`
+    default_command = "run"
+
+    def parse_args(self, ctx, args):
+        if not args or args[0] not in self.commands:
+            if not (args and args[0] in ctx.help_option_names):
+                args = [self.default_command] + list(args)
+        return super().parse_args(ctx, args)
+
+
 @click.command()
+@input_options
 @click.option(
-    "--budgets",
-    "-b",
-    default=None,
-    help="Path to budgets csv file (fixed format)",
-    multiple=True,
+    "--preaggregate",
+    is_flag=True,
+    help="Sum up the transactions of each file per envelope and month right after reading it, keeping less in memory",
 )
 @click.option(
-    "--transactions",
-    "-t",
+    "--envelope",
+    "-e",
     default=None,
-    help="Path to file including transactions in either csv or json format. Json should be an array of objects.",
-    multiple=True,
-)
-@click.option(
-    "--amount-field",
-    "-$",
-    help="The field which supplying the amount of the transactions",
+    help="Only calculate and store the stats of this envelope and its sub-envelopes (e.g. 'Car' for Car, Car:Gas, ...)",
 )
 @click.option(
-    "--date-field",
-    "-D",
-    multiple=True,
-    help="The field supplying the date of the transaction. Can be supplied multiple times in order of priority (e.g. transaction date, booking date)",
+    "--snapshot-file",
+    default=None,
+    help="Json file storing the envelope states at the end of the closed months (all months before --last-month). Later runs only needing the months after them (without -x, writing only the current state) continue from it as long as the inputs of the closed months are unchanged. These are not checked again while the input files are unchanged.",
 )
 @click.option(
-    "--envelope-field",
-    "-E",
-    help="Field supplying the envelope (category) from which the money is drawn or put into. Must match categories in budgets-file",
+    "--output-file",
+    "-o",
+    default="data/envelope-stats.json",
+    help="Output file name for .json file",
 )
 @click.option(
-    "--debit-flag-field",
-    help="Field supplying the debit/credit flag. Also supply --debit-flag",
+    "--output-format",
+    type=click.Choice(["csv", "parquet"]),
+    default="csv",
+    help="Format of the history and aggregation files stored with --extra-files. With 'parquet' (needs pyarrow), the current state is additionally stored as envelope-stats.parquet",
 )
 @click.option(
-    "--debit-flag",
-    help="Content of --debit-flag-field when transaction is a debit transaction. Otherwise credit transaction assumed.",
+    "--extra-files",
+    "-x",
+    is_flag=True,
+    help="Stores multiple extra files along the envelope-stats.json:\n"
+    + "envelope-stats-history.json: Monthly development history of the envelopes"
+    + "envelope-stats-aggregated.json: Yearly aggregation of the envelopes"
+    + "envelope-stats.png: A somewhat weird plot of the current state.",
 )
 @click.option(
-    "--first-month",
-    help="Supply from which month the transctions and budgets should be calculated forwards. The format is '2023-05'",
+    "--watch",
+    "-w",
+    default=None,
+    type=click.Path(exists=True, file_okay=False),
+    help="Keep running and watch this directory for new and changed budget and transaction files (told apart by their header). New transactions only update the envelopes and months they touch, and the output files are rewritten atomically.",
 )
 @click.option(
-    "--last-month",
-    help=f"Supply from which month the transctions and budgets should be calculated forwards. The format is '{_current_month}'." +
-    f" Default value is current Month ({_current_month})",
-    default=_current_month
+    "--debounce",
+    type=float,
+    default=2.0,
+    help="With --watch, seconds without further file changes before the stats are updated, so a burst of files triggers one update",
 )
 @click.option(
-    "--output-file",
-    "-o",
-    default="data/envelope-stats.json",
-    help="Output file name for .json file",
+    "--profile",
+    is_flag=False,
+    flag_value="envelope-stats-profile.json",
+    default=None,
+    help="Write wall time, cpu time, peak memory and row counts of each stage (reading, extraction, adding, stats, writing, plotting) as json to this file. The memory is traced with tracemalloc, which slows the run down. Default file: envelope-stats-profile.json",
 )
 @click.option(
-    "--extra-files",
-    "-x",
+    "--cprofile",
     is_flag=True,
-    help = 'Stores multiple extra files along the envelope-stats.json:\n' +
-    'envelope-stats-history.json: Monthly development history of the envelopes' + 
-    'envelope-stats-aggregated.json: Yearly aggregation of the envelopes' +
-    'envelope-stats.png: A somewhat weird plot of the current state.' 
-)
-@click.option(
-    "--session",
-    "-S",
-    help="When adding multiple files per CLI, use a session string that ties the calls together",
+    help="With --profile, additionally dump cProfile stats of the whole run next to the profile (.prof)",
 )
 def main_cli(
-    transactions,
-    budgets,
-    amount_field,
-    envelope_field,
-    date_field,
     output_file,
-    debit_flag_field=None,
-    debit_flag=None,
-    session=None,
-    first_month=None,
-    last_month=None,
-    extra_files=False
+    extra_files=False,
+    output_format="csv",
+    envelope=None,
+    watch=None,
+    debounce=2.0,
+    verbose=False,
+    profile=None,
+    cprofile=False,
+    **input_kwargs,
 ):
     """Console script for budget_envelopes."""
+    _setup_logging(verbose)
+    if profile is not None:
+        profiling.enable(cprofile)
+        # written also if the run fails
+        click.get_current_context().call_on_close(
+            lambda: profiling.disable().write(profile)
+        )
+
     click.echo(
         "Replace this message by putting your code into " "budget_envelopes.cli.main"
     )
 
-    if session is None:
-        session = "".join(random.choices(string.ascii_uppercase + string.digits, k=15))
-        #logging.info(session)
+    if watch is not None:
+        if envelope is not None:
+            raise click.UsageError("--envelope cannot be combined with --watch")
+        watch_directory(
+            watch, debounce, output_file, extra_files, output_format, **input_kwargs
+        )
+        return
 
-    esc = EnvelopeStatsCalculator(first_month=first_month, last_month=last_month)
+    esc, _ = load_calculator(**input_kwargs)
+    last_month = input_kwargs["last_month"]
+    if extra_files:
+        # the history of all months is stored
+        stats = esc.get_envelope_stats(envelopes=envelope)
+    else:
+        stats = esc.get_envelope_stats(
+            envelopes=envelope, months=(last_month, last_month)
+        )
+    write_outputs(
+        output_file,
+        stats,
+        last_month,
+        extra_files,
+        output_format,
+        input_kwargs["jobs"],
+    )
 
-    for bfile in budgets:
-        budgetreader = BudgetReader(filename=bfile)
-        esc.add_budgets(budgetreader)
 
-    for f in transactions:
-        reader = TransactionsReader(
-            filename=f,
-            amount_field=amount_field,
-            date_field=date_field,
-            envelope_field=envelope_field,
-            debit_flag_field=debit_flag_field,
-            debit_flag=debit_flag,
-            session=session,
+def watch_directory(
+    directory, debounce, output_file, extra_files, output_format, **input_kwargs
+):
+    # the files in the directory are read along the given ones, then the outputs
+    # are updated each time files are added or changed, until interrupted
+    from .watch import DirectoryWatcher, WatchedInputs, is_budget_file
+
+    if input_kwargs.pop("ledger", None) is not None:
+        raise click.UsageError("--ledger cannot be combined with --watch")
+
+    watcher = DirectoryWatcher(directory, debounce)
+    files, _ = watcher.scan()
+    input_kwargs["budgets"] = list(input_kwargs["budgets"]) + [
+        f for f in files if is_budget_file(f)
+    ]
+    input_kwargs["transactions"] = list(input_kwargs["transactions"]) + [
+        f for f in files if not is_budget_file(f)
+    ]
+    inputs = WatchedInputs(**load_inputs(**input_kwargs), jobs=input_kwargs["jobs"])
+
+    def write(stats):
+        write_outputs(
+            output_file,
+            stats,
+            input_kwargs["last_month"],
+            extra_files,
+            output_format,
+            input_kwargs["jobs"],
         )
 
-        esc.add_transactions(reader)
+    if inputs.service is not None:
+        write(inputs.service.stats)
+    logging.info(f"watching {directory} for new and changed files")
+    try:
+        while True:
+            changed, removed = watcher.wait()
+            logging.info(f"{len(changed)} files changed, {len(removed)} removed")
+            if inputs.update(changed, removed):
+                write(inputs.service.stats)
+    except KeyboardInterrupt:
+        pass
 
-    ## write output files
-    stats = esc.get_envelope_stats()
-    stats_json = stats.query(f"month == '{last_month}'").reset_index().to_dict("records")
 
-    if extra_files == True:
+def write_outputs(
+    output_file, stats, last_month, extra_files=False, output_format="csv", jobs=1
+):
+    stats_json = (
+        stats.query(f"month == '{last_month}'").reset_index().to_dict("records")
+    )
+
+    with profiling.stage("write_output", format=output_format) as record:
+        # the current state is always written, the history with the extra files
         write_json_current_state(output_file, stats_json)
-        write_history_and_aggregation_csvs(output_file, stats)    
-        make_plot(output_file, last_month)
+        if extra_files:
+            write_history_and_aggregation(output_file, stats, output_format)
+            if output_format == "parquet":
+                from .parquet import write_parquet
+
+                with atomic_output(output_file.replace(".json", ".parquet")) as tmp:
+                    write_parquet(
+                        stats.query(f"month == '{last_month}'").reset_index(), tmp
+                    )
+        record["rows"] = stats.shape[0]
+    if extra_files:
+        with profiling.stage("plot", jobs=jobs) as record:
+            record["plots"] = len(make_plot(output_file, stats, last_month, jobs))
+
+
+@click.command()
+@input_options
+@click.option(
+    "--host",
+    default="127.0.0.1",
+    help="Address the server listens on",
+)
+@click.option(
+    "--port",
+    type=int,
+    default=8080,
+    help="Port the server listens on",
+)
+def serve_cli(host, port, verbose=False, **input_kwargs):
+    """Answer envelope queries over http/json from the stats kept in memory.
+
+    GET /state, /envelopes, /envelopes/<envelope>/history and /months/<YYYY-MM>;
+    POST /transactions with a json array of transactions in the fields given
+    by the options.
+    """
+    _setup_logging(verbose)
+    from .server import EnvelopeService, make_server
+
+    # posted transactions are summed up per envelope and month on arrival
+    esc, reader_options = load_calculator(preaggregate=True, **input_kwargs)
+    server = make_server(EnvelopeService(esc, reader_options), host, port)
+    logging.info(f"serving envelope stats on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+cli = DefaultCommandGroup(
+    commands={"run": main_cli, "serve": serve_cli},
+    help="Envelope budgeting: run calculates the envelope stats files (default), serve answers queries over http.",
+)
+
+
+def aggregate_yearly(stats):
+    return (
+        stats.reset_index()
+        .assign(year=lambda df: df.month.str[:4])
+        .groupby(["envelope", "year"])
+        .agg({"budget": "sum", "adjustment": "sum", "state": "last"})
+        .sort_values(["year", "envelope"])
+    )
+
+
+@contextmanager
+def atomic_output(filename):
+    # yields a temporary file name, renamed to filename once written, so readers
+    # of the output never see a half-written file
+    tmp = f"{filename}.tmp"
+    yield tmp
+    os.replace(tmp, filename)
+
 
 def write_history_and_aggregation_csvs(output_file, stats):
-    
     # aggregation csv
-    stats.reset_index().to_csv(output_file.replace(".json", "-history-monthly.csv"))
+    with atomic_output(output_file.replace(".json", "-history-monthly.csv")) as tmp:
+        stats.reset_index().to_csv(tmp)
+    with atomic_output(output_file.replace(".json", "-aggregated.csv")) as tmp:
+        aggregate_yearly(stats).to_csv(tmp)
+
+
+def write_history_and_aggregation_parquet(output_file, stats):
+    from .parquet import write_parquet
+
+    with atomic_output(output_file.replace(".json", "-history-monthly.parquet")) as tmp:
+        write_parquet(stats.reset_index(), tmp)
+    with atomic_output(output_file.replace(".json", "-aggregated.parquet")) as tmp:
+        write_parquet(aggregate_yearly(stats), tmp)
+
+
+def write_history_and_aggregation(output_file, stats, output_format="csv"):
+    if output_format == "parquet":
+        write_history_and_aggregation_parquet(output_file, stats)
+    else:
+        write_history_and_aggregation_csvs(output_file, stats)
 
-    stats.reset_index().assign(year=lambda df: df.month.str[:4])\
-        .groupby(['envelope','year']).agg({
-        'budget': sum,
-        'adjustment': sum,
-        'state': 'last'
-    })\
-    .sort_values(['year','envelope']).to_csv(output_file.replace(".json", "-aggregated.csv"))
 
 def write_json_current_state(output_file, stats_json):
-    with open(output_file, "w") as o:
+    with atomic_output(output_file) as tmp, open(tmp, "w") as o:
         json.dump(stats_json, o, indent=4)
         logging.info(
             f"envelope stats of {len(stats_json)} envelopes written to file {output_file}"
         )
 
 
-def make_plot(output_file, last_month):
+def make_plot(output_file, stats, last_month, jobs=1):
+    from .plot import plot_months
+
     logging.getLogger("matplotlib").setLevel(logging.ERROR)
     logging.getLogger("PIL").setLevel(logging.ERROR)
 
-    envelopes = pandas.read_json(output_file).sort_values("envelope", ascending=False)
-    envelopes_currentmonth = envelopes.loc[envelopes.month == last_month]
-    logging.debug("Plotting month " + envelopes_currentmonth.month.unique())
-    plot_month(envelopes_currentmonth, output_file.replace(".json", ".png"))
-
+    envelopes = stats.reset_index().sort_values("envelope", ascending=False)
+    # output file -> envelopes of the month plotted into it
+    plots = {
+        output_file.replace(".json", ".png"): envelopes.loc[
+            envelopes.month == last_month
+        ]
+    }
     for month in envelopes.loc[envelopes.month != envelopes.month.max()].month.unique():
-        plotfilename = output_file.replace(".json", f"-{month}.png")
-        plot_month(envelopes.loc[envelopes.month == month], plotfilename)
-        logging.info(
-            f"envelope stats for month {month} envelopes written to file {plotfilename}"
-        )
+        plots[output_file.replace(".json", f"-{month}.png")] = envelopes.loc[
+            envelopes.month == month
+        ]
+
+    # months unchanged since the last run are not plotted again
+    rendered = plot_months(
+        plots, jobs=jobs, manifest_file=output_file.replace(".json", "-plots.json")
+    )
+    for plotfilename in rendered:
+        logging.info(f"envelope stats plot written to file {plotfilename}")
+    return rendered
 
 
 if __name__ == "__main__":
-    sys.exit(main_cli())  # pragma: no cover
+    sys.exit(cli())  # pragma: no cover
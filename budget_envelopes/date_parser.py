@@ -0,0 +1,107 @@
+"""Date parsing: bulk parsing of date fields with a format inferred per field."""
+import datetime
+import functools
+import logging
+
+import dateutil.parser as dateparser
+import pandas
+
+SAMPLE_SIZE = 100
+
+# Only formats which are read the same way by dateutil (month before day) are
+# candidates, so values that do not match fall back to dateutil consistently.
+CANDIDATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%dT%H:%M",
+    "%Y/%m/%d",
+    "%m/%d/%Y",
+    "%m/%d/%Y %H:%M",
+    "%m/%d/%Y %H:%M:%S",
+]
+
+
+@functools.lru_cache(maxsize=2**16)
+def parse_date(value: str) -> datetime.date:
+    # slow path: let dateutil figure out the format, memoized per date string.
+    # Typed dates (e.g. from parquet files) are taken as they are.
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return dateparser.parse(value).date()
+
+
+def infer_date_format(values: pandas.Series, sample_size: int = SAMPLE_SIZE):
+    # the candidate format that reads most of the sampled values, each of them as
+    # dateutil does. Values in other formats are left to the slow path.
+    sample = values.dropna().head(sample_size).unique()
+    best_format, best_count = None, 0
+    for dateformat in CANDIDATE_FORMATS:
+        count = 0
+        for v in sample:
+            try:
+                parsed = datetime.datetime.strptime(v, dateformat).date()
+            except (ValueError, TypeError):
+                continue
+            if parsed != parse_date(v):
+                break
+            count += 1
+        else:
+            if count > best_count:
+                best_format, best_count = dateformat, count
+    return best_format
+
+
+class DateParser(object):
+    """
+    Parses date fields column-wise with a format inferred per field.
+    Args:
+        sample_size (int): number of values the format of a field is inferred from
+    Attributes:
+        formats (dict): inferred format per field, None if no candidate format fits
+        slow_path_count (int): number of values parsed by dateutil instead
+    """
+
+    def __init__(self, sample_size: int = SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.formats = {}
+        self.slow_path_count = 0
+
+    def parse(self, field: str, values: pandas.Series) -> pandas.Series:
+        # parse non-empty values of a date field into datetime.date objects
+        if pandas.api.types.is_datetime64_any_dtype(values):
+            return values.dt.date
+        if field not in self.formats:
+            self.formats[field] = infer_date_format(values, self.sample_size)
+            logging.debug(f"date field '{field}' has format {self.formats[field]}")
+
+        # every distinct date string only needs to be parsed once
+        uniques = values.drop_duplicates()
+        parsed = pandas.Series(None, index=uniques.index, dtype=object)
+        matched = pandas.Series(False, index=uniques.index)
+        if self.formats[field] is not None:
+            bulk = pandas.to_datetime(
+                uniques, format=self.formats[field], errors="coerce"
+            )
+            matched = bulk.notna()
+            parsed.loc[matched] = bulk.loc[matched].dt.date
+
+        slow = uniques.loc[~matched]
+        parsed.loc[slow.index] = slow.map(parse_date)
+        self.slow_path_count += int(values.isin(slow).sum())
+
+        return values.map(pandas.Series(parsed.values, index=uniques.values))
+
+    def coalesce(self, source: pandas.DataFrame, date_fields: list) -> pandas.Series:
+        # the first non-empty date field in order of priority wins
+        dates = pandas.Series(None, index=source.index, dtype=object)
+        for date in date_fields:
+            if date not in source:
+                continue
+            values = source[date].loc[dates.isna() & source[date].notna()]
+            if values.shape[0] > 0:
+                dates.loc[values.index] = self.parse(date, values)
+        return dates
@@ -0,0 +1,159 @@
+"""Compact dtypes of the large frames: envelopes as categoricals of an envelope
+dictionary, month codes as int16 and amounts as int64 cents.
+
+The compact frames name the amount column AMOUNT_CENTS, so they are not
+mistaken for frames with float amounts. expand_statements and expand_budgets
+turn them back into the plain representation.
+"""
+import numpy
+import pandas
+
+AMOUNT_CENTS = "amount_cents"
+# month codes up to year 2730 (see months.py)
+MONTH_DTYPE = "int16"
+
+
+class EnvelopeDictionary(object):
+    """
+    Envelope names and their codes, shared by the compact frames of a
+    calculator, so categoricals of different files have the same categories and
+    are merged without converting them back to strings. Names only ever get
+    added, the categories of earlier frames are a prefix of the current ones,
+    so a dictionary lives only as long as the frames encoded with it.
+    Attributes:
+        names (pandas.Index): the envelope names, in the order they were added
+    """
+
+    def __init__(self):
+        self.names = pandas.Index([], dtype=object)
+        self._dtype = pandas.CategoricalDtype(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, names) -> None:
+        new = pandas.Index(names, dtype=object).unique().difference(self.names)
+        if len(new) > 0:
+            self.names = self.names.append(new)
+            self._dtype = pandas.CategoricalDtype(self.names)
+
+    def encode(self, envelopes, na_value: str = None) -> pandas.Series:
+        # envelopes (strings or categoricals of any categories) as categorical of
+        # all names. Missing envelopes become na_value, if given.
+        envelopes = pandas.Series(envelopes)
+        if isinstance(envelopes.dtype, pandas.CategoricalDtype):
+            if envelopes.dtype == self._dtype:
+                codes, names = envelopes.cat.codes.to_numpy(), None
+            else:
+                codes = envelopes.cat.codes.to_numpy()
+                names = envelopes.cat.categories
+        else:
+            codes, names = pandas.factorize(envelopes.to_numpy(dtype=object))
+            names = pandas.Index(names, dtype=object)
+        if na_value is not None and (codes < 0).any():
+            names = self.names if names is None else names
+            names = names.append(pandas.Index([na_value]))
+            codes = numpy.where(codes < 0, len(names) - 1, codes)
+        if names is not None:
+            # recode to the codes of the dictionary
+            self.add(names)
+            mapping = self.names.get_indexer(names)
+            codes = numpy.where(codes < 0, -1, mapping[codes])
+        return pandas.Series(
+            pandas.Categorical.from_codes(codes, dtype=self._dtype),
+            index=envelopes.index,
+            name=envelopes.name,
+        )
+
+
+def to_cents(amounts) -> numpy.ndarray:
+    return numpy.round(numpy.asarray(amounts, dtype=float) * 100).astype(numpy.int64)
+
+
+def from_cents(cents) -> numpy.ndarray:
+    return numpy.asarray(cents, dtype=numpy.int64) / 100
+
+
+def is_compact(frame: pandas.DataFrame) -> bool:
+    return AMOUNT_CENTS in frame
+
+
+def compact_statements(
+    statements: pandas.DataFrame, envelopes: EnvelopeDictionary = None
+) -> pandas.DataFrame:
+    # statements (envelope, date or month, amount) in compact dtypes. Dates are
+    # kept as datetime64 instead of date objects. The envelopes are encoded with
+    # the given dictionary, or with one of the names of these statements only.
+    if is_compact(statements):
+        return statements
+    if envelopes is None:
+        envelopes = EnvelopeDictionary()
+    compact = pandas.DataFrame(
+        {"envelope": envelopes.encode(statements.envelope).array},
+        index=statements.index,
+    )
+    if "date" in statements:
+        compact["date"] = pandas.to_datetime(statements.date).to_numpy()
+    if "month" in statements:
+        compact["month"] = statements.month.to_numpy().astype(MONTH_DTYPE)
+    compact[AMOUNT_CENTS] = to_cents(statements.amount)
+    return compact
+
+
+def expand_statements(statements: pandas.DataFrame) -> pandas.DataFrame:
+    # compact statements in the plain representation
+    if not is_compact(statements):
+        return statements
+    expanded = statements.drop(columns=[AMOUNT_CENTS]).assign(
+        envelope=statements.envelope.astype(object).to_numpy(),
+        amount=from_cents(statements[AMOUNT_CENTS]),
+    )
+    if "month" in expanded:
+        expanded["month"] = expanded.month.astype(int)
+    return expanded
+
+
+def compact_budgets(
+    budgets: pandas.DataFrame, envelopes: EnvelopeDictionary = None
+) -> pandas.DataFrame:
+    # budgets indexed by envelope and month in compact dtypes: the budget and
+    # adjustment in cents as nullable integers, missing values stay missing.
+    # The envelopes are encoded like in compact_statements.
+    if envelopes is None:
+        envelopes = EnvelopeDictionary()
+    index = pandas.MultiIndex.from_arrays(
+        [
+            pandas.CategoricalIndex(
+                envelopes.encode(budgets.index.get_level_values("envelope"))
+            ),
+            budgets.index.get_level_values("month").astype(MONTH_DTYPE),
+        ],
+        names=["envelope", "month"],
+    )
+    return pandas.DataFrame(
+        {
+            column: pandas.arrays.IntegerArray(
+                to_cents(budgets[column].fillna(0)), budgets[column].isna().to_numpy()
+            )
+            for column in budgets.columns
+        },
+        index=index,
+    )
+
+
+def expand_budgets(budgets: pandas.DataFrame) -> pandas.DataFrame:
+    # compact budgets in the plain representation (float amounts)
+    index = pandas.MultiIndex.from_arrays(
+        [
+            budgets.index.get_level_values("envelope").astype(object),
+            budgets.index.get_level_values("month").astype(int),
+        ],
+        names=["envelope", "month"],
+    )
+    return pandas.DataFrame(
+        {
+            column: budgets[column].to_numpy(dtype=float, na_value=numpy.nan) / 100
+            for column in budgets.columns
+        },
+        index=index,
+    )
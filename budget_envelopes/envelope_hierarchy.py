@@ -0,0 +1,121 @@
+"""Envelope hierarchy: rolls up values of leaf envelopes to all their parents."""
+import numpy
+import pandas
+
+ENVELOPE = "envelope"
+PARENT_ENVELOPE = "parent_envelope"
+LEVEL = "level"
+
+
+def envelope_lineage(envelope: str) -> list:
+    # the envelope itself followed by all its parents, e.g.
+    # 'Car:Gas' -> ['Car:Gas', 'Car', '']
+    hierarchy = str(envelope).split(":")
+    lineage = [envelope]
+    while len(hierarchy) > 0:
+        hierarchy.pop()
+        lineage.append(":".join(hierarchy))
+    return lineage
+
+
+class EnvelopeHierarchy(object):
+    """
+    Index of the envelope hierarchy, built once from the distinct envelope names.
+    Args:
+        envelopes (list): envelope names, e.g. ['Car:Gas', 'Household:Pets']
+    Attributes:
+        incidence (pandas.DataFrame): one row per envelope and each of its parents
+            (including itself), with the distance to the parent in 'level'
+        parents (pandas.Index): sorted names of all envelopes and their parents
+    """
+
+    def __init__(self, envelopes):
+        self.envelopes = pandas.unique(pandas.Series(list(envelopes), dtype=object))
+        lineages = pandas.Series(
+            [envelope_lineage(e) for e in self.envelopes], index=self.envelopes
+        )
+        self.incidence = (
+            lineages.explode()
+            .rename(PARENT_ENVELOPE)
+            .rename_axis(ENVELOPE)
+            .reset_index()
+        )
+        self.incidence[LEVEL] = self.incidence.groupby(ENVELOPE).cumcount()
+
+        # the incidence as arrays: the parents of the envelope at position i of
+        # envelopes are _parent_codes[_starts[i]:_starts[i] + _lengths[i]]
+        self.parents = pandas.Index(
+            self.incidence[PARENT_ENVELOPE].unique(), dtype=object
+        ).sort_values()
+        self._parent_codes = self.parents.get_indexer(self.incidence[PARENT_ENVELOPE])
+        self._lengths = lineages.str.len().to_numpy()
+        self._starts = numpy.concatenate([[0], self._lengths.cumsum()[:-1]])
+
+    def expand(self, frame: pandas.DataFrame) -> pandas.DataFrame:
+        # duplicate each row for every parent envelope, directly following the row
+        lineages = self.incidence.groupby(ENVELOPE, sort=False)[PARENT_ENVELOPE].agg(
+            list
+        )
+        return (
+            frame.assign(envelope=frame[ENVELOPE].map(lineages))
+            .explode(ENVELOPE)
+            .reset_index(drop=True)
+        )
+
+    def rollup(self, frame: pandas.DataFrame, min_count: int = 0) -> pandas.DataFrame:
+        # sum up the values of an (envelope, ...)-indexed frame to all parent
+        # envelopes. Same as a groupby sum(min_count=min_count) of the rows
+        # duplicated for each parent, but every row is scatter-added to the cells
+        # (parent, rest of the index) of its parents instead.
+        codes = pandas.Index(self.envelopes).get_indexer(
+            frame.index.get_level_values(0)
+        )
+        if (codes < 0).any():
+            raise ValueError("Envelopes missing in the hierarchy")
+
+        # the row and the parent of each (row, parent) pair
+        lengths = self._lengths[codes]
+        rows = numpy.repeat(numpy.arange(len(codes)), lengths)
+        offsets = numpy.arange(lengths.sum()) - numpy.repeat(
+            lengths.cumsum() - lengths, lengths
+        )
+        parent_codes = self._parent_codes[self._starts[codes][rows] + offsets]
+
+        # the cell of each pair, numbered in the sort order of the index
+        others = frame.index.droplevel(0) if frame.index.nlevels > 1 else None
+        if others is not None:
+            other_codes, others = others.factorize(sort=True)
+        else:
+            other_codes = numpy.zeros(len(codes), dtype=int)
+        n_others = 1 if others is None else len(others)
+        cells, cell_codes = numpy.unique(
+            parent_codes * n_others + other_codes[rows], return_inverse=True
+        )
+
+        values = {}
+        for column in frame.columns:
+            column_values = frame[column].to_numpy(dtype=float)[rows]
+            notna = ~numpy.isnan(column_values)
+            sums = numpy.bincount(
+                cell_codes,
+                weights=numpy.where(notna, column_values, 0),
+                minlength=len(cells),
+            )
+            counts = numpy.bincount(cell_codes, weights=notna, minlength=len(cells))
+            values[column] = numpy.where(counts >= min_count, sums, numpy.nan)
+            if min_count == 0 and pandas.api.types.is_integer_dtype(frame[column]):
+                values[column] = values[column].astype(frame[column].dtype)
+
+        parents = self.parents[cells // n_others]
+        if others is None:
+            index = pandas.Index(parents, name=frame.index.names[0])
+        else:
+            others = others[cells % n_others]
+            if not isinstance(others, pandas.MultiIndex):
+                others = pandas.MultiIndex.from_arrays([others])
+            index = pandas.MultiIndex.from_arrays(
+                [parents]
+                + [others.get_level_values(level) for level in range(others.nlevels)],
+                names=frame.index.names,
+            )
+        return pandas.DataFrame(values, index=index)
@@ -1,76 +1,240 @@
 from .transactions_reader import TransactionsReader
 from .budget_reader import BudgetReader
+from .dtypes import (
+    AMOUNT_CENTS,
+    MONTH_DTYPE,
+    EnvelopeDictionary,
+    compact_statements,
+    expand_statements,
+    from_cents,
+    to_cents,
+)
+from .envelope_hierarchy import EnvelopeHierarchy, envelope_lineage
+from .ledger import Ledger
+from .months import (
+    format_month,
+    format_months,
+    month_code,
+    month_codes_from_dates,
+    month_range,
+)
+from .profiling import stage
+from .snapshot import MonthCloseSnapshot, fingerprint_sources
 import logging
 import warnings
 
 # Suppress FutureWarning messages
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
+import numpy
 import pandas
 
 FIRST_MONTH = "first_month"
 LAST_MONTH = "last_month"
+ENGINE = "engine"
+SNAPSHOT_FILE = "snapshot_file"
+PREAGGREGATE = "preaggregate"
+COMPACT_DTYPES = "compact_dtypes"
+
+# engines computing the monthly states: one pandas group per envelope, or dense
+# envelope x month arrays for all envelopes at once
+GROUPBY = "groupby"
+MATRIX = "matrix"
+ENGINES = [GROUPBY, MATRIX]
+
+
+def _envelope_scope(envelopes):
+    # whether an envelope is requested: the subtree of an envelope (str) or the
+    # envelopes of a list. The subtree of '' are all envelopes.
+    if isinstance(envelopes, str):
+        root = envelopes
+        return lambda envelope: (
+            root == "" or envelope == root or envelope.startswith(root + ":")
+        )
+    requested = set(envelopes)
+    return lambda envelope: envelope in requested
+
+
+def _budgets_until(budgets: pandas.DataFrame, to_month: int) -> pandas.DataFrame:
+    # the budgets up to to_month. For envelopes only budgeted later, their first
+    # budget is kept as well, as it is propagated backwards to the earlier months.
+    months = budgets.index.get_level_values("month")
+    until = budgets.loc[months <= to_month]
+    later = budgets.loc[(months > to_month) & budgets.budget.notna().values]
+    budgeted = until.loc[until.budget.notna()].index.get_level_values("envelope")
+    first_later = (
+        later.loc[~later.index.get_level_values("envelope").isin(budgeted)]
+        .sort_index()
+        .groupby(level="envelope")
+        .head(1)
+    )
+    return pandas.concat([until, first_later.assign(adjustment=numpy.nan)]).sort_index()
 
 
 class EnvelopeStatsCalculator(object):
     def __init__(self, *args, **kwargs) -> None:
-        if FIRST_MONTH in kwargs:
-            self._first_month = kwargs[FIRST_MONTH]
-        if LAST_MONTH in kwargs:
-            self._last_month = kwargs[LAST_MONTH]            
+        # months are kept as month codes internally, see months.py
+        self._first_month = None
+        self._last_month = None
+        if kwargs.get(FIRST_MONTH) is not None:
+            self._first_month = month_code(kwargs[FIRST_MONTH])
+        if kwargs.get(LAST_MONTH) is not None:
+            self._last_month = month_code(kwargs[LAST_MONTH])
+        self._engine = kwargs.get(ENGINE) or GROUPBY
+        if self._engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{self._engine}'. Use one of {ENGINES}")
+        # closed months are loaded from and stored to the snapshot, if given
+        self._snapshot = None
+        if kwargs.get(SNAPSHOT_FILE):
+            self._snapshot = MonthCloseSnapshot(kwargs[SNAPSHOT_FILE])
+        # inputs are only registered when added, and merged once when needed
+        self._preaggregate = bool(kwargs.get(PREAGGREGATE))
+        # transactions kept as categorical envelopes, int16 months and int64 cents
+        self._compact_dtypes = bool(kwargs.get(COMPACT_DTYPES))
+        # the envelopes of the compact transactions, only of this calculator
+        self._envelopes = EnvelopeDictionary()
+        self._budget_inputs = []
+        self._transaction_inputs = []
+        self._transaction_count = 0
         self._budget_months = None
         self._transactions = None
         self.stats = None
-        self.budgets = None
+        self._budgets = None
         self._processed_budgets = []
-        logging.debug(self._first_month + '  ' + self._last_month)
+        # (filename, parse options) of the inputs, see fingerprint_sources
+        self._sources = []
+        logging.debug(f"{kwargs.get(FIRST_MONTH)}  {kwargs.get(LAST_MONTH)}")
 
-    def add_budgets(self, budgetreader: BudgetReader):
-        print(f"adding budgets {budgetreader.budgets_filename}")
-        if budgetreader.budgets_filename in self._processed_budgets:
-            logging.debug("not allowing reading same file twice")
-            return
-        if self.budgets is None:
-            self.budgets = budgetreader.budgets
-        else:
-            self.budgets = (
-                pandas.concat([self.budgets, budgetreader.budgets])
-                .groupby(["envelope", "month"])
-                .sum(min_count=1)
+    @property
+    def budgets(self) -> pandas.DataFrame:
+        # the budgets added so far, with formatted 'YYYY-MM' months
+        self._merge_inputs()
+        if self._budgets is None:
+            return None
+        return self._budgets.set_axis(
+            self._budgets.index.set_levels(
+                format_months(self._budgets.index.levels[1]), level="month"
             )
-            # print(self.budgets)
-        self._processed_budgets.append(budgetreader.budgets_filename)
+        )
 
-    def add_transactions(self, transactions: TransactionsReader):
-        new_statements = transactions.get_statements()
+    @property
+    def last_month(self) -> str:
+        # the last month of the stats, formatted 'YYYY-MM'. Without a last month
+        # given, it is the current month once the stats are calculated.
+        if self._last_month is None:
+            return None
+        return format_month(self._last_month)
 
-        new_statements.envelope = new_statements.envelope.fillna("NOT SET")
-        new_statements["month"] = new_statements["date"].apply(
-            lambda d: f"{d.year}-{d.month:02d}"
-        )
+    def add_budgets(self, budgetreader: BudgetReader):
+        with stage("add_budgets", filename=budgetreader.budgets_filename) as record:
+            record["rows"] = len(budgetreader.budgets)
+            print(f"adding budgets {budgetreader.budgets_filename}")
+            if budgetreader.budgets_filename in self._processed_budgets:
+                logging.debug("not allowing reading same file twice")
+                return
+            self._budget_inputs.append(budgetreader)
+            self._processed_budgets.append(budgetreader.budgets_filename)
+            self._sources.append((budgetreader.budgets_filename, None))
 
-        if self._transactions is None:
-            self._transactions = new_statements
-        else:
-            self._transactions = pandas.concat([self._transactions, new_statements])
+    def add_ledger(self, ledger: Ledger):
+        # budgets and transactions stored in a ledger, the transactions summed up
+        # per envelope and month by the database, only from the first month on
+        with stage("add_ledger", filename=ledger.filename) as record:
+            self._budget_inputs.append(ledger)
+            statements = ledger.monthly_statements(first_month=self._first_month)
+            record["rows"] = statements.shape[0]
+        self.add_statements(statements, source=(ledger.filename, None))
 
-        logging.info(
-            f"added {new_statements.shape[0]} transactions. Now containing a total of {self._transactions.shape[0]}"
+    def add_transactions(self, transactions: TransactionsReader):
+        self.add_statements(
+            transactions.get_leaf_statements(),
+            source=(transactions.filename, transactions.parse_options()),
         )
 
+    def add_statements(self, new_statements: pandas.DataFrame, source: tuple = None):
+        # leaf statements as returned by TransactionsReader.get_leaf_statements,
+        # source is the (filename, parse options) they were read from, if any
+        self._sources.append(source or (None, None))
+        with stage("add_transactions") as record:
+            # parent envelopes are rolled up after aggregation in get_envelope_stats
+            # (columns are set on a shallow copy, the reader's statements stay as read)
+            new_statements = new_statements.copy(deep=False)
+            if self._compact_dtypes:
+                new_statements = compact_statements(new_statements, self._envelopes)
+                new_statements.envelope = self._envelopes.encode(
+                    new_statements.envelope, na_value="NOT SET"
+                )
+            else:
+                new_statements = expand_statements(new_statements)
+                new_statements.envelope = new_statements.envelope.fillna("NOT SET")
+            if "month" not in new_statements:
+                # streaming readers deliver statements already summed up per month
+                new_statements["month"] = month_codes_from_dates(new_statements["date"])
+            amount = "amount"
+            if self._compact_dtypes:
+                # the dates are not needed any more
+                amount = AMOUNT_CENTS
+                new_statements = new_statements[["envelope", "month", amount]].astype(
+                    {"month": MONTH_DTYPE}
+                )
+            if self._preaggregate:
+                new_statements = new_statements.groupby(
+                    ["envelope", "month"], as_index=False, observed=True
+                ).agg({amount: "sum"})
+
+            self._transaction_inputs.append(new_statements)
+            self._transaction_count += new_statements.shape[0]
+            record["rows"] = new_statements.shape[0]
+            logging.info(
+                f"added {new_statements.shape[0]} transactions. Now containing a total of {self._transaction_count}"
+            )
+
+    def _merge_inputs(self) -> None:
+        # merge the inputs registered since the last merge with all before
+        if len(self._budget_inputs) + len(self._transaction_inputs) == 0:
+            return
+        with stage("merge_inputs"):
+            if len(self._budget_inputs) > 0:
+                budgets = [reader.get_budgets() for reader in self._budget_inputs]
+                if self._budgets is not None:
+                    budgets.insert(0, self._budgets)
+                if len(budgets) == 1:
+                    self._budgets = budgets[0]
+                else:
+                    self._budgets = (
+                        pandas.concat(budgets)
+                        .groupby(["envelope", "month"])
+                        .sum(min_count=1)
+                    )
+                self._budget_inputs = []
+
+            if len(self._transaction_inputs) > 0:
+                transactions = self._transaction_inputs
+                if self._transactions is not None:
+                    transactions.insert(0, self._transactions)
+                if self._compact_dtypes:
+                    # categoricals of the envelopes known so far, the categories of
+                    # all must be the same to stay categorical when concatenated
+                    transactions = [
+                        frame.assign(envelope=self._envelopes.encode(frame.envelope))
+                        for frame in transactions
+                    ]
+                self._transactions = pandas.concat(transactions)
+                self._transaction_inputs = []
+
     def _propagate_budgets(self, gdf):
         gdf.budget = gdf.budget.ffill().bfill()
         return gdf.fillna(0)
 
-    def _calc_monthly_states(self, gdf):
-        gdf = self._verify_all_months_in_data(gdf)
+    def _calc_monthly_states(self, gdf, budget_months: numpy.ndarray = None):
+        gdf = self._verify_all_months_in_data(gdf, budget_months)
 
         gdf = self._propagate_budgets(gdf)
 
         gdf = self._apply_adjustments(gdf)
 
-        gdf = gdf.query(f'month >= "{self._first_month}"')
-        #gdf = gdf.query(f'month <= "{self._last_month}"')
+        gdf = gdf.query(f"month >= {self._first_month}")
+        # gdf = gdf.query(f"month <= {self._last_month}")
         gdf.loc[:, "difference"] = gdf.budget - gdf.amount
         gdf.loc[:, "cumsum"] = gdf.difference.cumsum()
         gdf.loc[:, "carryover"] = gdf.difference.shift(1).cumsum()
@@ -84,40 +248,69 @@ class EnvelopeStatsCalculator(object):
 
         return gdf
 
-    def _verify_all_months_in_data(self, gdf):
-        for v in self._budget_months:
-            if v not in gdf.month.values:
-                r = gdf.iloc[-1]
-                r.month = v
-                r.amount = pandas.NA
-                r.adjustment = pandas.NA
-                r.budget = pandas.NA
-                gdf = pandas.concat([gdf, r.to_frame().T])
-                gdf = gdf.sort_values("month")
-        return gdf
+    def _verify_all_months_in_data(self, gdf, budget_months: numpy.ndarray = None):
+        # add empty rows for the months of the calendar the envelope has no data for
+        if budget_months is None:
+            budget_months = self._budget_months
+        calendar = numpy.union1d(gdf.month.values, budget_months)
+        if len(calendar) == gdf.shape[0]:
+            return gdf
+        return (
+            gdf.set_index("month")
+            .reindex(calendar)
+            .rename_axis("month")
+            .assign(envelope=gdf.envelope.iloc[0])
+            .reset_index()[gdf.columns]
+        )
+
+    def get_envelope_stats(
+        self, envelopes=None, months: tuple = None
+    ) -> pandas.DataFrame:
+        # stats of all envelopes, of the subtree of an envelope (str, e.g. 'Car'
+        # for Car and all Car:...) or of the given envelopes (list), in all months
+        # or in the months from a to b (months=(a, b) as 'YYYY-MM', either may be
+        # None). Only the leaf transactions below the requested envelopes and up
+        # to b are aggregated, the months before a are calculated for the
+        # carryover. The snapshot is only used for all envelopes.
+        self._merge_inputs()
+        with stage("get_envelope_stats") as record:
+            stats = self._calc_envelope_stats(envelopes, months)
+            record["rows"] = stats.shape[0]
+        return stats
 
-    def get_envelope_stats(self) -> pandas.DataFrame:
+    def _calc_envelope_stats(
+        self, envelopes=None, months: tuple = None
+    ) -> pandas.DataFrame:
         if self._first_month is None:
-            self._first_month = self._transactions.month.min()
+            self._first_month = int(self._transactions.month.min())
             logging.info(
-                f"--first-month argument not supplied. Assuming {self._first_month} from data."
+                f"--first-month argument not supplied. Assuming {format_month(self._first_month)} from data."
             )
 
         self._update_budget_months()
 
-        monthly_stats = (
-            self._transactions.query(f'month >= "{self._first_month}"')
-            .groupby(["envelope", "month"])
-            .agg({"amount": "sum"})
-            .sort_index()
-        )
-        joined = self.budgets.join(monthly_stats, how="outer")
-
-        envelope_development = (
-            joined.reset_index().groupby("envelope").apply(self._calc_monthly_states)
-        )
+        # month window of the result (without end, months after _last_month with
+        # transactions are included as well)
+        from_month, to_month = self._first_month, None
+        if months is not None:
+            if months[0] is not None:
+                from_month = max(from_month, month_code(months[0]))
+            if months[1] is not None:
+                to_month = month_code(months[1])
+        if self._snapshot is not None and envelopes is None:
+            # the snapshot is taken of all envelopes and months
+            envelope_development = self._calc_monthly_states_from_snapshot(from_month)
+        else:
+            envelope_development = self._calc_monthly_states_until(envelopes, to_month)
+        if months is not None:
+            development_months = envelope_development["month"]
+            in_window = development_months >= from_month
+            if to_month is not None:
+                in_window &= development_months <= to_month
+            envelope_development = envelope_development.loc[in_window]
         envelope_development["state_month"] = envelope_development["difference"].round()
         envelope_development["state"] = envelope_development["cumsum"].round()
+        envelope_development["month"] = format_months(envelope_development["month"])
 
         return (
             envelope_development[
@@ -136,21 +329,242 @@ class EnvelopeStatsCalculator(object):
             .sort_index()
         )
 
+    def _calc_monthly_states_until(
+        self, envelopes=None, to_month: int = None
+    ) -> pandas.DataFrame:
+        # the monthly states of the requested envelopes (see get_envelope_stats)
+        # up to to_month, of all months if None
+        transactions = self._transactions
+        in_scope = None
+        if envelopes is not None:
+            in_scope = _envelope_scope(envelopes)
+            # the leaf envelopes with a requested envelope in their lineage
+            leaves = [
+                leaf
+                for leaf in transactions.envelope.unique()
+                if any(in_scope(envelope) for envelope in envelope_lineage(leaf))
+            ]
+            transactions = transactions.loc[transactions.envelope.isin(leaves)]
+
+        budgets = self._budgets
+        budget_months = self._budget_months
+        if to_month is not None:
+            transactions = transactions.loc[transactions.month.values <= to_month]
+            budgets = _budgets_until(budgets, to_month)
+            budget_months = budget_months[budget_months <= to_month]
+        joined = self._join_inputs(transactions, budgets)
+        if in_scope is not None:
+            names = joined.index.get_level_values("envelope")
+            requested = [name for name in names.unique() if in_scope(name)]
+            joined = joined.loc[names.isin(requested)]
+        if self._engine == MATRIX or joined.shape[0] == 0:
+            # (an empty selection, e.g. of an unknown envelope, gives empty stats)
+            return self._calc_monthly_states_matrix(joined, budget_months=budget_months)
+        return (
+            joined.reset_index()
+            .groupby("envelope")
+            .apply(lambda gdf: self._calc_monthly_states(gdf, budget_months))
+        )
+
+    def _join_inputs(
+        self, transactions: pandas.DataFrame, budgets: pandas.DataFrame
+    ) -> pandas.DataFrame:
+        # budgets joined with the amounts per envelope and month, the amounts of
+        # the leaf envelopes added up to all their parent envelopes. The parents
+        # are added up in exact cents, so their amounts do not depend on the
+        # summation order and are the same with compact dtypes.
+        leaf_monthly_cents = self._leaf_monthly_cents(
+            transactions.query(f"month >= {self._first_month}")
+        )
+        hierarchy = EnvelopeHierarchy(
+            leaf_monthly_cents.index.get_level_values("envelope").unique()
+        )
+        monthly_cents = hierarchy.rollup(leaf_monthly_cents).sort_index()
+        monthly_stats = pandas.DataFrame(
+            {"amount": from_cents(monthly_cents[AMOUNT_CENTS].to_numpy())},
+            index=monthly_cents.index,
+        )
+        return budgets.join(monthly_stats, how="outer")
+
+    def _leaf_monthly_cents(self, transactions: pandas.DataFrame) -> pandas.DataFrame:
+        # the amounts in cents summed up per leaf envelope and month code.
+        # Compact transactions are summed up in cents, plain ones are rounded to
+        # cents after the sum.
+        if not self._compact_dtypes:
+            sums = transactions.groupby(["envelope", "month"])["amount"].sum()
+            return pandas.DataFrame({AMOUNT_CENTS: to_cents(sums)}, index=sums.index)
+        sums = transactions.groupby(["envelope", "month"], observed=True)[
+            AMOUNT_CENTS
+        ].sum()
+        index = pandas.MultiIndex.from_arrays(
+            [
+                sums.index.get_level_values("envelope").astype(object),
+                sums.index.get_level_values("month").astype(int),
+            ],
+            names=["envelope", "month"],
+        )
+        # (in the order of the names, not of the categories, like the plain sums)
+        return pandas.DataFrame(
+            {AMOUNT_CENTS: sums.to_numpy(dtype=numpy.int64)}, index=index
+        ).sort_index()
+
+    def _calc_monthly_states_from_snapshot(self, from_month: int) -> pandas.DataFrame:
+        # the monthly states of all envelopes. If the result starts after the
+        # closed month of the snapshot and its inputs are unchanged, only the
+        # months after it are calculated, continuing from its state. The inputs
+        # are unchanged if the input files are, otherwise the closed months are
+        # compared with their fingerprints. All months before _last_month are
+        # closed for the next run.
+        snapshot = self._snapshot
+        sources = fingerprint_sources(self._sources)
+        closed_month = self._last_month - 1
+        joined = None
+        resumed = (
+            snapshot.load()
+            and snapshot.first_month == self._first_month
+            and from_month > snapshot.closed_month
+        )
+        if resumed and (sources is None or sources != snapshot.sources):
+            joined = self._join_inputs(self._transactions, self._budgets)
+            resumed = snapshot.is_valid(joined)
+
+        if resumed:
+            logging.info(
+                f"continuing from snapshot closed at {format_month(snapshot.closed_month)}"
+            )
+            if joined is None:
+                # only the inputs of the months after the closed month
+                transactions = self._transactions
+                budgets = self._budgets
+                budget_months = budgets.index.get_level_values("month")
+                opened = self._join_inputs(
+                    transactions.loc[transactions.month.values > snapshot.closed_month],
+                    budgets.loc[budget_months > snapshot.closed_month],
+                )
+            else:
+                months = joined.index.get_level_values("month")
+                opened = joined.loc[months > snapshot.closed_month]
+            envelope_development = self._calc_monthly_states_matrix(
+                opened,
+                initial_state=snapshot.state,
+                from_month=snapshot.closed_month + 1,
+            )
+        else:
+            if joined is None:
+                joined = self._join_inputs(self._transactions, self._budgets)
+            envelope_development = self._calc_monthly_states_matrix(joined)
+
+        if closed_month >= self._first_month and (
+            not resumed or closed_month > snapshot.closed_month
+        ):
+            if joined is None:
+                joined = self._join_inputs(self._transactions, self._budgets)
+            snapshot.save(
+                self._first_month, closed_month, joined, envelope_development, sources
+            )
+        elif resumed and sources != snapshot.sources:
+            # same closed months, checked against changed files
+            snapshot.sources = sources
+            snapshot.write()
+        return envelope_development
+
+    def _calc_monthly_states_matrix(
+        self,
+        joined: pandas.DataFrame,
+        initial_state: pandas.DataFrame = None,
+        from_month: int = None,
+        budget_months: numpy.ndarray = None,
+    ) -> pandas.DataFrame:
+        # same as _calc_monthly_states for all envelopes at once, on envelope x month
+        # arrays. Cells an envelope has no row for (neither in the data nor in
+        # _budget_months) take part in the budget propagation but add nothing.
+        # With an initial_state (per envelope the propagated budget and the cumsum
+        # of the month before from_month), only months from from_month on are
+        # calculated. budget_months defaults to _budget_months.
+        if budget_months is None:
+            budget_months = self._budget_months
+        if from_month is not None:
+            budget_months = budget_months[budget_months >= from_month]
+        months = (
+            joined.index.get_level_values("month")
+            .unique()
+            .union(pandas.Index(budget_months))
+        )
+        envelopes = joined.index.get_level_values("envelope").unique()
+        if initial_state is not None:
+            envelopes = envelopes.union(initial_state.index)
+        envelopes = envelopes.sort_values()
+        envelope_codes = envelopes.get_indexer(
+            joined.index.get_level_values("envelope")
+        )
+        month_codes = months.get_indexer(joined.index.get_level_values("month"))
+        shape = (len(envelopes), len(months))
+
+        present = numpy.zeros(shape, dtype=bool)
+        present[envelope_codes, month_codes] = True
+        present[:, months.isin(budget_months)] = True
+
+        def dense(column):
+            values = numpy.full(shape, numpy.nan)
+            values[envelope_codes, month_codes] = joined[column].astype(float).values
+            return values
+
+        budget = dense("budget")
+        adjustment = dense("adjustment")
+        amount = dense("amount")
+        if initial_state is not None:
+            # the month before from_month as first column: its budget propagates
+            # forward and its cumsum is carried over
+            initial = initial_state.reindex(envelopes)
+            months = pandas.Index([from_month - 1]).append(months)
+            budget = numpy.column_stack([initial.budget.values, budget])
+            adjustment = numpy.column_stack([numpy.zeros(len(envelopes)), adjustment])
+            amount = numpy.column_stack([numpy.zeros(len(envelopes)), amount])
+            present = numpy.column_stack([initial["cumsum"].notna().values, present])
+
+        budget = pandas.DataFrame(budget).ffill(axis=1).bfill(axis=1).fillna(0).values
+        adjustment = numpy.nan_to_num(adjustment)
+        amount = numpy.nan_to_num(amount)
+        budget = budget + adjustment
+
+        # only months from _first_month on are accounted
+        window = numpy.asarray(months >= self._first_month)
+        present = present[:, window]
+        budget = budget[:, window]
+        adjustment = adjustment[:, window]
+        amount = amount[:, window]
+        difference = numpy.where(present, budget - amount, 0.0)
+        if initial_state is not None:
+            difference[:, 0] = numpy.nan_to_num(initial["cumsum"].values)
+        cumsum = difference.cumsum(axis=1)
+
+        # carryover is the cumsum of the previous month the envelope has a row for
+        carryover = numpy.full(cumsum.shape, numpy.nan)
+        carryover[:, 1:] = cumsum[:, :-1]
+        carryover[present.cumsum(axis=1) <= 1] = numpy.nan
+
+        if initial_state is not None:
+            present[:, 0] = False
+        rows, columns = numpy.nonzero(present)
+        return pandas.DataFrame(
+            {
+                "envelope": envelopes[rows],
+                "month": months[window][columns],
+                "budget": budget[rows, columns],
+                "adjustment": adjustment[rows, columns],
+                "amount": amount[rows, columns],
+                "difference": difference[rows, columns],
+                "cumsum": cumsum[rows, columns],
+                "carryover": carryover[rows, columns],
+            }
+        )
+
     def _update_budget_months(self) -> None:
-        self._budget_months = []
-
-        min_year, min_month = [int(x) for x in self._first_month.split("-")]
-        all_months = [self._first_month]
-        current_month = min_month
-        current_year = min_year
-
-        while all_months[-1] != self._last_month:
-            current_month += 1
-            if current_month > 12:
-                current_year += 1
-                current_month = 1
-
-            current_month_string = f"{current_year}-{str(current_month).zfill(2)}"
-            all_months.append(current_month_string)
-        self._budget_months = all_months
-        logging.info(f"Months to be considered are {self._budget_months}")
+        if self._last_month is None:
+            self._last_month = month_codes_from_dates(
+                pandas.Series([pandas.Timestamp.today()])
+            ).iloc[0]
+        self._budget_months = month_range(self._first_month, self._last_month)
+        logging.info(
+            f"Months to be considered are {list(format_months(self._budget_months))}"
+        )
@@ -0,0 +1,55 @@
+"""Reading of several input files, optionally in a pool of worker processes."""
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+FILENAME = "filename"
+
+
+class IngestionError(Exception):
+    """
+    Raised once all files are read if some of them could not be read.
+    Args:
+        errors (dict): the exception per failed filename
+        readers (list): readers of the files read successfully, in task order
+    Attributes:
+        errors (dict): the exception per failed filename
+        readers (list): readers of the files read successfully, in task order
+    """
+
+    def __init__(self, errors: dict, readers: list = None):
+        self.errors = errors
+        self.readers = readers or []
+        super().__init__(
+            "Reading failed for "
+            + ", ".join(f"{filename} ({e})" for filename, e in errors.items())
+        )
+
+
+def read_files(tasks: list, jobs: int = 1) -> list:
+    # reader_factory(**kwargs) for each (reader_factory, kwargs) of tasks, in jobs
+    # worker processes. The readers are returned in the order of the tasks, not
+    # in the order the workers finish, so the results equal those of a serial
+    # run. A failing file does not stop the others: all errors are logged and
+    # raised together as IngestionError once the other files are read.
+    readers = []
+    errors = {}
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(tasks))) as pool:
+            futures = [pool.submit(factory, **kwargs) for factory, kwargs in tasks]
+            for (_, kwargs), future in zip(tasks, futures):
+                try:
+                    readers.append(future.result())
+                except Exception as e:
+                    errors[kwargs[FILENAME]] = e
+    else:
+        for factory, kwargs in tasks:
+            try:
+                readers.append(factory(**kwargs))
+            except Exception as e:
+                errors[kwargs[FILENAME]] = e
+
+    for filename, e in errors.items():
+        logging.error(f"reading {filename} failed: {type(e).__name__}: {e}")
+    if len(errors) > 0:
+        raise IngestionError(errors, readers)
+    return readers
@@ -0,0 +1,211 @@
+"""Persistent SQLite ledger of extracted statements and monthly budgets."""
+import hashlib
+import logging
+import sqlite3
+
+import pandas
+
+from .dtypes import expand_statements
+from .months import month_codes_from_dates
+from .profiling import stage
+
+# exports (the statements of one transaction file) are identified by a hash of
+# their statements, so inserting the same export again, also under another file
+# name, adds nothing. export_sources links each file to its current export, one
+# export may be shared by several files. A changed file links to its new export,
+# and the statements of the earlier one are deleted once no file links to it.
+# The index on (envelope, month, amount) covers the sums per envelope and month.
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS exports (
+    id INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    statements INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS export_sources (
+    source TEXT PRIMARY KEY,
+    export INTEGER NOT NULL REFERENCES exports (id)
+);
+CREATE INDEX IF NOT EXISTS export_sources_export ON export_sources (export);
+CREATE TABLE IF NOT EXISTS statements (
+    export INTEGER NOT NULL REFERENCES exports (id),
+    envelope TEXT NOT NULL,
+    month INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    amount REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS statements_envelope_month
+    ON statements (envelope, month, amount);
+CREATE INDEX IF NOT EXISTS statements_month ON statements (month);
+CREATE INDEX IF NOT EXISTS statements_date ON statements (date);
+CREATE TABLE IF NOT EXISTS budgets (
+    source TEXT NOT NULL,
+    envelope TEXT NOT NULL,
+    month INTEGER NOT NULL,
+    budget REAL,
+    adjustment REAL,
+    PRIMARY KEY (source, envelope, month)
+);
+CREATE INDEX IF NOT EXISTS budgets_envelope_month ON budgets (envelope, month);
+"""
+
+
+def _hash_statements(rows: pandas.DataFrame) -> str:
+    hashes = pandas.util.hash_pandas_object(rows, index=False).values
+    return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+
+class Ledger(object):
+    """
+    SQLite database of the statements extracted from transaction files and the
+    monthly budgets of budget files. The EnvelopeStatsCalculator reads them
+    summed up per envelope and month by the database (see add_ledger).
+    Args:
+        filename (str): path of the database, created if missing. ':memory:'
+            for a ledger that is not persisted
+    Attributes:
+        filename (str): path of the database
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._connection = sqlite3.connect(filename)
+        self._connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def add_transactions(self, reader) -> int:
+        # the leaf statements of a TransactionsReader, returns the number of
+        # statements added (0 if the same statements were added before). They
+        # replace the statements added before for the same file.
+        return self.insert_statements(reader.get_leaf_statements(), reader.filename)
+
+    def add_budgets(self, budgetreader) -> None:
+        # the monthly budgets of a BudgetReader replace those stored before for
+        # the same file
+        self.insert_budgets(budgetreader.get_budgets(), budgetreader.budgets_filename)
+
+    def insert_statements(self, statements: pandas.DataFrame, source: str) -> int:
+        with stage("ledger_insert_statements", filename=source) as record:
+            statements = expand_statements(statements)
+            rows = pandas.DataFrame({"envelope": statements.envelope.fillna("NOT SET")})
+            if "month" in statements:
+                # streaming readers deliver statements already summed up per month
+                rows["month"] = statements.month.to_numpy()
+                rows["date"] = ""
+            else:
+                dates = pandas.to_datetime(statements.date)
+                rows["month"] = month_codes_from_dates(dates).to_numpy()
+                rows["date"] = dates.dt.strftime("%Y-%m-%d").to_numpy()
+            rows["amount"] = statements.amount.astype(float).to_numpy()
+
+            digest = _hash_statements(rows)
+            inserted = 0
+            with self._connection:
+                previous = self._connection.execute(
+                    "SELECT export FROM export_sources WHERE source = ?", (source,)
+                ).fetchone()
+                cursor = self._connection.execute(
+                    "INSERT OR IGNORE INTO exports (hash, statements) VALUES (?, ?)",
+                    (digest, rows.shape[0]),
+                )
+                if cursor.rowcount == 1:
+                    export = cursor.lastrowid
+                    self._connection.executemany(
+                        "INSERT INTO statements (export, envelope, month, date, amount) "
+                        + "VALUES (?, ?, ?, ?, ?)",
+                        (
+                            (export, *row)
+                            for row in rows.itertuples(index=False, name=None)
+                        ),
+                    )
+                    inserted = rows.shape[0]
+                else:
+                    (export,) = self._connection.execute(
+                        "SELECT id FROM exports WHERE hash = ?", (digest,)
+                    ).fetchone()
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO export_sources (source, export) "
+                    + "VALUES (?, ?)",
+                    (source, export),
+                )
+                if previous is not None and previous[0] != export:
+                    self._delete_unlinked_export(previous[0])
+            record["rows"] = inserted
+        if inserted == 0:
+            logging.info(f"statements of {source} are in the ledger already")
+        else:
+            logging.info(f"{inserted} statements of {source} added to the ledger")
+        return inserted
+
+    def _delete_unlinked_export(self, export: int) -> None:
+        # the statements of an earlier export, unless another file still has it
+        linked = self._connection.execute(
+            "SELECT 1 FROM export_sources WHERE export = ? LIMIT 1", (export,)
+        ).fetchone()
+        if linked is None:
+            self._connection.execute(
+                "DELETE FROM statements WHERE export = ?", (export,)
+            )
+            self._connection.execute("DELETE FROM exports WHERE id = ?", (export,))
+
+    def insert_budgets(self, budgets: pandas.DataFrame, source: str) -> None:
+        with stage("ledger_insert_budgets", filename=source) as record:
+            rows = budgets.reset_index()[["envelope", "month", "budget", "adjustment"]]
+            rows = rows.astype({"month": int, "budget": float, "adjustment": float})
+            with self._connection:
+                self._connection.execute(
+                    "DELETE FROM budgets WHERE source = ?", (source,)
+                )
+                self._connection.executemany(
+                    "INSERT INTO budgets (source, envelope, month, budget, adjustment) "
+                    + "VALUES (?, ?, ?, ?, ?)",
+                    (
+                        (source, envelope, month, *values)
+                        for envelope, month, *values in rows.astype(object)
+                        .where(rows.notna(), None)
+                        .itertuples(index=False, name=None)
+                    ),
+                )
+            record["rows"] = rows.shape[0]
+
+    def monthly_statements(
+        self, first_month: int = None, last_month: int = None
+    ) -> pandas.DataFrame:
+        # the amounts summed up per (leaf) envelope and month code, optionally
+        # only of the months from first_month to last_month
+        conditions, parameters = [], []
+        if first_month is not None:
+            conditions.append("month >= ?")
+            parameters.append(int(first_month))
+        if last_month is not None:
+            conditions.append("month <= ?")
+            parameters.append(int(last_month))
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+        return pandas.read_sql_query(
+            "SELECT envelope, month, SUM(amount) AS amount FROM statements "
+            + where
+            + "GROUP BY envelope, month ORDER BY envelope, month",
+            self._connection,
+            params=parameters,
+        )
+
+    def get_budgets(self) -> pandas.DataFrame:
+        # monthly budgets and adjustments of all budget files, indexed by envelope
+        # and month code like BudgetReader.get_budgets. Missing values stay
+        # missing when summed up (SUM of only NULLs is NULL).
+        budgets = pandas.read_sql_query(
+            "SELECT envelope, month, SUM(budget) AS budget, "
+            + "SUM(adjustment) AS adjustment FROM budgets "
+            + "GROUP BY envelope, month ORDER BY envelope, month",
+            self._connection,
+        )
+        return budgets.astype({"budget": float, "adjustment": float}).set_index(
+            ["envelope", "month"]
+        )
@@ -0,0 +1,49 @@
+"""Months as integer month codes (year * 12 + month - 1), e.g. '2023-05' -> 24280.
+
+Codes are consecutive across years, so month ranges, comparisons and gap
+filling are plain integer operations. 'YYYY-MM' strings are only produced for
+output.
+"""
+import numpy
+import pandas
+
+
+def month_code(month: str) -> int:
+    # '2023-05' -> 24280
+    year, month = [int(x) for x in str(month).split("-")[:2]]
+    return year * 12 + month - 1
+
+
+def month_codes(months: pandas.Series) -> pandas.Series:
+    # vectorized month_code for a column of 'YYYY-MM' strings
+    months = months.astype(str)
+    return months.str[:4].astype(int) * 12 + months.str[5:7].astype(int) - 1
+
+
+def month_codes_from_dates(dates: pandas.Series) -> pandas.Series:
+    # month codes of a column of dates (datetime.date objects or datetimes)
+    dates = pandas.to_datetime(dates)
+    return dates.dt.year * 12 + dates.dt.month - 1
+
+
+def format_month(code: int) -> str:
+    # 24280 -> '2023-05'
+    return f"{code // 12}-{code % 12 + 1:02d}"
+
+
+def format_months(codes) -> numpy.ndarray:
+    # vectorized format_month for an array, Series or Index of month codes
+    codes = numpy.asarray(codes, dtype=int)
+    years = pandas.Series(codes // 12).astype(str)
+    months = pandas.Series(codes % 12 + 1).astype(str).str.zfill(2)
+    return (years + "-" + months).to_numpy(dtype=object)
+
+
+def month_range(first_month: int, last_month: int) -> numpy.ndarray:
+    # all month codes from first_month up to and including last_month
+    if last_month < first_month:
+        raise ValueError(
+            f"Last month {format_month(last_month)} is before first month "
+            + f"{format_month(first_month)}"
+        )
+    return numpy.arange(first_month, last_month + 1)
@@ -0,0 +1,38 @@
+"""Parquet input and output. Needs the optional dependency pyarrow."""
+import pandas
+
+
+def require_pyarrow():
+    try:
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(
+            "Parquet files need pyarrow: pip install 'budget-envelopes[parquet]'"
+        ) from e
+    return pyarrow.parquet
+
+
+def _projection(parquet_file, columns: list) -> list:
+    # only the requested columns the file actually has, each once
+    names = parquet_file.schema_arrow.names
+    return [c for c in dict.fromkeys(columns) if c in names]
+
+
+def read_parquet_columns(filename: str, columns: list) -> pandas.DataFrame:
+    # read only the given columns (column projection), dtypes as stored
+    parquet_file = require_pyarrow().ParquetFile(filename)
+    return parquet_file.read(columns=_projection(parquet_file, columns)).to_pandas()
+
+
+def iter_parquet_batches(filename: str, columns: list, batch_size: int):
+    # yield DataFrames of batch_size rows with the given columns
+    parquet_file = require_pyarrow().ParquetFile(filename)
+    for batch in parquet_file.iter_batches(
+        batch_size=batch_size, columns=_projection(parquet_file, columns)
+    ):
+        yield batch.to_pandas()
+
+
+def write_parquet(frame: pandas.DataFrame, filename: str) -> None:
+    require_pyarrow()
+    frame.to_parquet(filename)
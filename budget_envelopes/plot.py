@@ -1,43 +1,60 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import numpy
 import pandas
 
-import matplotlib.pyplot as plt
+
+def bar_geometry(envelopes: pandas.DataFrame) -> pandas.DataFrame:
+    # widths, offsets and labels of the bars of one month, one row per envelope in
+    # plotting order (descending envelope names), as whole-column operations.
+    # Widths are in percent of the envelope total (budget + abs(carryover)).
+    envelopes = envelopes.fillna(0).sort_values("envelope", ascending=False)
+    state = envelopes.state.to_numpy(dtype=float)
+    budget = envelopes.budget.to_numpy(dtype=float)
+    carryover = envelopes.carryover.to_numpy(dtype=float)
+    total = budget + numpy.abs(carryover)
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        state_pct = numpy.clip(state / total, 0, 1) * 100
+        budget_pct = numpy.where(budget + carryover > 0, budget / total * 100, 0)
+        carryover_pct = numpy.abs(carryover) / total * 100
+    budget_string = pandas.Series(numpy.round(budget).astype(int)).astype(str)
+    carryover_string = pandas.Series(
+        numpy.abs(numpy.round(carryover).astype(int))
+    ).astype(str)
+    sign = pandas.Series(numpy.where(carryover > 0, " + ", " - "))
+
+    geometry = pandas.DataFrame(
+        {
+            "envelope": envelopes.envelope.to_numpy(),
+            "state_pct": state_pct,
+            "budget_pct": budget_pct,
+            # the carryover bars start where the budget bar ends
+            "carryover_left": budget_pct,
+            "carryover_pos_pct": numpy.where(carryover > 0, carryover_pct, 0),
+            "carryover_neg_pct": numpy.where(carryover < 0, carryover_pct, 0),
+            "state_label": (" " + envelopes.state.astype(str) + " CHF").to_numpy(),
+            "total_budget_label": (
+                budget_string + sign + carryover_string + " CHF"
+            ).to_numpy(),
+        }
+    ).fillna(0)
+    # no zero carryover in the label
+    geometry["total_budget_label"] = geometry.total_budget_label.str.replace(" - 0", "")
+    return geometry
 
 
 def plot_month(envelopes: pandas.DataFrame, output_file: str):
-    envelopes = envelopes.fillna(0)
+    import matplotlib.pyplot as plt
 
-    # print(envelopes)
+    envelopes = bar_geometry(envelopes)
 
     plt.style.use("dark_background")
 
-    envelopes["state_pct"] = envelopes.apply(
-        lambda r: max(min(r.state / (r.budget + abs(r.carryover)), 1), 0) * 100, axis=1
-    )
-    envelopes["budget_pct"] = envelopes.apply(
-        lambda r: (r.budget / (r.budget + abs(r.carryover))) * 100
-        if r.budget + r.carryover > 0
-        else 0,
-        axis=1,
-    )
-    envelopes["carryover_pos_pct"] = envelopes.apply(
-        lambda r: (abs(r.carryover) / (r.budget + abs(r.carryover))) * 100
-        if r.carryover > 0
-        else None,
-        axis=1,
-    )
-    envelopes["carryover_neg_pct"] = envelopes.apply(
-        lambda r: (abs(r.carryover) / (r.budget + abs(r.carryover))) * 100
-        if r.carryover < 0
-        else None,
-        axis=1,
-    )
-    envelopes["total_budget_string"] = envelopes.apply(
-        lambda r: f"{round(r.budget)} {'+' if r.carryover > 0 else '-'} {abs(round(r.carryover))} CHF",
-        axis=1,
-    )
-    envelopes = envelopes.fillna(0)
-
     fig = plt.figure(figsize=(10, 20))
     ax = fig.add_subplot(111)
     contextbar_width = 0.05
@@ -58,7 +75,7 @@ def plot_month(envelopes: pandas.DataFrame, output_file: str):
     ax.barh(
         y=envelopes.envelope,
         width=envelopes.carryover_pos_pct,
-        left=envelopes.budget_pct,
+        left=envelopes.carryover_left,
         height=contextbar_width,
         align="center",
         color="yellow",
@@ -66,27 +83,18 @@ def plot_month(envelopes: pandas.DataFrame, output_file: str):
     ax.barh(
         y=envelopes.envelope,
         width=envelopes.carryover_neg_pct,
-        left=envelopes.budget_pct,
+        left=envelopes.carryover_left,
         height=contextbar_width,
         align="center",
         color="red",
     )
 
-    # ax = envelopes.sort_values('envelope',ascending=False).plot.barh('envelope','state_pct',figsize=(10, 16), legend=False, color='grey')
-    for p, state in zip(
-        ax.patches, envelopes.sort_values("envelope", ascending=False).state.tolist()
+    # the bars of the envelopes are at y = 0, 1, ...
+    for y, (state_label, total_budget_label) in enumerate(
+        zip(envelopes.state_label, envelopes.total_budget_label)
     ):
-        ax.annotate(
-            str(f" {state} CHF"), (0, p.get_y() + 0.1), weight="bold", color="w"
-        )
-    for p, total_budget in zip(
-        ax.patches,
-        envelopes.sort_values("envelope", ascending=False).total_budget_string.tolist(),
-    ):
-        ax.annotate(
-            str(total_budget.replace(" - 0", "")), (80, p.get_y() + 0.1), color="w"
-        )
-        # ax.annotate(str(f" {total_budget} CHF"), (85 ,p.get_y()+0.1), color='w')
+        ax.annotate(state_label, (0, y + 0.1), weight="bold", color="w")
+        ax.annotate(total_budget_label, (80, y + 0.1), color="w")
 
     ax.text(
         1.01,
@@ -99,4 +107,59 @@ def plot_month(envelopes: pandas.DataFrame, output_file: str):
     )
     plt.tight_layout()
     # plt.show()
-    fig.savefig(output_file, format="png", transparent=True, bbox_inches="tight")
+    # written to a temporary file first, so readers never see a half-written plot
+    fig.savefig(
+        output_file + ".tmp", format="png", transparent=True, bbox_inches="tight"
+    )
+    os.replace(output_file + ".tmp", output_file)
+    # free the figure, pyplot keeps all open figures alive
+    plt.close(fig)
+
+
+def fingerprint_envelopes(envelopes: pandas.DataFrame) -> str:
+    hashes = pandas.util.hash_pandas_object(envelopes, index=False).values
+    return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+
+def _plot_month_to_file(item: tuple) -> str:
+    output_file, envelopes = item
+    plot_month(envelopes, output_file)
+    return output_file
+
+
+def plot_months(plots: dict, jobs: int = 1, manifest_file: str = None) -> list:
+    # plot_month for each output file -> envelopes of plots, in jobs worker
+    # processes. With a manifest_file (json of the fingerprints of the plotted
+    # envelopes), plots whose envelopes are unchanged since they were last
+    # rendered are skipped. Returns the output files rendered.
+    manifest = {}
+    if manifest_file is not None and os.path.exists(manifest_file):
+        with open(manifest_file, "r") as f:
+            manifest = json.load(f)
+
+    fingerprints = {
+        output_file: fingerprint_envelopes(envelopes)
+        for output_file, envelopes in plots.items()
+    }
+    outdated = [
+        (output_file, envelopes)
+        for output_file, envelopes in plots.items()
+        if manifest.get(output_file) != fingerprints[output_file]
+        or not os.path.exists(output_file)
+    ]
+    logging.info(
+        f"plotting {len(outdated)} months, {len(plots) - len(outdated)} unchanged"
+    )
+
+    if jobs > 1 and len(outdated) > 1:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(outdated))) as pool:
+            rendered = list(pool.map(_plot_month_to_file, outdated))
+    else:
+        rendered = [_plot_month_to_file(item) for item in outdated]
+
+    if manifest_file is not None:
+        manifest.update(fingerprints)
+        with open(manifest_file + ".tmp", "w") as f:
+            json.dump(manifest, f, indent=4, sort_keys=True)
+        os.replace(manifest_file + ".tmp", manifest_file)
+    return rendered
@@ -0,0 +1,164 @@
+"""Per-stage instrumentation: wall time, cpu time, peak memory and row counts.
+
+Stages are recorded only while a Profiler is enabled; otherwise stage() returns
+a shared no-op context manager. While enabled, allocations are traced with
+tracemalloc for the peak memory of each stage, which slows the run down.
+"""
+import cProfile
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on windows
+    resource = None
+
+_profiler = None
+
+
+def process_max_rss_bytes() -> int:
+    # high-water mark of the resident set size of this process, since its start
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class _Stage(object):
+    def __init__(self, profiler, name: str, details: dict):
+        self.profiler = profiler
+        self.record = {"stage": name, **details}
+
+    def __enter__(self) -> dict:
+        # the traced peak is reset for this stage, the enclosing stages keep
+        # the peak they had so far
+        _, peak = tracemalloc.get_traced_memory()
+        for stage in self.profiler.open_stages:
+            stage.peak = max(stage.peak, peak)
+        tracemalloc.reset_peak()
+        self.start, self.peak = tracemalloc.get_traced_memory()
+        self.profiler.open_stages.append(self)
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        return self.record
+
+    def __exit__(self, *exc_info) -> bool:
+        self.record["wall_seconds"] = time.perf_counter() - self._wall
+        self.record["cpu_seconds"] = time.process_time() - self._cpu
+        self.profiler.open_stages.remove(self)
+        _, peak = tracemalloc.get_traced_memory()
+        # above the memory allocated when the stage started
+        self.record["peak_bytes"] = max(self.peak, peak) - self.start
+        self.record["process_max_rss_bytes"] = process_max_rss_bytes()
+        self.profiler.stages.append(self.record)
+        return False
+
+
+class _NoStage(object):
+    def __enter__(self) -> dict:
+        # details set by the caller are discarded
+        return {}
+
+    def __exit__(self, *exc_info) -> bool:
+        return False
+
+
+_NO_STAGE = _NoStage()
+
+
+class Profiler(object):
+    """
+    Records the stages of a run, and optionally a cProfile of the whole run.
+    Args:
+        cprofile (bool): whether to run cProfile between enable() and disable()
+    Attributes:
+        stages (list): one record per executed stage, in the order they ended.
+            Records have the keys stage, wall_seconds, cpu_seconds, peak_bytes
+            (traced peak of the stage) and process_max_rss_bytes (high-water
+            mark of the whole process so far) plus the details given by the
+            stage, e.g. rows.
+        open_stages (list): the stages entered and not exited yet
+        started_tracing (bool): whether enable() started tracemalloc
+    """
+
+    def __init__(self, cprofile: bool = False):
+        self.stages = []
+        self.open_stages = []
+        self.started_tracing = False
+        self.cprofile = cProfile.Profile() if cprofile else None
+
+    def stage(self, name: str, **details) -> _Stage:
+        return _Stage(self, name, details)
+
+    def summary(self) -> dict:
+        # per stage name: number of runs and the summed times and rows
+        summary = {}
+        for record in self.stages:
+            stage = summary.setdefault(
+                record["stage"],
+                {
+                    "count": 0,
+                    "wall_seconds": 0.0,
+                    "cpu_seconds": 0.0,
+                    "rows": 0,
+                    "peak_bytes": 0,
+                },
+            )
+            stage["count"] += 1
+            stage["wall_seconds"] += record["wall_seconds"]
+            stage["cpu_seconds"] += record["cpu_seconds"]
+            stage["rows"] += record.get("rows") or 0
+            stage["peak_bytes"] = max(stage["peak_bytes"], record["peak_bytes"])
+            stage["process_max_rss_bytes"] = record["process_max_rss_bytes"]
+        return summary
+
+    def write(self, filename: str) -> None:
+        # json report and, with cprofile, the cProfile stats next to it (.prof)
+        with open(filename, "w") as f:
+            json.dump(
+                {"stages": self.stages, "summary": self.summary()},
+                f,
+                indent=4,
+                default=str,
+            )
+        logging.info(f"profile of {len(self.stages)} stages written to {filename}")
+        if self.cprofile is not None:
+            cprofile_file = os.path.splitext(filename)[0] + ".prof"
+            self.cprofile.dump_stats(cprofile_file)
+            logging.info(f"cProfile stats written to {cprofile_file}")
+
+
+def enable(cprofile: bool = False) -> Profiler:
+    # record all stages from now on
+    global _profiler
+    _profiler = Profiler(cprofile)
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _profiler.started_tracing = True
+    if _profiler.cprofile is not None:
+        _profiler.cprofile.enable()
+    return _profiler
+
+
+def disable() -> Profiler:
+    # stop recording, returns the profiler with the recorded stages
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None and profiler.cprofile is not None:
+        profiler.cprofile.disable()
+    if profiler is not None and profiler.started_tracing:
+        tracemalloc.stop()
+    return profiler
+
+
+def stage(name: str, **details):
+    # context manager recording the stage if profiling is enabled. The record
+    # (a dict) it returns takes further details, e.g. record["rows"] = 10
+    if _profiler is None:
+        return _NO_STAGE
+    return _profiler.stage(name, **details)
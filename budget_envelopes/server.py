@@ -0,0 +1,165 @@
+"""Local HTTP/JSON service keeping the envelope stats in memory.
+
+Endpoints:
+    GET  /state                       current state of all envelopes (last month)
+    GET  /envelopes                   names of all envelopes
+    GET  /envelopes/<envelope>/history  monthly stats of one envelope
+    GET  /months/<YYYY-MM>            stats of all envelopes in one month
+    POST /transactions                json array of transactions, in the fields
+                                      of the transaction files
+"""
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import pandas
+
+from .envelope_hierarchy import envelope_lineage
+from .envelope_stats_calculator import EnvelopeStatsCalculator
+from .months import format_month, month_code, month_codes_from_dates
+from .transactions_reader import RecordsTransactionsReader
+
+
+def _records(frame: pandas.DataFrame) -> list:
+    # json-compatible records (NaN as null)
+    return json.loads(frame.reset_index().to_json(orient="records"))
+
+
+class EnvelopeService(object):
+    """
+    Envelope stats of a calculator, kept in memory and updated with new
+    transactions.
+    Args:
+        calculator (EnvelopeStatsCalculator): calculator with all budgets and
+            transactions added
+        reader_options (dict): TransactionsReader arguments (fields, debit flag)
+            for posted transactions
+    Attributes:
+        stats (pandas.DataFrame): stats of all envelopes, as returned by
+            EnvelopeStatsCalculator.get_envelope_stats
+        last_month (str): month of the current state
+    """
+
+    def __init__(self, calculator: EnvelopeStatsCalculator, reader_options: dict):
+        self.calculator = calculator
+        self.reader_options = reader_options
+        self._lock = threading.Lock()
+        self.stats = calculator.get_envelope_stats()
+        self.last_month = calculator.last_month
+
+    def current_state(self) -> list:
+        return self.month_snapshot(self.last_month)
+
+    def envelopes(self) -> list:
+        return list(self.stats.index.get_level_values("envelope").unique())
+
+    def envelope_history(self, envelope: str) -> list:
+        with self._lock:
+            if envelope not in self.stats.index.get_level_values("envelope"):
+                raise KeyError(f"Unknown envelope '{envelope}'")
+            return _records(self.stats.loc[[envelope]])
+
+    def month_snapshot(self, month: str) -> list:
+        month = format_month(month_code(month))
+        with self._lock:
+            months = self.stats.index.get_level_values("month")
+            return _records(self.stats.loc[months == month])
+
+    def add_transactions(self, records: list) -> dict:
+        # add the transactions and recalculate only the envelopes they are booked
+        # on (and their parents), from the first month they are booked in
+        reader = RecordsTransactionsReader(records=records, **self.reader_options)
+        return self.add_statements(reader.get_leaf_statements())
+
+    def add_statements(self, statements: pandas.DataFrame) -> dict:
+        # leaf statements as returned by TransactionsReader.get_leaf_statements
+        if statements.shape[0] == 0:
+            return {"added": 0, "envelopes": [], "from_month": None}
+
+        envelopes = set()
+        # (categorical envelopes of compact statements as plain strings)
+        for envelope in statements.envelope.astype(object).fillna("NOT SET").unique():
+            envelopes.update(envelope_lineage(envelope))
+        if "month" in statements:
+            # streaming readers deliver statements already summed up per month
+            from_month = format_month(int(statements.month.min()))
+        else:
+            from_month = format_month(month_codes_from_dates(statements.date).min())
+
+        with self._lock:
+            self.calculator.add_statements(statements)
+            updated = self.calculator.get_envelope_stats(envelopes=sorted(envelopes))
+            updated = updated.loc[updated.index.get_level_values("month") >= from_month]
+
+            index = self.stats.index
+            outdated = index.get_level_values("envelope").isin(envelopes) & (
+                index.get_level_values("month") >= from_month
+            )
+            self.stats = pandas.concat(
+                [self.stats.loc[~outdated], updated]
+            ).sort_index()
+        logging.info(
+            f"added {statements.shape[0]} transactions, updated {len(envelopes)} envelopes from {from_month}"
+        )
+        return {
+            "added": statements.shape[0],
+            "envelopes": sorted(envelopes),
+            "from_month": from_month,
+        }
+
+
+class EnvelopeRequestHandler(BaseHTTPRequestHandler):
+    # the EnvelopeService is set as attribute of the server
+    def _respond(self, status: int, body) -> None:
+        content = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        service = self.server.service
+        parts = [unquote(part) for part in self.path.strip("/").split("/")]
+        try:
+            if parts == ["state"]:
+                self._respond(200, service.current_state())
+            elif parts == ["envelopes"]:
+                self._respond(200, service.envelopes())
+            elif len(parts) == 3 and parts[0] == "envelopes" and parts[2] == "history":
+                self._respond(200, service.envelope_history(parts[1]))
+            elif len(parts) == 2 and parts[0] == "months":
+                self._respond(200, service.month_snapshot(parts[1]))
+            else:
+                self._respond(404, {"error": f"Unknown path {self.path}"})
+        except KeyError as e:
+            self._respond(404, {"error": str(e.args[0])})
+        except ValueError as e:
+            self._respond(400, {"error": str(e)})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/transactions":
+            self._respond(404, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            records = json.loads(self.rfile.read(length))
+            if not isinstance(records, list):
+                raise ValueError("A json array of transactions is expected")
+            self._respond(200, self.server.service.add_transactions(records))
+        except (ValueError, KeyError, TypeError) as e:
+            self._respond(400, {"error": f"{type(e).__name__}: {e}"})
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+def make_server(
+    service: EnvelopeService, host: str = "127.0.0.1", port: int = 8080
+) -> ThreadingHTTPServer:
+    # port 0 picks a free port, see server.server_address
+    server = ThreadingHTTPServer((host, port), EnvelopeRequestHandler)
+    server.service = service
+    return server
@@ -0,0 +1,152 @@
+"""Month-close snapshots: persisted envelope states at the end of a closed month."""
+import hashlib
+import json
+import logging
+import os
+
+import numpy
+import pandas
+
+from .months import format_month, month_code
+
+BACKFILLED_BUDGETS = "backfilled_budgets"
+
+
+def _hash_frame(frame: pandas.DataFrame) -> str:
+    hashes = pandas.util.hash_pandas_object(frame, index=True).values
+    return hashlib.sha256(hashes.tobytes()).hexdigest()
+
+
+def fingerprint_sources(sources: list) -> str:
+    # fingerprint of the input files by their name, modification time, size and
+    # parse options, given as (filename, options) per input. None if an input is
+    # not a file (e.g. statements added directly) or is missing.
+    stats = []
+    for filename, options in sources:
+        if filename is None or not os.path.isfile(filename):
+            return None
+        stat = os.stat(filename)
+        stats.append([filename, stat.st_mtime_ns, stat.st_size, options])
+    contents = json.dumps(stats, sort_keys=True, default=str)
+    return hashlib.sha256(contents.encode()).hexdigest()
+
+
+def fingerprint_inputs(joined: pandas.DataFrame, closed_month: int) -> dict:
+    # fingerprints of the inputs that determine the states up to the closed month:
+    # the budgets, adjustments and amounts of each closed month, and the first
+    # budget of envelopes that are only budgeted later (it is propagated backwards).
+    # The row hashes of a month are added up, independent of the row order.
+    months = joined.index.get_level_values("month")
+    closed = joined.loc[months <= closed_month]
+    hashes = pandas.util.hash_pandas_object(closed, index=True).to_numpy()
+    closed_months = closed.index.get_level_values("month").to_numpy()
+    order = numpy.argsort(closed_months, kind="stable")
+    month_codes, starts = numpy.unique(closed_months[order], return_index=True)
+    sums = numpy.add.reduceat(hashes[order], starts) if len(starts) > 0 else []
+    fingerprints = {
+        format_month(month): f"{int(month_sum):016x}"
+        for month, month_sum in zip(month_codes, sums)
+    }
+
+    budgeted = joined.loc[joined.budget.notna()].reset_index()
+    first_budgets = budgeted.groupby("envelope").first()
+    fingerprints[BACKFILLED_BUDGETS] = _hash_frame(
+        first_budgets.loc[first_budgets.month > closed_month, ["budget"]]
+    )
+    return fingerprints
+
+
+class MonthCloseSnapshot(object):
+    """
+    Snapshot of the envelope states at the end of a closed month, stored as json.
+    Args:
+        filename (str): path of the snapshot file
+    Attributes:
+        first_month (int): month code the stats were calculated from
+        closed_month (int): month code of the last closed month
+        fingerprints (dict): fingerprint of the inputs per closed month
+        sources (str): fingerprint of the input files (see fingerprint_sources),
+            while they are unchanged the closed months are not checked again
+        state (pandas.DataFrame): per envelope, the propagated budget and the
+            cumsum at the end of the closed month
+    """
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.first_month = None
+        self.closed_month = None
+        self.fingerprints = {}
+        self.sources = None
+        self.state = None
+
+    def load(self) -> bool:
+        if not os.path.exists(self.filename):
+            return False
+        with open(self.filename, "r") as f:
+            contents = json.load(f)
+        self.first_month = month_code(contents["first_month"])
+        self.closed_month = month_code(contents["closed_month"])
+        self.fingerprints = contents["fingerprints"]
+        self.sources = contents.get("sources")
+        self.state = pandas.DataFrame(contents["state"]).set_index("envelope")
+        return True
+
+    def is_valid(self, joined: pandas.DataFrame) -> bool:
+        # whether the snapshot was made from the same inputs up to the closed month
+        envelopes = set(joined.index.get_level_values("envelope"))
+        if envelopes != set(self.state.index):
+            logging.info("snapshot invalidated: the envelopes have changed")
+            return False
+        fingerprints = fingerprint_inputs(joined, self.closed_month)
+        changed = [
+            k
+            for k in fingerprints.keys() | self.fingerprints.keys()
+            if fingerprints.get(k) != self.fingerprints.get(k)
+        ]
+        if len(changed) > 0:
+            logging.info(f"snapshot invalidated: inputs of {sorted(changed)} changed")
+            return False
+        return True
+
+    def save(
+        self,
+        first_month: int,
+        closed_month: int,
+        joined: pandas.DataFrame,
+        envelope_development: pandas.DataFrame,
+        sources: str = None,
+    ) -> None:
+        # only the state at the end of the closed month is stored, not the
+        # history of the months before
+        self.first_month = first_month
+        self.closed_month = closed_month
+        self.fingerprints = fingerprint_inputs(joined, closed_month)
+        self.sources = sources
+
+        months = joined.index.get_level_values("month")
+        budgets = joined.loc[months <= closed_month].groupby(level="envelope").budget
+        closing_month = envelope_development.query(f"month == {closed_month}")
+        self.state = pandas.DataFrame(
+            {
+                # the budget propagated into the following months
+                "budget": budgets.last(),
+                "cumsum": closing_month.set_index("envelope")["cumsum"],
+            }
+        ).reindex(joined.index.get_level_values("envelope").unique())
+        self.write()
+
+    def write(self) -> None:
+        contents = {
+            "first_month": format_month(self.first_month),
+            "closed_month": format_month(self.closed_month),
+            "fingerprints": self.fingerprints,
+            "sources": self.sources,
+            "state": self.state.rename_axis("envelope").reset_index().to_dict("list"),
+        }
+        # replace the previous snapshot atomically
+        with open(self.filename + ".tmp", "w") as f:
+            json.dump(contents, f)
+        os.replace(self.filename + ".tmp", self.filename)
+        logging.info(
+            f"snapshot of {self.state.shape[0]} envelopes closed at {format_month(self.closed_month)} written to {self.filename}"
+        )
@@ -2,10 +2,13 @@
 import json
 import pandas
 import logging
-import dateutil.parser as dateparser
 import datetime
-
-logging.basicConfig(encoding="utf-8", level=logging.DEBUG)
+from .date_parser import DateParser, parse_date
+from .dtypes import compact_statements, expand_statements
+from .envelope_hierarchy import EnvelopeHierarchy
+from .months import month_codes_from_dates
+from .parquet import iter_parquet_batches, read_parquet_columns
+from .profiling import stage
 
 
 AMT = "amount_field"
@@ -15,6 +18,18 @@ DEBIT_FLAG_FIELD = "debit_flag_field"
 DEBIT_FLAG = "debit_flag"
 FILENAME = "filename"
 SESSION = "session"
+EXTRACTION_MODE = "extraction_mode"
+CHUNKSIZE = "chunksize"
+CACHE = "cache"
+COMPACT_DTYPES = "compact_dtypes"
+
+# number of json objects handed to the extraction at once
+BATCH_SIZE = 10000
+
+# extraction modes: the original record-by-record loop or whole-frame column operations
+ROWS = "rows"
+COLUMNS = "columns"
+EXTRACTION_MODES = [ROWS, COLUMNS]
 
 
 class TransactionsReader(object):
@@ -23,10 +38,16 @@ class TransactionsReader(object):
             # Factory class has been instantiated: enter if in base class factory mode
             if kwargs["filename"].endswith(".json"):
                 return super().__new__(JSONTransactionsReader)
+            elif kwargs["filename"].endswith((".ndjson", ".jsonl")):
+                return super().__new__(NDJSONTransactionsReader)
             elif kwargs["filename"].endswith(".csv"):
                 return super().__new__(CSVTransactionsReader)
+            elif kwargs["filename"].endswith(".parquet"):
+                return super().__new__(ParquetTransactionsReader)
             else:
-                raise Exception("Transactions-input: Either .json or .csv-file needed.")
+                raise Exception(
+                    "Transactions-input: Either .json, .ndjson/.jsonl, .csv or .parquet-file needed."
+                )
         else:
             # one of the factory products has been instantiated directly
             return super().__new__(cls)
@@ -40,12 +61,31 @@ class TransactionsReader(object):
         debit_flag_field: str = False,
         debit_flag: str = None,
         session: str = None,
+        extraction_mode: str = ROWS,
+        chunksize: int = None,
+        cache=None,
+        compact_dtypes: bool = False,
         *args,
         **kwargs,
     ):
         allowed_keys = set(
-            [AMT, DATE, ENVELOPE, DEBIT_FLAG_FIELD, DEBIT_FLAG, FILENAME, SESSION]
+            [
+                AMT,
+                DATE,
+                ENVELOPE,
+                DEBIT_FLAG_FIELD,
+                DEBIT_FLAG,
+                FILENAME,
+                SESSION,
+                EXTRACTION_MODE,
+                CHUNKSIZE,
+                COMPACT_DTYPES,
+            ]
         )
+        if extraction_mode not in EXTRACTION_MODES:
+            raise ValueError(
+                f"Unknown extraction mode '{extraction_mode}'. Use one of {EXTRACTION_MODES}"
+            )
         self.__dict__.update((k, False) for k in allowed_keys)
         self.__dict__.update(
             {
@@ -56,21 +96,111 @@ class TransactionsReader(object):
                 DEBIT_FLAG_FIELD: debit_flag_field,
                 DEBIT_FLAG: debit_flag,
                 SESSION: session,
+                EXTRACTION_MODE: extraction_mode,
+                CHUNKSIZE: chunksize,
+                COMPACT_DTYPES: compact_dtypes,
             }
         )
         self.__dict__.update((k, v) for k, v in kwargs if k in allowed_keys)
 
-        self._extracted_contents = None
-
-        self._read_transactions()
+        # only the leaf envelopes are kept, parents are added on demand
+        self._leaf_statements = None
+        self.date_parser = DateParser()
+
+        with stage("transactions_reader", filename=filename) as record:
+            # unchanged files parsed with the same options are loaded from the cache
+            if cache is not None:
+                key = cache.key(filename, self._cache_options())
+                self._leaf_statements = cache.get(key)
+                if self._leaf_statements is not None:
+                    logging.info(f"transactions of {filename} loaded from cache")
+
+            if self._leaf_statements is None:
+                self._read_transactions()
+                if cache is not None:
+                    cache.put(key, self._leaf_statements)
+            if compact_dtypes:
+                # the cache keeps the plain representation
+                self._leaf_statements = compact_statements(self._leaf_statements)
+            record["rows"] = self._leaf_statements.shape[0]
+
+    def _cache_options(self) -> dict:
+        return {
+            **self.parse_options(),
+            # transactions set for the future are dropped relative to today
+            "today": datetime.date.today(),
+        }
+
+    def parse_options(self) -> dict:
+        # the options determining the statements read from a file
+        return {
+            "reader": type(self).__name__,
+            AMT: self.__dict__[AMT],
+            DATE: list(self.__dict__[DATE]),
+            ENVELOPE: self.__dict__[ENVELOPE],
+            DEBIT_FLAG_FIELD: self.__dict__[DEBIT_FLAG_FIELD],
+            DEBIT_FLAG: self.__dict__[DEBIT_FLAG],
+            CHUNKSIZE: bool(self.__dict__[CHUNKSIZE]),
+        }
 
     def get_statements(self) -> pandas.DataFrame:
-        return self._extracted_contents
+        # statements of the leaf envelopes, each followed by copies for its parents
+        return self.add_parent_envelopes_frame(expand_statements(self._leaf_statements))
+
+    def get_leaf_statements(self) -> pandas.DataFrame:
+        # statements as booked, without the copies for the parent envelopes.
+        # In streaming mode (chunksize set) these are (envelope, month) sums,
+        # with compact_dtypes in the compact dtypes of dtypes.py.
+        return self._leaf_statements
 
     def _read_transactions(self):
         raise NotImplementedError
 
-    def extract_contents(self, jsoncontents: list[dict]):
+    def _extract_batch(self, batch) -> pandas.DataFrame:
+        # leaf statements of a batch of raw transactions (a DataFrame or a list of
+        # json objects), in the configured extraction mode
+        mode = self.__dict__[EXTRACTION_MODE]
+        with stage("extract_contents", mode=mode) as record:
+            if mode == COLUMNS:
+                extracted = self.extract_contents_frame(
+                    pandas.DataFrame(batch), add_parents=False
+                )
+            else:
+                jsoncontents = (
+                    batch.to_dict("records") if hasattr(batch, "to_dict") else batch
+                )
+                extracted = pandas.DataFrame(
+                    self.extract_contents(jsoncontents, add_parents=False)
+                )
+            record["rows"] = extracted.shape[0]
+        return extracted
+
+    def _extract_batches(self, batches) -> pandas.DataFrame:
+        # extract batch by batch, so only one batch of raw transactions is in memory
+        extracted = [self._extract_batch(batch) for batch in batches]
+        if len(extracted) == 0:
+            return pandas.DataFrame()
+        return pandas.concat(extracted, ignore_index=True)
+
+    def _aggregate_batches(self, batches) -> pandas.DataFrame:
+        # streaming mode: each batch is extracted and reduced to (envelope, month)
+        # sums before the next one is read, so memory depends on the batch size
+        aggregated = aggregate_monthly_statements(pandas.DataFrame())
+        transactions_count = 0
+        for batch in batches:
+            transactions_count += len(batch)
+            monthly = aggregate_monthly_statements(self._extract_batch(batch))
+            aggregated = (
+                pandas.concat([aggregated, monthly])
+                .groupby(["envelope", "month"], as_index=False)
+                .agg({"amount": "sum"})
+            )
+        logging.info(
+            f"aggregated {transactions_count} transactions into {aggregated.shape[0]} envelope-months"
+        )
+        return aggregated
+
+    def extract_contents(self, jsoncontents: list[dict], add_parents: bool = True):
         extracted_contents = []
         ignored_due_tue_date_count = 0
 
@@ -94,7 +224,8 @@ class TransactionsReader(object):
                 continue
 
             extracted_contents.append(d)
-            self.add_parent_envelopes(extracted_contents, d)
+            if add_parents:
+                self.add_parent_envelopes(extracted_contents, d)
 
         logging.info(
             f"ignored {ignored_due_tue_date_count} transactions, set for future date"
@@ -107,7 +238,7 @@ class TransactionsReader(object):
 
         # adjust Credit/Debit with flag, if needed, using DEBIT_FLAG_FIELD & DEBIT_FLAG
         # e.g. Flag Field: BOOKINGTYPE , Debit Flag [String]: "DBT"
-        if self.__dict__[DEBIT_FLAG_FIELD] != False:
+        if self.__dict__[DEBIT_FLAG_FIELD]:
             if source[self.__dict__[DEBIT_FLAG_FIELD]] != self.__dict__[DEBIT_FLAG]:
                 target["amount"] = -target["amount"]
 
@@ -122,10 +253,69 @@ class TransactionsReader(object):
         # Extracts the date of the source dict using the supplied DATE key
         for date in self.__dict__[DATE]:
             if date in source:
-                target["date"] = dateparser.parse(source[date]).date()
+                target["date"] = parse_date(source[date])
                 ## valid date found no need to look at lower prio fields
                 break
 
+    def extract_contents_frame(
+        self, filecontents: pandas.DataFrame, add_parents: bool = True
+    ) -> pandas.DataFrame:
+        # column-wise counterpart of extract_contents: same output, whole-frame operations
+        extracted = pandas.DataFrame(index=filecontents.index)
+        extracted["amount"] = self._extract_amount_column(filecontents)
+        extracted["date"] = self._extract_date_column(filecontents)
+        extracted["envelope"] = self._extract_envelope_column(filecontents)
+
+        missing_date = extracted.date.isna()
+        for x in filecontents.loc[missing_date].to_dict("records"):
+            logging.error(f"No Date found for {x}")
+        extracted = extracted.loc[~missing_date]
+
+        # ignore bookings set for the future
+        in_future = extracted.date > datetime.date.today()
+        extracted = extracted.loc[~in_future]
+
+        logging.info(f"ignored {in_future.sum()} transactions, set for future date")
+        if add_parents:
+            return self.add_parent_envelopes_frame(extracted)
+        return extracted.reset_index(drop=True)
+
+    def _extract_amount_column(self, source: pandas.DataFrame) -> pandas.Series:
+        amount = source[self.__dict__[AMT]].astype(float)
+
+        # adjust Credit/Debit with flag, see _extract_amount
+        if self.__dict__[DEBIT_FLAG_FIELD]:
+            is_credit = (
+                source[self.__dict__[DEBIT_FLAG_FIELD]] != self.__dict__[DEBIT_FLAG]
+            )
+            amount = amount.where(~is_credit, -amount)
+        return amount
+
+    def _extract_envelope_column(self, source: pandas.DataFrame) -> pandas.Series:
+        if self.__dict__[ENVELOPE] not in source:
+            return pandas.Series("", index=source.index, dtype=object)
+        return source[self.__dict__[ENVELOPE]].fillna("")
+
+    def _extract_date_column(self, source: pandas.DataFrame) -> pandas.Series:
+        # coalesce the date fields in order of priority: the first non-empty one wins
+        slow_path_count = self.date_parser.slow_path_count
+        dates = self.date_parser.coalesce(source, self.__dict__[DATE])
+        logging.info(
+            f"{self.date_parser.slow_path_count - slow_path_count} dates did not match "
+            + f"the inferred formats {self.date_parser.formats} and were parsed by dateutil"
+        )
+        return dates
+
+    def add_parent_envelopes_frame(
+        self, extracted: pandas.DataFrame
+    ) -> pandas.DataFrame:
+        # column-wise counterpart of add_parent_envelopes: each row is followed by
+        # its parent envelopes, in the same order as the row loop produces them
+        if extracted.shape[0] == 0:
+            return extracted
+        hierarchy = EnvelopeHierarchy(extracted.envelope.unique())
+        return hierarchy.expand(extracted)
+
     def add_parent_envelopes(self, extracted_contents, d):
         try:
             hierarchy = d["envelope"].split(":")
@@ -139,6 +329,23 @@ class TransactionsReader(object):
             extracted_contents.append(dcopy)
 
 
+def aggregate_monthly_statements(statements: pandas.DataFrame) -> pandas.DataFrame:
+    # sum up statements per envelope and month (as month code, see months.py)
+    if statements.shape[0] == 0:
+        return pandas.DataFrame(
+            {
+                "envelope": pandas.Series(dtype=object),
+                "month": pandas.Series(dtype=int),
+                "amount": pandas.Series(dtype=float),
+            }
+        )
+    return (
+        statements.assign(month=month_codes_from_dates(statements.date))
+        .groupby(["envelope", "month"], as_index=False)
+        .agg({"amount": "sum"})
+    )
+
+
 class CSVTransactionsReader(TransactionsReader):
 
     """
@@ -156,19 +363,53 @@ class CSVTransactionsReader(TransactionsReader):
         """
 
         filepath = self.__dict__[FILENAME]
+        if self.__dict__[CHUNKSIZE]:
+            with pandas.read_csv(
+                filepath, chunksize=self.__dict__[CHUNKSIZE]
+            ) as chunks:
+                self._leaf_statements = self._aggregate_batches(chunks)
+            return
+
         with open(filepath, "r") as f:
             filecontents = pandas.read_csv(filepath)
-            jsoncontents = filecontents.to_dict("records")
 
-            extracted_contents = self.extract_contents(jsoncontents)
-            self._extracted_contents = pandas.DataFrame(extracted_contents)
-            del jsoncontents
+            self._leaf_statements = self._extract_batch(filecontents)
             del filecontents
 
 
+class ParquetTransactionsReader(TransactionsReader):
+    """
+    Parquet Reader class. Only the mapped fields are read from the file.
+    Args:
+        *args (list): list of arguments
+        **kwargs (dict): dict of keyword arguments
+    Attributes:
+        self
+    """
+
+    def _read_transactions(self):
+        """
+        Function.
+        """
+
+        filepath = self.__dict__[FILENAME]
+        columns = [self.__dict__[AMT], *self.__dict__[DATE], self.__dict__[ENVELOPE]]
+        if self.__dict__[DEBIT_FLAG_FIELD]:
+            columns.append(self.__dict__[DEBIT_FLAG_FIELD])
+
+        if self.__dict__[CHUNKSIZE]:
+            batches = iter_parquet_batches(
+                filepath, columns, batch_size=self.__dict__[CHUNKSIZE]
+            )
+            self._leaf_statements = self._aggregate_batches(batches)
+        else:
+            filecontents = read_parquet_columns(filepath, columns)
+            self._leaf_statements = self._extract_batch(filecontents)
+
+
 class JSONTransactionsReader(TransactionsReader):
     """
-    JSON Reader class.
+    JSON Reader class. Reads a top-level array of objects incrementally.
     Args:
         *args (list): list of arguments
         **kwargs (dict): dict of keyword arguments
@@ -183,10 +424,117 @@ class JSONTransactionsReader(TransactionsReader):
 
         filepath = self.__dict__[FILENAME]
         with open(filepath, "r") as f:
-            filecontents = f.readlines()
-            jsoncontents = json.loads("".join(filecontents))
+            batches = _batched(
+                self._iter_jsoncontents(f), self.__dict__[CHUNKSIZE] or BATCH_SIZE
+            )
+            if self.__dict__[CHUNKSIZE]:
+                self._leaf_statements = self._aggregate_batches(batches)
+            else:
+                self._leaf_statements = self._extract_batches(batches)
 
-            extracted_contents = self.extract_contents(jsoncontents)
-            self._extracted_contents = pandas.DataFrame(extracted_contents)
-            del jsoncontents
-            del filecontents
+    def _iter_jsoncontents(self, f):
+        return iter_json_array(f)
+
+
+class NDJSONTransactionsReader(JSONTransactionsReader):
+    """
+    Newline-delimited JSON Reader class: one object per line.
+    Args:
+        *args (list): list of arguments
+        **kwargs (dict): dict of keyword arguments
+    Attributes:
+        self
+    """
+
+    def _iter_jsoncontents(self, f):
+        return iter_ndjson(f)
+
+
+class RecordsTransactionsReader(TransactionsReader):
+    """
+    Reader of transactions given as json objects instead of a file, e.g. posted
+    to the server.
+    Args:
+        records (list): transactions as dicts with the fields of a json file
+        **kwargs (dict): keyword arguments of the TransactionsReader, the
+            filename only names the source
+    Attributes:
+        self
+    """
+
+    def __init__(self, records: list, **kwargs):
+        self._records = records
+        kwargs.setdefault(FILENAME, "<records>")
+        super().__init__(**kwargs)
+
+    def _read_transactions(self):
+        self._leaf_statements = self._extract_batches(
+            _batched(self._records, BATCH_SIZE)
+        )
+
+
+def iter_json_array(f, buffer_size: int = 2**16):
+    # yield the objects of a top-level json array one at a time, without reading
+    # the whole file into memory
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+    started = False
+
+    while True:
+        # skip whitespace and separators up to the next value
+        while position < len(buffer) and (
+            buffer[position].isspace() or (started and buffer[position] == ",")
+        ):
+            position += 1
+        if position == len(buffer):
+            if eof:
+                raise ValueError("JSON transactions: unexpected end of array")
+            buffer, position = f.read(buffer_size), 0
+            eof = buffer == ""
+            continue
+
+        if not started:
+            if buffer[position] != "[":
+                raise ValueError("JSON transactions: top-level array expected")
+            started = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+
+        try:
+            value, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError as e:
+            if eof:
+                raise e
+            value, end = None, None
+        if end is None or (end == len(buffer) and not eof):
+            # the value may continue in the next block of the file
+            more = f.read(buffer_size)
+            eof = more == ""
+            buffer, position = buffer[position:] + more, 0
+            continue
+
+        yield value
+        position = end
+
+
+def iter_ndjson(f):
+    # yield the objects of a newline-delimited json file one at a time
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _batched(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
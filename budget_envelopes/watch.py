@@ -0,0 +1,251 @@
+"""Watching a directory for new and changed budget and transaction files."""
+import hashlib
+import logging
+import os
+import time
+
+import pandas
+
+from .budget_reader import BUDGET_COLUMNS, BudgetReader
+from .dtypes import expand_statements
+from .envelope_stats_calculator import EnvelopeStatsCalculator
+from .ingestion import IngestionError, read_files
+from .server import EnvelopeService
+from .transactions_reader import TransactionsReader
+
+EXTENSIONS = (".csv", ".json", ".ndjson", ".jsonl", ".parquet")
+
+
+def file_hash(filename: str) -> str:
+    digest = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(2**20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_budget_file(filename: str) -> bool:
+    # budget files are told apart from transaction files by their header
+    if filename.endswith(".csv"):
+        with open(filename, "r", encoding="utf-8", errors="replace") as f:
+            columns = [c.strip() for c in f.readline().split(",")]
+    elif filename.endswith(".parquet"):
+        from .parquet import require_pyarrow
+
+        columns = require_pyarrow().read_schema(filename).names
+    else:
+        return False
+    return all(column in columns for column in BUDGET_COLUMNS)
+
+
+def appended_statements(
+    old: pandas.DataFrame, new: pandas.DataFrame
+) -> pandas.DataFrame:
+    # the statements appended to old in new, or None if new is not old with
+    # statements appended (e.g. a transaction was changed or removed)
+    if new.shape[0] < old.shape[0] or not new.columns.equals(old.columns):
+        return None
+    # (compact statements are compared as plain ones, their categories may differ)
+    head = expand_statements(new.iloc[: old.shape[0]]).reset_index(drop=True)
+    if not head.equals(expand_statements(old).reset_index(drop=True)):
+        return None
+    return new.iloc[old.shape[0] :].copy()
+
+
+class DirectoryWatcher(object):
+    """
+    Polls a directory for new, changed and removed input files. A file counts
+    as changed when its content hash changes, the hash is only taken when the
+    modification time or size changes.
+    Args:
+        directory (str): the directory watched (not recursive)
+        debounce (float): seconds without further changes before a burst of
+            changes is reported at once
+        interval (float): seconds between two polls
+    Attributes:
+        files (dict): filename -> (mtime_ns, size, content hash) of the files seen
+    """
+
+    def __init__(self, directory: str, debounce: float = 2.0, interval: float = 1.0):
+        self.directory = directory
+        self.debounce = debounce
+        self.interval = interval
+        self.files = {}
+
+    def _input_files(self) -> list:
+        return sorted(
+            entry.path
+            for entry in os.scandir(self.directory)
+            if entry.is_file()
+            and entry.name.endswith(EXTENSIONS)
+            and not entry.name.startswith(".")
+        )
+
+    def scan(self) -> tuple:
+        # (changed, removed) filenames since the last scan. New files are changed.
+        changed = []
+        present = set()
+        for filename in self._input_files():
+            present.add(filename)
+            try:
+                stat = os.stat(filename)
+                seen = self.files.get(filename)
+                if seen is not None and seen[:2] == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                content_hash = file_hash(filename)
+            except FileNotFoundError:
+                # removed while scanning
+                present.discard(filename)
+                continue
+            self.files[filename] = (stat.st_mtime_ns, stat.st_size, content_hash)
+            if seen is None or seen[2] != content_hash:
+                changed.append(filename)
+        removed = sorted(set(self.files) - present)
+        for filename in removed:
+            del self.files[filename]
+        return changed, removed
+
+    def wait(self) -> tuple:
+        # block until files changed, and return (changed, removed) once no
+        # further changes arrived within the debounce window
+        changed, removed = self.scan()
+        while len(changed) + len(removed) == 0:
+            time.sleep(self.interval)
+            changed, removed = self.scan()
+        quiet_since = time.monotonic()
+        while time.monotonic() - quiet_since < self.debounce:
+            time.sleep(min(self.interval, self.debounce))
+            more_changed, more_removed = self.scan()
+            if len(more_changed) + len(more_removed) > 0:
+                quiet_since = time.monotonic()
+            changed = [f for f in changed if f not in more_removed]
+            changed += [f for f in more_changed if f not in changed]
+            removed = [f for f in removed if f not in more_changed]
+            removed += [f for f in more_removed if f not in removed]
+        return sorted(changed), sorted(removed)
+
+
+class WatchedInputs(object):
+    """
+    The readers of all input files and the envelope stats calculated from them,
+    updated for new, changed and removed files. Only new files and transactions
+    appended to known files are added to the stats, recalculating the envelopes
+    and months they touch. Changed budgets, changed or removed transactions
+    recalculate all stats from the readers kept, parsing only the changed files.
+    Args:
+        calculator_options (dict): EnvelopeStatsCalculator arguments
+        reader_options (dict): TransactionsReader arguments of transaction files
+        budget_options (dict): BudgetReader arguments of budget files
+        chunksize (int): chunksize of the TransactionsReader of transaction files
+        budgets (dict): filename -> BudgetReader of the files read already
+        transactions (dict): filename -> TransactionsReader of the files read
+            already
+        cache (ParsedFileCache): cache of parsed files, or None
+        jobs (int): number of worker processes reading changed files
+    Attributes:
+        service (EnvelopeService): the envelope stats, None as long as there
+            are no budgets or no transactions
+    """
+
+    def __init__(
+        self,
+        calculator_options: dict,
+        reader_options: dict,
+        budgets: dict,
+        transactions: dict,
+        cache=None,
+        jobs: int = 1,
+        budget_options: dict = None,
+        chunksize: int = None,
+    ):
+        self.calculator_options = calculator_options
+        self.reader_options = reader_options
+        self.budget_options = budget_options or {}
+        self.chunksize = chunksize
+        self.budgets = dict(budgets)
+        self.transactions = dict(transactions)
+        self.cache = cache
+        self.jobs = jobs
+        self.service = None
+        self._recalculate()
+
+    def _recalculate(self) -> None:
+        if len(self.budgets) == 0 or len(self.transactions) == 0:
+            self.service = None
+            return
+        calculator = EnvelopeStatsCalculator(**self.calculator_options)
+        for reader in self.budgets.values():
+            calculator.add_budgets(reader)
+        for reader in self.transactions.values():
+            calculator.add_transactions(reader)
+        self.service = EnvelopeService(calculator, self.reader_options)
+
+    def _read(self, filenames: list) -> dict:
+        # filename -> reader of the files read successfully
+        tasks = []
+        for filename in filenames:
+            if is_budget_file(filename):
+                tasks.append(
+                    (
+                        BudgetReader,
+                        dict(
+                            filename=filename, cache=self.cache, **self.budget_options
+                        ),
+                    )
+                )
+            else:
+                tasks.append(
+                    (
+                        TransactionsReader,
+                        dict(
+                            filename=filename,
+                            chunksize=self.chunksize,
+                            cache=self.cache,
+                            **self.reader_options,
+                        ),
+                    )
+                )
+        try:
+            readers = read_files(tasks, self.jobs)
+        except IngestionError as e:
+            # e.g. files still being written, they are read again once changed
+            readers = e.readers
+            filenames = [f for f in filenames if f not in e.errors]
+        return dict(zip(filenames, readers))
+
+    def update(self, changed: list, removed: list) -> bool:
+        # returns whether the stats changed
+        recalculate = False
+        appended = []
+        for filename in removed:
+            if filename in self.budgets or filename in self.transactions:
+                self.budgets.pop(filename, None)
+                self.transactions.pop(filename, None)
+                recalculate = True
+
+        for filename, reader in self._read(changed).items():
+            if isinstance(reader, BudgetReader):
+                recalculate = True
+                self.budgets[filename] = reader
+                self.transactions.pop(filename, None)
+                continue
+            old = self.transactions.get(filename)
+            self.transactions[filename] = reader
+            if old is None:
+                appended.append(reader.get_leaf_statements())
+                continue
+            statements = appended_statements(
+                old.get_leaf_statements(), reader.get_leaf_statements()
+            )
+            if statements is None:
+                recalculate = True
+            else:
+                appended.append(statements)
+
+        if recalculate or self.service is None:
+            logging.info("input files changed, recalculating all envelopes")
+            self._recalculate()
+            return self.service is not None
+        for statements in appended:
+            self.service.add_statements(statements)
+        return any(statements.shape[0] > 0 for statements in appended)
@@ -19,25 +19,46 @@ def get_budgets() -> BudgetReader:
 
 
 @pytest.helpers.register
-def get_transactions_car() -> TransactionsReader:
+def get_transactions_car(
+    extraction_mode: str = "rows", chunksize: int = None
+) -> TransactionsReader:
     return TransactionsReader(
         filename="examples/transactions-car.csv",
         amount_field="amount",
         date_field=["transactiontime-us"],
         envelope_field="category",
+        extraction_mode=extraction_mode,
+        chunksize=chunksize,
     )
 
 
 @pytest.helpers.register
 def get_transactions_petstore(
-    date_field: list = ["bookingdate"], envelope_field="envelope"
+    date_field: list = ["bookingdate"],
+    envelope_field="envelope",
+    extraction_mode: str = "rows",
 ) -> TransactionsReader:
     return TransactionsReader(
         filename="examples/transactions-petstore.json",
         amount_field="amount",
         date_field=date_field,
         envelope_field=envelope_field,
+        extraction_mode=extraction_mode,
+    )
+
+
+@pytest.helpers.register
+def get_calculator(**kwargs) -> EnvelopeStatsCalculator:
+    calculator = EnvelopeStatsCalculator(
+        first_month=kwargs.pop("first_month", "2023-05"),
+        last_month=kwargs.pop("last_month", "2024-01"),
+        **kwargs,
     )
+    calculator.add_budgets(pytest.helpers.get_budgets())
+    calculator.add_budgets(pytest.helpers.get_envelope_adjustments())
+    calculator.add_transactions(pytest.helpers.get_transactions_petstore())
+    calculator.add_transactions(pytest.helpers.get_transactions_car())
+    return calculator
 
 
 if __name__ == "__main__":
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import filecmp
+
+from benchmarks.generate import generate
+from benchmarks.run import SCALES, run_scale
+
+
+class TestBenchmarks:
+    """Tests that the synthetic data is deterministic and all stages are measured."""
+
+    def test_generate_is_deterministic(self, tmp_path):
+        first = generate(str(tmp_path / "first"), transactions=500, seed=1)
+        second = generate(str(tmp_path / "second"), transactions=500, seed=1)
+        for name in first:
+            assert filecmp.cmp(first[name], second[name], shallow=False)
+
+    def test_run_scale(self, tmp_path):
+        results = run_scale(str(tmp_path), SCALES["tiny"], repeat=1)
+        assert list(results["stages"]) == [
+            "transactions_csv",
+            "transactions_json",
+            "budgets",
+            "merge_inputs",
+            "envelope_stats",
+            "transactions_csv_compact",
+            "transactions_json_compact",
+            "budgets_compact",
+            "merge_inputs_compact",
+            "envelope_stats_compact",
+            "write_json",
+            "write_csv",
+            "plot_month",
+        ]
+        assert all(m["seconds"] > 0 for m in results["stages"].values())
+        # the transactions in compact dtypes take less memory
+        reduction = results["memory_reduction"]
+        assert list(reduction) == [
+            "transactions_csv",
+            "transactions_json",
+            "budgets",
+            "merge_inputs",
+            "envelope_stats",
+        ]
+        assert reduction["transactions_csv"]["result_bytes"] > 0.5
+        assert reduction["merge_inputs"]["result_bytes"] > 0.5
+
+
+if __name__ == "__main__":
+    pass
@@ -2,10 +2,14 @@
 
 """Tests for `budget_envelopes` package."""
 
+import warnings
+
+import pandas
 import pytest
 
 from budget_envelopes.budget_reader import BudgetReader
 from budget_envelopes.envelope_stats_calculator import EnvelopeStatsCalculator
+from budget_envelopes.months import month_code
 
 
 class TestBudgetAdjustment:
@@ -58,6 +62,49 @@ class TestBudgetAdjustment:
         # Budget + adjustment of Car in 2023-11
         assert calculator.budgets.loc["Car", "2023-11"].sum() == 531
 
+    def test_transfers(self):
+        budgets = pytest.helpers.get_envelope_adjustments().budgets
+        december = month_code("2023-12")
+
+        # Car:Gas->Public Transport,2023-12,t,50: debit and credit leg
+        assert budgets.loc[("Car:Gas", december)].adjustment == -50
+        assert budgets.loc[("Car", december)].adjustment == -50
+        assert budgets.loc[("Public Transport", december)].adjustment == 50
+        # nothing changes in total
+        assert budgets.loc[("", december)].adjustment == 0
+
+    @pytest.mark.parametrize("compact_dtypes", [False, True])
+    def test_sparse_budgets(self, compact_dtypes):
+        dense = pytest.helpers.get_budgets()
+        sparse = BudgetReader(
+            filename="examples/envelope_budgets.csv",
+            sparse_budgets=True,
+            compact_dtypes=compact_dtypes,
+        )
+
+        assert len(sparse.budgets) < dense.budgets.shape[0]
+        pandas.testing.assert_frame_equal(sparse.get_budgets(), dense.budgets)
+
+        # Public Transport,2023-11,m,30: inherited by all later months
+        changes = sparse.budgets.changes.loc["Public Transport"]
+        assert changes.budget.tolist() == [3000 if compact_dtypes else 30]
+
+    def test_integer_budgets(self, tmp_path):
+        budgets_file = tmp_path / "budgets.csv"
+        budgets_file.write_text(
+            "envelope,month,period,budget,comments\n"
+            "Car,2023-01,y,1630,\n"
+            "Car:Gas,2023-01,m,80,\n"
+        )
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            budgets = BudgetReader(filename=str(budgets_file)).budgets
+        january = month_code("2023-01")
+        # 1630 / 12 = 135.83
+        assert budgets.loc[("Car:Gas", january)].budget == 80
+        assert budgets.loc[("Car", january)].budget == 136 + 80
+
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import os
+
+import pandas
+import pytest
+
+from budget_envelopes.budget_reader import BudgetReader
+from budget_envelopes.cache import PARQUET, PICKLE, SUFFIXES, ParsedFileCache
+from budget_envelopes.transactions_reader import TransactionsReader
+
+
+class TestParsedFileCache:
+    """Tests that parsed files are cached by content and options."""
+
+    def test_transactions_from_cache(self, tmp_path):
+        cache = ParsedFileCache(str(tmp_path))
+        kwargs = dict(
+            filename="examples/transactions-petstore.json",
+            amount_field="amount",
+            date_field=["bookingdate"],
+            envelope_field="envelope",
+            cache=cache,
+        )
+        parsed = TransactionsReader(**kwargs)
+        cached = TransactionsReader(**kwargs)
+        assert (cache.hits, cache.misses) == (1, 1)
+        pandas.testing.assert_frame_equal(
+            parsed.get_statements(), cached.get_statements()
+        )
+
+        # other field mappings are cached separately
+        TransactionsReader(**dict(kwargs, date_field=["transactiondate"]))
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_budgets_from_cache(self, tmp_path):
+        cache = ParsedFileCache(str(tmp_path))
+        budgets_file = tmp_path / "budgets.csv"
+        with open("examples/envelope_budgets.csv") as f:
+            budgets_file.write_text(f.read())
+
+        parsed = BudgetReader(filename=str(budgets_file), cache=cache)
+        cached = BudgetReader(filename=str(budgets_file), cache=cache)
+        pandas.testing.assert_frame_equal(parsed.budgets, cached.budgets)
+        assert cache.hits == 1
+
+        # a changed file is parsed again
+        with open(budgets_file, "a") as f:
+            f.write("Fun,2023-01,m,10,\n")
+        BudgetReader(filename=str(budgets_file), cache=cache)
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_parquet_entries(self, tmp_path):
+        pytest.importorskip("pyarrow")
+        cache = ParsedFileCache(str(tmp_path))
+        BudgetReader(filename="examples/envelope_budgets.csv", cache=cache)
+
+        # nothing is pickled if pyarrow is installed
+        (entry,) = os.listdir(tmp_path)
+        assert entry.endswith(".parquet")
+
+        # a frame parquet cannot store is not cached
+        cache.put("mixed", pandas.DataFrame({"envelope": ["Car", 1]}))
+        assert os.listdir(tmp_path) == [entry]
+
+    @pytest.mark.parametrize("entry_format", [PARQUET, PICKLE])
+    def test_corrupt_entry(self, tmp_path, entry_format):
+        if entry_format == PARQUET:
+            pytest.importorskip("pyarrow")
+        cache = ParsedFileCache(str(tmp_path), entry_format=entry_format)
+        budgets_file = "examples/envelope_budgets.csv"
+        parsed = BudgetReader(filename=budgets_file, cache=cache)
+        (entry,) = os.listdir(tmp_path)
+        truncated = (tmp_path / entry).read_bytes()[:20]
+
+        # empty, no entry, truncated, a pickle of a module that does not exist
+        corrupt = [b"", b"not an entry", truncated, b"cno_module\nX\n."]
+        for contents in corrupt:
+            (tmp_path / entry).write_bytes(contents)
+            # the file is parsed again and the entry replaced
+            reader = BudgetReader(filename=budgets_file, cache=cache)
+            pandas.testing.assert_frame_equal(reader.budgets, parsed.budgets)
+        assert (cache.hits, cache.misses) == (0, len(corrupt) + 1)
+        BudgetReader(filename=budgets_file, cache=cache)
+        assert cache.hits == 1
+
+    @pytest.mark.parametrize("entry_format", [PARQUET, PICKLE])
+    def test_lru_eviction(self, tmp_path, entry_format):
+        if entry_format == PARQUET:
+            pytest.importorskip("pyarrow")
+        suffix = SUFFIXES[entry_format]
+        frame = pandas.DataFrame({"amount": range(1000)})
+        cache = ParsedFileCache(str(tmp_path), entry_format=entry_format)
+        cache.put("a", frame)
+        entry_size = os.path.getsize(tmp_path / f"a{suffix}")
+
+        cache.max_bytes = 2 * entry_size
+        cache.put("b", frame)
+        os.utime(tmp_path / f"a{suffix}", (0, 0))
+        os.utime(tmp_path / f"b{suffix}", (1, 1))
+        cache.get("a")  # a is now the most recently used
+        cache.put("c", frame)
+
+        assert sorted(os.listdir(tmp_path)) == [f"a{suffix}", f"c{suffix}"]
+        cache.clear()
+        assert os.listdir(tmp_path) == []
+
+
+if __name__ == "__main__":
+    pass
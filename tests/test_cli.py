@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# cumulative import time of budget_envelopes.cli, in microseconds
+STARTUP_BUDGET = 300_000
+
+
+def _import_times(*args) -> dict:
+    # cumulative import time per imported module of `python -X importtime args`
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    import_times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                import_times[module.strip()] = int(cumulative)
+    return import_times
+
+
+class TestCliStartup:
+    """Tests that the cli starts without importing the heavy dependencies."""
+
+    def test_startup_budget(self):
+        import_times = _import_times("-c", "import budget_envelopes.cli")
+
+        assert "pandas" not in import_times
+        assert "matplotlib" not in import_times
+        assert import_times["budget_envelopes.cli"] < STARTUP_BUDGET
+
+    def test_help(self):
+        import_times = _import_times("-m", "budget_envelopes.cli", "--help")
+
+        assert "pandas" not in import_times
+        assert "matplotlib" not in import_times
+
+
+if __name__ == "__main__":
+    pass
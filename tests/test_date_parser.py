@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import datetime
+
+import pandas
+
+from budget_envelopes.date_parser import DateParser, infer_date_format
+
+
+class TestDateParser:
+    """Tests that date fields are parsed in bulk like dateutil would."""
+
+    def test_infer_date_format(self):
+        us_dates = pandas.Series(["11/10/2023 18:03", "12/11/2007 2:36"])
+        assert infer_date_format(us_dates) == "%m/%d/%Y %H:%M"
+        assert infer_date_format(pandas.Series(["2023-06-07"])) == "%Y-%m-%d"
+        assert infer_date_format(pandas.Series(["7th of June 2023"])) is None
+
+    def test_fallback_to_dateutil(self):
+        parser = DateParser()
+        values = pandas.Series(
+            ["2023-06-07", "2023-06-07", "June 8 2023", "2023-06-09", "June 8 2023"]
+        )
+        dates = parser.parse("bookingdate", values)
+
+        assert parser.formats["bookingdate"] == "%Y-%m-%d"
+        assert dates.tolist() == [
+            datetime.date(2023, 6, 7),
+            datetime.date(2023, 6, 7),
+            datetime.date(2023, 6, 8),
+            datetime.date(2023, 6, 9),
+            datetime.date(2023, 6, 8),
+        ]
+        # both rows with the unusual format took the slow path
+        assert parser.slow_path_count == 2
+
+    def test_coalesce_priority(self):
+        source = pandas.DataFrame(
+            {
+                "analysisdate": [None, "2023-07-01", None],
+                "transactiondate": ["2023-06-06 17:15:12", "2023-06-27 17:15:12", None],
+            }
+        )
+        dates = DateParser().coalesce(source, ["analysisdate", "transactiondate"])
+        assert dates.tolist()[:2] == [
+            datetime.date(2023, 6, 6),
+            datetime.date(2023, 7, 1),
+        ]
+        assert pandas.isna(dates.iloc[2])
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import pandas
+import pytest
+
+from budget_envelopes.budget_reader import BudgetReader
+from budget_envelopes.envelope_stats_calculator import EnvelopeStatsCalculator
+from budget_envelopes.dtypes import (
+    AMOUNT_CENTS,
+    EnvelopeDictionary,
+    compact_budgets,
+    compact_statements,
+    expand_budgets,
+    expand_statements,
+)
+
+
+class TestCompactDtypes:
+    """Tests that frames in compact dtypes give the same budgets, statements and stats."""
+
+    def test_statements_round_trip(self):
+        statements = pytest.helpers.get_transactions_car().get_leaf_statements()
+        compact = compact_statements(statements)
+
+        assert isinstance(compact.envelope.dtype, pandas.CategoricalDtype)
+        assert compact[AMOUNT_CENTS].dtype == "int64"
+        expanded = expand_statements(compact)
+        assert (expanded.envelope == statements.envelope).all()
+        assert (expanded.amount == statements.amount).all()
+        assert (expanded.date == pandas.to_datetime(statements.date)).all()
+
+    def test_budgets_round_trip(self):
+        budgets = pytest.helpers.get_envelope_adjustments().get_budgets()
+        compact = compact_budgets(budgets)
+
+        assert (
+            compact.budget.isna().to_numpy() == budgets.budget.isna().to_numpy()
+        ).all()
+        pandas.testing.assert_frame_equal(expand_budgets(compact), budgets)
+        reader = BudgetReader(
+            filename="examples/envelope_adjustments.csv", compact_dtypes=True
+        )
+        pandas.testing.assert_frame_equal(reader.get_budgets(), budgets)
+
+    def test_shared_envelope_dictionary(self):
+        envelopes = EnvelopeDictionary()
+        first = envelopes.encode(["Car", "Household:Pets"])
+        second = envelopes.encode(pandas.Categorical(["Household:Pets", None]))
+        # categoricals of different frames merge without turning into strings
+        merged = pandas.concat([envelopes.encode(first), second])
+        assert isinstance(merged.dtype, pandas.CategoricalDtype)
+        assert list(merged.astype(object)[:3]) == [
+            "Car",
+            "Household:Pets",
+            "Household:Pets",
+        ]
+        assert merged.isna().sum() == 1
+        assert list(envelopes.encode([None], na_value="NOT SET")) == ["NOT SET"]
+
+    def test_envelope_dictionary_per_calculator(self):
+        pytest.helpers.get_calculator(compact_dtypes=True).get_envelope_stats()
+        statements = pytest.helpers.get_transactions_car().get_leaf_statements()
+        names = set(statements.envelope.fillna("NOT SET"))
+
+        # the envelopes of earlier calculators and frames are not kept
+        compact = compact_statements(statements)
+        assert set(compact.envelope.cat.categories) == set(statements.envelope.dropna())
+        calculator = EnvelopeStatsCalculator(compact_dtypes=True)
+        calculator.add_statements(statements)
+        calculator._merge_inputs()
+        assert set(calculator._transactions.envelope.cat.categories) == names
+
+    @pytest.mark.parametrize("engine", ["groupby", "matrix"])
+    @pytest.mark.parametrize("preaggregate", [False, True])
+    def test_compact_stats_match_plain_stats(self, engine, preaggregate):
+        stats = pytest.helpers.get_calculator(engine=engine).get_envelope_stats()
+        calculator = pytest.helpers.get_calculator(
+            engine=engine, preaggregate=preaggregate, compact_dtypes=True
+        )
+        compact_stats = calculator.get_envelope_stats()
+
+        assert isinstance(
+            calculator._transactions.envelope.dtype, pandas.CategoricalDtype
+        )
+        assert list(calculator._transactions.columns) == [
+            "envelope",
+            "month",
+            AMOUNT_CENTS,
+        ]
+        pandas.testing.assert_frame_equal(compact_stats, stats)
+
+
+if __name__ == "__main__":
+    pass
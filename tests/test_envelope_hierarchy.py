@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import pandas
+import pytest
+
+from budget_envelopes.envelope_hierarchy import EnvelopeHierarchy, envelope_lineage
+
+
+class TestEnvelopeHierarchy:
+    """Tests that leaf envelopes are rolled up to their parents correctly."""
+
+    def test_incidence(self):
+        hierarchy = EnvelopeHierarchy(["Car:Gas:Diesel", "Car:Gas:Diesel", "Fun"])
+        assert hierarchy.incidence.shape[0] == 6
+        assert hierarchy.incidence.query("envelope == 'Car:Gas:Diesel'")[
+            "parent_envelope"
+        ].tolist() == ["Car:Gas:Diesel", "Car:Gas", "Car", ""]
+
+    def test_rollup_matches_expanded_statements(self):
+        reader = pytest.helpers.get_transactions_petstore()
+        leaf = reader.get_leaf_statements()
+        assert leaf.shape[0] == 5  # 5 transactions, no parent copies
+
+        expanded = (
+            reader.get_statements()
+            .assign(month=lambda df: df.date.apply(lambda d: f"{d:%Y-%m}"))
+            .groupby(["envelope", "month"])
+            .agg({"amount": "sum"})
+        )
+        leaf_monthly = (
+            leaf.assign(month=lambda df: df.date.apply(lambda d: f"{d:%Y-%m}"))
+            .groupby(["envelope", "month"])
+            .agg({"amount": "sum"})
+        )
+        rolled_up = EnvelopeHierarchy(leaf.envelope.unique()).rollup(leaf_monthly)
+
+        pandas.testing.assert_frame_equal(expanded, rolled_up.sort_index())
+        assert rolled_up.loc[("Household", "2023-06")].amount == 150
+
+    def test_rollup_min_count(self):
+        frame = pandas.DataFrame(
+            {
+                "envelope": ["Car:Gas", "Car:Gas", "Car:Insurance", "Fun"],
+                "month": [1, 2, 1, 1],
+                "budget": [10.0, None, 20.0, None],
+            }
+        ).set_index(["envelope", "month"])
+        hierarchy = EnvelopeHierarchy(["Car:Gas", "Car:Insurance", "Fun"])
+
+        expected = (
+            frame.reset_index()
+            .assign(envelope=lambda df: df.envelope.map(envelope_lineage))
+            .explode("envelope")
+            .groupby(["envelope", "month"])
+            .sum(min_count=1)
+        )
+        rolled_up = hierarchy.rollup(frame, min_count=1)
+        pandas.testing.assert_frame_equal(rolled_up, expected)
+        # months without any values stay empty
+        assert pandas.isna(rolled_up.loc[("Car", 2)].budget)
+        assert pandas.isna(rolled_up.loc[("Fun", 1)].budget)
+        assert rolled_up.loc[("Car", 1)].budget == 30
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import pandas
+import pytest
+
+
+class TestEnvelopeStatsCalculator:
+    """Tests that the envelope states are calculated correctly."""
+
+    def test_envelope_stats(self):
+        stats = pytest.helpers.get_calculator().get_envelope_stats()
+
+        # Household:Pets: 100 budget until June (propagated backwards to May),
+        # 150 from July on. 150 spent in June, 100 in July
+        pets = stats.loc["Household:Pets"]
+        assert pets.loc["2023-05"].state == 100
+        assert pets.loc["2023-06"].state_month == -50
+        assert pets.loc["2023-06"].state == 50
+        assert pets.loc["2023-07"].carryover == 50
+        assert pets.loc["2023-07"].state == 100
+
+    @pytest.mark.parametrize("first_month", ["2023-05", "2023-11"])
+    def test_matrix_engine_matches_groupby_engine(self, first_month):
+        groupby_stats = pytest.helpers.get_calculator(
+            first_month=first_month, engine="groupby"
+        ).get_envelope_stats()
+        matrix_stats = pytest.helpers.get_calculator(
+            first_month=first_month, engine="matrix"
+        ).get_envelope_stats()
+
+        pandas.testing.assert_frame_equal(
+            groupby_stats, matrix_stats, check_dtype=False, check_exact=True
+        )
+
+    def test_inputs_are_merged_lazily(self):
+        calculator = pytest.helpers.get_calculator()
+        # only registered so far
+        assert calculator._transactions is None
+        assert len(calculator._transaction_inputs) == 2
+
+        stats = calculator.get_envelope_stats()
+        assert calculator._transaction_inputs == []
+        assert calculator._transactions.shape[0] == 7  # 5 petstore + 2 car transactions
+
+        preaggregated_stats = pytest.helpers.get_calculator(
+            preaggregate=True
+        ).get_envelope_stats()
+        pandas.testing.assert_frame_equal(stats, preaggregated_stats)
+
+    def test_last_month(self):
+        calculator = pytest.helpers.get_calculator()
+        assert calculator.last_month == "2024-01"
+
+        calculator = pytest.helpers.get_calculator(last_month=None)
+        assert calculator.last_month is None
+        calculator.get_envelope_stats()
+        assert calculator.last_month == pandas.Timestamp.today().strftime("%Y-%m")
+
+    def test_parents_are_added_up_in_cents(self):
+        calculator = pytest.helpers.get_calculator()
+        calculator.get_envelope_stats()
+        month = calculator._first_month
+        transactions = pandas.DataFrame(
+            {
+                "envelope": ["Fun:Books", "Fun:Games"],
+                "month": [month, month],
+                "amount": [0.1, 0.2],
+            }
+        )
+
+        joined = calculator._join_inputs(transactions, calculator._budgets)
+        # as floats, 0.1 + 0.2 == 0.30000000000000004
+        assert joined.loc[("Fun", month), "amount"] == 0.3
+        assert joined.loc[("", month), "amount"] == 0.3
+
+    @pytest.mark.parametrize("engine", ["groupby", "matrix"])
+    @pytest.mark.parametrize(
+        "envelopes,months",
+        [
+            # Household:Pets is budgeted from June on, propagated back to May
+            ("Household", ("2023-05", "2023-05")),
+            ("Car", ("2023-11", None)),
+            ("", (None, "2023-08")),
+            (["Car", "Household:Pets"], ("2023-07", "2023-12")),
+        ],
+    )
+    def test_scoped_stats_match_all_stats(self, engine, envelopes, months):
+        calculator = pytest.helpers.get_calculator(engine=engine)
+        stats = calculator.get_envelope_stats()
+        scoped = calculator.get_envelope_stats(envelopes=envelopes, months=months)
+
+        names = stats.index.get_level_values("envelope")
+        stats_months = stats.index.get_level_values("month")
+        if isinstance(envelopes, str):
+            selected = (names == envelopes) | names.str.startswith(envelopes + ":")
+            selected |= envelopes == ""
+        else:
+            selected = names.isin(envelopes)
+        if months[0] is not None:
+            selected &= stats_months >= months[0]
+        if months[1] is not None:
+            selected &= stats_months <= months[1]
+        assert scoped.shape[0] > 0
+        pandas.testing.assert_frame_equal(scoped, stats.loc[selected])
+
+
+if __name__ == "__main__":
+    pass
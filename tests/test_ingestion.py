@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import pandas
+import pytest
+
+from budget_envelopes.budget_reader import BudgetReader
+from budget_envelopes.ingestion import IngestionError, read_files
+from budget_envelopes.transactions_reader import TransactionsReader
+
+CAR = dict(
+    filename="examples/transactions-car.csv",
+    amount_field="amount",
+    date_field=["transactiontime-us"],
+    envelope_field="category",
+)
+PETSTORE = dict(
+    filename="examples/transactions-petstore.json",
+    amount_field="amount",
+    date_field=["bookingdate"],
+    envelope_field="envelope",
+)
+
+
+class TestIngestion:
+    """Tests that files read in parallel equal files read one after another."""
+
+    def test_parallel_equals_serial(self):
+        tasks = [
+            (BudgetReader, dict(filename="examples/envelope_budgets.csv")),
+            (TransactionsReader, PETSTORE),
+            (TransactionsReader, CAR),
+        ]
+        serial = read_files(tasks, jobs=1)
+        parallel = read_files(tasks, jobs=3)
+
+        # same readers in the order of the tasks
+        assert [type(r) for r in parallel] == [type(r) for r in serial]
+        pandas.testing.assert_frame_equal(parallel[0].budgets, serial[0].budgets)
+        for serial_reader, parallel_reader in zip(serial[1:], parallel[1:]):
+            pandas.testing.assert_frame_equal(
+                parallel_reader.get_statements(), serial_reader.get_statements()
+            )
+
+    @pytest.mark.parametrize("jobs", [1, 2])
+    def test_errors_per_file(self, jobs):
+        tasks = [
+            (TransactionsReader, dict(CAR, filename="examples/missing.csv")),
+            (TransactionsReader, PETSTORE),
+            (TransactionsReader, dict(CAR, filename="examples/missing.json")),
+        ]
+        with pytest.raises(IngestionError) as e:
+            read_files(tasks, jobs=jobs)
+        # all failing files are reported, not only the first
+        assert list(e.value.errors) == ["examples/missing.csv", "examples/missing.json"]
+
+
+if __name__ == "__main__":
+    pass
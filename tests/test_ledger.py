@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import pandas
+import pytest
+
+from budget_envelopes.envelope_stats_calculator import EnvelopeStatsCalculator
+from budget_envelopes.ledger import Ledger
+from budget_envelopes.transactions_reader import TransactionsReader
+
+
+def _fill_ledger(ledger: Ledger) -> None:
+    ledger.add_budgets(pytest.helpers.get_budgets())
+    ledger.add_budgets(pytest.helpers.get_envelope_adjustments())
+    ledger.add_transactions(pytest.helpers.get_transactions_petstore())
+    ledger.add_transactions(pytest.helpers.get_transactions_car())
+
+
+def _ledger_stats(ledger: Ledger) -> pandas.DataFrame:
+    calculator = EnvelopeStatsCalculator(
+        first_month="2023-05", last_month="2024-01", engine="matrix"
+    )
+    calculator.add_ledger(ledger)
+    return calculator.get_envelope_stats()
+
+
+class TestLedger:
+    """Tests the stats calculated from the ledger and idempotent inserts."""
+
+    def test_stats_equal_files(self, tmp_path):
+        expected = pytest.helpers.get_calculator(engine="matrix").get_envelope_stats()
+
+        with Ledger(str(tmp_path / "ledger.sqlite")) as ledger:
+            _fill_ledger(ledger)
+            pandas.testing.assert_frame_equal(_ledger_stats(ledger), expected)
+
+        # persisted, and inserting the same files again adds nothing
+        with Ledger(str(tmp_path / "ledger.sqlite")) as ledger:
+            _fill_ledger(ledger)
+            pandas.testing.assert_frame_equal(_ledger_stats(ledger), expected)
+
+    def test_idempotent_inserts(self):
+        with Ledger(":memory:") as ledger:
+            car = pytest.helpers.get_transactions_car()
+            assert ledger.add_transactions(car) == 2
+            assert ledger.add_transactions(car) == 0
+            # the same export under another name
+            statements = car.get_leaf_statements()
+            assert ledger.insert_statements(statements, "car-copy.csv") == 0
+            assert ledger.insert_statements(statements.iloc[:1], "car-1.csv") == 1
+
+            budgets = pytest.helpers.get_budgets()
+            ledger.add_budgets(budgets)
+            ledger.add_budgets(budgets)
+            pandas.testing.assert_frame_equal(
+                ledger.get_budgets(), budgets.get_budgets().sort_index()
+            )
+
+    def test_edited_file_replaces_its_statements(self, tmp_path):
+        filename = str(tmp_path / "transactions-car.csv")
+
+        def read_car(amount: str) -> TransactionsReader:
+            with open("examples/transactions-car.csv") as f:
+                contents = f.read().replace("1873.26", amount)
+            with open(filename, "w") as f:
+                f.write(contents)
+            return TransactionsReader(
+                filename=filename,
+                amount_field="amount",
+                date_field=["transactiontime-us"],
+                envelope_field="category",
+            )
+
+        with Ledger(":memory:") as ledger:
+            ledger.add_budgets(pytest.helpers.get_budgets())
+            ledger.add_budgets(pytest.helpers.get_envelope_adjustments())
+            ledger.add_transactions(pytest.helpers.get_transactions_petstore())
+            ledger.add_transactions(read_car("1873.26"))
+            # the amount of one transaction changed
+            car = read_car("1900.5")
+            assert ledger.add_transactions(car) == 2
+            assert ledger._connection.execute(
+                "SELECT COUNT(*) FROM exports"
+            ).fetchone() == (2,)
+
+            calculator = EnvelopeStatsCalculator(
+                first_month="2023-05", last_month="2024-01", engine="matrix"
+            )
+            calculator.add_budgets(pytest.helpers.get_budgets())
+            calculator.add_budgets(pytest.helpers.get_envelope_adjustments())
+            calculator.add_transactions(pytest.helpers.get_transactions_petstore())
+            calculator.add_transactions(car)
+            pandas.testing.assert_frame_equal(
+                _ledger_stats(ledger), calculator.get_envelope_stats()
+            )
+
+    def test_shared_export_is_kept(self):
+        with Ledger(":memory:") as ledger:
+            statements = pytest.helpers.get_transactions_car().get_leaf_statements()
+            total = statements.amount.sum()
+            assert ledger.insert_statements(statements, "a.csv") == 2
+            # b.csv has the same statements as a.csv, they are stored once
+            assert ledger.insert_statements(statements, "b.csv") == 0
+            assert ledger.monthly_statements().amount.sum() == pytest.approx(total)
+
+            # a.csv changes, the statements of b.csv are kept
+            assert ledger.insert_statements(statements.iloc[:1], "a.csv") == 1
+            assert ledger.monthly_statements().amount.sum() == pytest.approx(
+                total + statements.amount.iloc[0]
+            )
+
+            # once b.csv changes too, the export they shared is deleted
+            assert ledger.insert_statements(statements.iloc[1:], "b.csv") == 1
+            assert ledger.monthly_statements().amount.sum() == pytest.approx(total)
+            assert ledger._connection.execute(
+                "SELECT COUNT(*) FROM exports"
+            ).fetchone() == (2,)
+
+    def test_monthly_statements(self):
+        with Ledger(":memory:") as ledger:
+            _fill_ledger(ledger)
+            statements = ledger.monthly_statements(first_month=24280)
+
+            assert statements.month.min() >= 24280
+            assert not statements.duplicated(["envelope", "month"]).any()
+            plan = ledger._connection.execute(
+                "EXPLAIN QUERY PLAN SELECT envelope, month, SUM(amount) "
+                + "FROM statements GROUP BY envelope, month"
+            ).fetchall()
+            assert "COVERING INDEX statements_envelope_month" in str(plan)
+
+
+if __name__ == "__main__":
+    pass
@@ -1,3 +1,14 @@
+import pandas
+import pytest
+
+from budget_envelopes.months import (
+    format_month,
+    format_months,
+    month_code,
+    month_codes,
+    month_range,
+)
+
 first_month = "2023-10"
 last_month = "2024-01"
 
@@ -22,6 +33,31 @@ class TestBudgetAdjustment:
             print(f"current {current_month_string}")
             all_months.append(current_month_string)
 
+    def test_month_codes(self):
+        assert month_code(first_month) == 2023 * 12 + 9
+        assert format_month(month_code(last_month)) == last_month
+        codes = month_codes(pandas.Series([first_month, last_month]))
+        assert list(format_months(codes)) == [first_month, last_month]
+
+    def test_month_range(self):
+        months = month_range(month_code(first_month), month_code(last_month))
+        assert list(format_months(months)) == [
+            "2023-10",
+            "2023-11",
+            "2023-12",
+            "2024-01",
+        ]
+        with pytest.raises(ValueError):
+            month_range(month_code(last_month), month_code(first_month))
+
+    def test_fill_missing_months_in_stats(self):
+        # Living:Power has a budget in 2023-01 only, but is listed for all months
+        stats = pytest.helpers.get_calculator(engine="groupby").get_envelope_stats()
+        power_months = stats.loc["Living:Power"].index.tolist()
+        assert power_months == list(
+            format_months(month_range(month_code("2023-05"), month_code("2024-01")))
+        )
+
 
 if __name__ == "__main__":
     pass
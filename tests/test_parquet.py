@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import pandas
+import pytest
+
+from budget_envelopes.budget_reader import BudgetReader
+from budget_envelopes.transactions_reader import TransactionsReader
+
+pytest.importorskip("pyarrow")
+
+
+def _petstore_parquet(path, typed_dates: bool = False) -> str:
+    contents = pandas.read_json(
+        "examples/transactions-petstore.json", convert_dates=False
+    )
+    if typed_dates:
+        contents["bookingdate"] = pandas.to_datetime(contents.bookingdate)
+    filename = str(path / "transactions-petstore.parquet")
+    contents.to_parquet(filename)
+    return filename
+
+
+class TestParquet:
+    """Tests that parquet files are read like their json and csv counterparts."""
+
+    @pytest.mark.parametrize("typed_dates", [False, True])
+    @pytest.mark.parametrize("chunksize", [None, 2])
+    def test_parquettransactions(self, tmp_path, typed_dates, chunksize):
+        expected = pytest.helpers.get_transactions_petstore(extraction_mode="columns")
+        reader = TransactionsReader(
+            filename=_petstore_parquet(tmp_path, typed_dates),
+            amount_field="amount",
+            date_field=["bookingdate"],
+            envelope_field="envelope",
+            extraction_mode="columns",
+            chunksize=chunksize,
+        )
+        statements = reader.get_statements()
+        if chunksize is None:
+            pandas.testing.assert_frame_equal(
+                statements.reset_index(drop=True),
+                expected.get_statements().reset_index(drop=True),
+            )
+        else:
+            # streaming keeps only the monthly sums
+            assert statements.amount.sum() == expected.get_statements().amount.sum()
+
+    def test_parquetbudgets(self, tmp_path):
+        filename = str(tmp_path / "envelope_budgets.parquet")
+        pandas.read_csv("examples/envelope_budgets.csv").to_parquet(filename)
+
+        pandas.testing.assert_frame_equal(
+            BudgetReader(filename=filename).budgets,
+            pytest.helpers.get_budgets().budgets,
+        )
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import os
+
+import pandas
+import pytest
+
+from budget_envelopes.plot import bar_geometry, plot_months
+
+
+class TestPlot:
+    """Tests that the monthly plots are rendered and unchanged months skipped."""
+
+    def test_bar_geometry(self):
+        envelopes = pandas.DataFrame(
+            {
+                "envelope": ["Car", "Household", "Pets"],
+                "budget": [100.0, 60.0, 50.0],
+                "carryover": [-100.0, 20.0, 0.0],
+                "state": [-30.0, 40.0, 50.0],
+            }
+        )
+        geometry = bar_geometry(envelopes)
+
+        # bars are in descending envelope order
+        assert geometry.envelope.tolist() == ["Pets", "Household", "Car"]
+        assert geometry.state_pct.tolist() == [100, 50, 0]
+        assert geometry.budget_pct.tolist() == [100, 75, 0]
+        assert geometry.carryover_pos_pct.tolist() == [0, 25, 0]
+        assert geometry.carryover_neg_pct.tolist() == [0, 0, 50]
+        assert geometry.total_budget_label.tolist() == [
+            "50 CHF",
+            "60 + 20 CHF",
+            "100 - 100 CHF",
+        ]
+        assert geometry.state_label.tolist()[0] == " 50.0 CHF"
+
+    @pytest.mark.parametrize("jobs", [1, 2])
+    def test_skip_unchanged_months(self, tmp_path, jobs):
+        stats = pytest.helpers.get_calculator().get_envelope_stats().reset_index()
+        plots = {
+            str(tmp_path / f"stats-{month}.png"): stats.loc[stats.month == month]
+            for month in ["2023-11", "2023-12", "2024-01"]
+        }
+        manifest_file = str(tmp_path / "stats-plots.json")
+
+        assert plot_months(plots, jobs, manifest_file) == list(plots)
+        assert all(os.path.exists(plotfilename) for plotfilename in plots)
+        # nothing changed
+        assert plot_months(plots, jobs, manifest_file) == []
+
+        # only the changed month is plotted again
+        changed = str(tmp_path / "stats-2024-01.png")
+        plots[changed] = plots[changed].assign(state=plots[changed].state + 1)
+        assert plot_months(plots, jobs, manifest_file) == [changed]
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import json
+import tracemalloc
+
+import pytest
+
+from budget_envelopes import profiling
+
+
+class TestProfiling:
+    """Tests that the stages are recorded only while profiling is enabled."""
+
+    def test_disabled(self):
+        assert profiling.disable() is None
+        # one shared no-op stage, nothing recorded
+        assert profiling.stage("a") is profiling.stage("b")
+        with profiling.stage("a") as record:
+            record["rows"] = 1
+
+    def test_stages(self, tmp_path):
+        profiling.enable(cprofile=True)
+        try:
+            pytest.helpers.get_calculator().get_envelope_stats()
+        finally:
+            profiler = profiling.disable()
+
+        stages = [record["stage"] for record in profiler.stages]
+        assert stages.count("transactions_reader") == 2
+        assert stages.count("add_transactions") == 2
+        assert stages[-1] == "get_envelope_stats"
+        summary = profiler.summary()
+        # rows of the leaf statements: 5 petstore + 2 car transactions
+        assert summary["transactions_reader"]["rows"] == 7
+        assert summary["get_envelope_stats"]["wall_seconds"] > 0
+
+        profiler.write(str(tmp_path / "profile.json"))
+        with open(tmp_path / "profile.json") as f:
+            assert json.load(f)["summary"] == json.loads(json.dumps(summary))
+        assert (tmp_path / "profile.prof").exists()
+
+    def test_peak_memory_per_stage(self):
+        profiling.enable()
+        try:
+            with profiling.stage("outer"):
+                with profiling.stage("large"):
+                    block = bytearray(10 * 1024**2)
+                    del block
+                with profiling.stage("small"):
+                    pass
+        finally:
+            profiler = profiling.disable()
+
+        peaks = {record["stage"]: record["peak_bytes"] for record in profiler.stages}
+        assert peaks["large"] >= 10 * 1024**2
+        # not the peak of the stage before, but of the stage itself
+        assert peaks["small"] < 1024**2
+        # the enclosing stage includes the peak of its inner stages
+        assert peaks["outer"] >= peaks["large"]
+        assert not tracemalloc.is_tracing()
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+from budget_envelopes.server import EnvelopeService, make_server
+from budget_envelopes.transactions_reader import RecordsTransactionsReader
+
+READER_OPTIONS = dict(
+    amount_field="amount",
+    date_field=["bookingdate"],
+    envelope_field="envelope",
+    extraction_mode="columns",
+)
+NEW_TRANSACTIONS = [
+    {"bookingdate": "2023-12-03", "amount": "20", "envelope": "Household:Pets"},
+    {"bookingdate": "2024-01-10", "amount": "5.5", "envelope": "Household:Pets"},
+]
+
+
+@pytest.fixture
+def server():
+    service = EnvelopeService(
+        pytest.helpers.get_calculator(engine="matrix"), READER_OPTIONS
+    )
+    server = make_server(service, port=0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _request(server, path, records=None):
+    host, port = server.server_address[:2]
+    data = None if records is None else json.dumps(records).encode("utf-8")
+    with urllib.request.urlopen(f"http://{host}:{port}{path}", data=data) as r:
+        return json.load(r)
+
+
+class TestServer:
+    """Tests the envelope queries and posting transactions over http."""
+
+    def test_queries(self, server):
+        stats = server.service.stats
+
+        state = _request(server, "/state")
+        assert {row["month"] for row in state} == {"2024-01"}
+        assert len(state) == stats.query("month == '2024-01'").shape[0]
+
+        history = _request(server, "/envelopes/Household%3APets/history")
+        assert [row["month"] for row in history] == list(
+            stats.loc["Household:Pets"].index
+        )
+        assert "Household:Pets" in _request(server, "/envelopes")
+        assert len(_request(server, "/months/2023-08")) > 0
+
+        with pytest.raises(urllib.error.HTTPError) as e:
+            _request(server, "/envelopes/Unknown/history")
+        assert e.value.code == 404
+        with pytest.raises(urllib.error.HTTPError) as e:
+            _request(server, "/months/notamonth")
+        assert e.value.code == 400
+
+    def test_post_transactions(self, server):
+        before = server.service.stats.copy()
+
+        result = _request(server, "/transactions", NEW_TRANSACTIONS)
+        assert result["added"] == 2
+        assert result["envelopes"] == ["", "Household", "Household:Pets"]
+        assert result["from_month"] == "2023-12"
+
+        stats = server.service.stats
+        assert (
+            stats.loc[("Household:Pets", "2024-01"), "state"]
+            == before.loc[("Household:Pets", "2024-01"), "state"] - 26
+        )
+        assert stats.loc["Car"].equals(before.loc["Car"])
+
+        # same as calculating all envelopes from scratch
+        calculator = pytest.helpers.get_calculator(engine="matrix")
+        calculator.add_transactions(
+            RecordsTransactionsReader(records=NEW_TRANSACTIONS, **READER_OPTIONS)
+        )
+        assert stats.equals(calculator.get_envelope_stats())
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import json
+
+import pandas
+import pytest
+from click.testing import CliRunner
+
+from budget_envelopes.cli import cli
+from budget_envelopes.envelope_stats_calculator import EnvelopeStatsCalculator
+from budget_envelopes.months import month_code
+from budget_envelopes.snapshot import MonthCloseSnapshot
+
+
+class TestMonthCloseSnapshot:
+    """Tests that closed months are continued from snapshots correctly."""
+
+    def test_continue_from_snapshot(self, tmp_path, caplog, monkeypatch):
+        snapshot_file = str(tmp_path / "snapshot.json")
+        expected = pytest.helpers.get_calculator(engine="groupby").get_envelope_stats()
+        months = expected.index.get_level_values("month")
+
+        # close the months up to 2023-09, then up to 2023-12
+        pytest.helpers.get_calculator(
+            last_month="2023-10", snapshot_file=snapshot_file
+        ).get_envelope_stats()
+        snapshot = MonthCloseSnapshot(snapshot_file)
+        assert snapshot.load() and snapshot.closed_month == month_code("2023-09")
+
+        # the input files are unchanged, their closed months are not checked again
+        monkeypatch.setattr(MonthCloseSnapshot, "is_valid", None)
+        for from_month in ["2023-10", "2024-01"]:
+            with caplog.at_level("INFO"):
+                stats = pytest.helpers.get_calculator(
+                    snapshot_file=snapshot_file
+                ).get_envelope_stats(months=(from_month, None))
+            assert "continuing from snapshot" in caplog.text
+            pandas.testing.assert_frame_equal(
+                expected.loc[months >= from_month],
+                stats,
+                check_dtype=False,
+                check_exact=True,
+            )
+            caplog.clear()
+        assert snapshot.load() and snapshot.closed_month == month_code("2023-12")
+
+        # the history of the closed months is not stored, but calculated again
+        stats = pytest.helpers.get_calculator(
+            snapshot_file=snapshot_file
+        ).get_envelope_stats()
+        pandas.testing.assert_frame_equal(
+            expected, stats, check_dtype=False, check_exact=True
+        )
+
+    def test_invalidate_snapshot(self, tmp_path, caplog):
+        snapshot_file = str(tmp_path / "snapshot.json")
+        calculator = EnvelopeStatsCalculator(
+            first_month="2023-05", last_month="2024-01", snapshot_file=snapshot_file
+        )
+        calculator.add_budgets(pytest.helpers.get_budgets())
+        calculator.add_transactions(pytest.helpers.get_transactions_petstore())
+        calculator.get_envelope_stats()
+
+        # the car transaction of 2023-11 changes a closed month
+        with caplog.at_level("INFO"):
+            stats = pytest.helpers.get_calculator(
+                snapshot_file=snapshot_file
+            ).get_envelope_stats(months=("2024-01", None))
+        assert "snapshot invalidated" in caplog.text
+
+        expected = pytest.helpers.get_calculator().get_envelope_stats(
+            months=("2024-01", None)
+        )
+        pandas.testing.assert_frame_equal(expected, stats, check_dtype=False)
+
+    def test_cli_writes_state_from_snapshot(self, tmp_path, caplog):
+        output_file = str(tmp_path / "envelope-stats.json")
+        args = ["-b", "examples/envelope_budgets.csv"]
+        args += ["-b", "examples/envelope_adjustments.csv"]
+        args += ["-t", "examples/transactions-petstore.json"]
+        args += ["-$", "amount", "-D", "bookingdate", "-E", "envelope"]
+        args += ["--first-month", "2023-05", "--last-month", "2024-01"]
+        args += ["--snapshot-file", str(tmp_path / "snapshot.json")]
+        args += ["-o", output_file, "--no-cache"]
+
+        states = []
+        for _ in range(2):
+            with caplog.at_level("INFO"):
+                result = CliRunner().invoke(cli, args)
+            assert result.exit_code == 0, result.output
+            with open(output_file) as f:
+                states.append(json.load(f))
+        # the second run continues from the months closed by the first one
+        assert "continuing from snapshot" in caplog.text
+        assert {row["month"] for row in states[1]} == {"2024-01"}
+        assert states[0] == states[1]
+
+
+if __name__ == "__main__":
+    pass
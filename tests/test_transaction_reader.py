@@ -3,9 +3,14 @@
 """Tests for `budget_envelopes` package."""
 
 
+import io
+import json
+
+import pandas
 import pytest
 
-from budget_envelopes.transactions_reader import TransactionsReader
+from budget_envelopes.months import month_code
+from budget_envelopes.transactions_reader import TransactionsReader, iter_json_array
 
 
 class TestTransactionReader:
@@ -47,6 +52,108 @@ class TestTransactionReader:
 
         assert analysisdates[2].day == 1 and analysisdates[2].month == 7
 
+    @pytest.mark.parametrize(
+        "date_field",
+        [
+            ["bookingdate"],
+            ["analysisdate", "transactiondate"],
+            ["missing", "bookingdate"],
+        ],
+    )
+    def test_columns_extraction_matches_rows_json(self, date_field):
+        rows = pytest.helpers.get_transactions_petstore(date_field=date_field)
+        columns = pytest.helpers.get_transactions_petstore(
+            date_field=date_field, extraction_mode="columns"
+        )
+        pandas.testing.assert_frame_equal(
+            rows.get_statements(), columns.get_statements(), check_dtype=False
+        )
+
+    def test_columns_extraction_matches_rows_csv(self):
+        rows = pytest.helpers.get_transactions_car()
+        columns = pytest.helpers.get_transactions_car(extraction_mode="columns")
+        pandas.testing.assert_frame_equal(
+            rows.get_statements(), columns.get_statements(), check_dtype=False
+        )
+
+    def test_columns_extraction_debit_flag_and_missing_envelope(self):
+        reader = pytest.helpers.get_transactions_car(extraction_mode="columns")
+        contents = pandas.DataFrame(
+            {
+                "amount": ["10", "20.5", "3"],
+                "type": ["DBT", "CRD", "DBT"],
+                "booked": ["2023-01-02", None, "2999-01-01"],
+                "valuta": ["2023-01-01", "2023-02-03", None],
+                "category": ["Car:Gas", None, "Car"],
+            }
+        )
+        reader.__dict__.update(
+            {
+                "date_field": ["booked", "valuta"],
+                "debit_flag_field": "type",
+                "debit_flag": "DBT",
+            }
+        )
+        df = reader.extract_contents_frame(contents)
+
+        # the transaction set for the future is ignored, parents are added per row
+        assert df.envelope.tolist() == ["Car:Gas", "Car", "", "", ""]
+        assert df.amount.tolist() == [10.0, 10.0, 10.0, -20.5, -20.5]
+        assert df.date.iloc[0].day == 2 and df.date.iloc[3].month == 2
+
+    @pytest.mark.parametrize("extraction_mode", ["rows", "columns"])
+    def test_csv_streaming(self, extraction_mode):
+        reader = pytest.helpers.get_transactions_car(
+            extraction_mode=extraction_mode, chunksize=1
+        )
+        leaf = reader.get_leaf_statements()
+
+        # streamed statements are summed up per envelope and month
+        assert leaf.columns.tolist() == ["envelope", "month", "amount"]
+        assert leaf.set_index("month").loc[month_code("2023-11")].amount == 1873.26
+        assert leaf.shape[0] == 2
+        assert reader.get_statements().shape[0] == 4  # 'Car' and ''
+
+    def test_iter_json_array(self):
+        objects = [
+            {"text": "a [tricky], {string}", "amount": 12345},
+            {"nested": {"list": [1, 2, 3]}, "amount": -1.5},
+            {},
+        ]
+        # a tiny buffer makes values span multiple blocks of the file
+        f = io.StringIO(" \n" + json.dumps(objects, indent=4) + "\n")
+        assert list(iter_json_array(f, buffer_size=7)) == objects
+        assert list(iter_json_array(io.StringIO("[]"))) == []
+
+        with pytest.raises(ValueError):
+            list(iter_json_array(io.StringIO('[{"amount": 1}')))
+
+    @pytest.mark.parametrize("extraction_mode", ["rows", "columns"])
+    @pytest.mark.parametrize("chunksize", [None, 2])
+    def test_ndjson_transactions(self, tmp_path, extraction_mode, chunksize):
+        with open("examples/transactions-petstore.json") as f:
+            objects = json.load(f)
+        ndjson_file = tmp_path / "transactions-petstore.ndjson"
+        ndjson_file.write_text("\n".join(json.dumps(o) for o in objects) + "\n\n")
+
+        kwargs = dict(
+            amount_field="amount",
+            date_field=["bookingdate"],
+            envelope_field="envelope",
+            extraction_mode=extraction_mode,
+            chunksize=chunksize,
+        )
+        ndjson_reader = TransactionsReader(filename=str(ndjson_file), **kwargs)
+        json_reader = TransactionsReader(
+            filename="examples/transactions-petstore.json", **kwargs
+        )
+        assert type(ndjson_reader).__name__ == "NDJSONTransactionsReader"
+        pandas.testing.assert_frame_equal(
+            ndjson_reader.get_statements(), json_reader.get_statements()
+        )
+        if chunksize:
+            assert json_reader.get_leaf_statements().amount.tolist() == [150, 100]
+
 
 if __name__ == "__main__":
     pass
@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+
+"""Tests for `budget_envelopes` package."""
+
+import json
+import os
+import shutil
+import threading
+import time
+
+from click.testing import CliRunner
+
+from budget_envelopes.budget_reader import BudgetReader, SparseBudgets
+from budget_envelopes.cli import cli
+from budget_envelopes.envelope_stats_calculator import EnvelopeStatsCalculator
+from budget_envelopes.transactions_reader import TransactionsReader
+from budget_envelopes.watch import DirectoryWatcher, WatchedInputs, is_budget_file
+
+CALCULATOR_OPTIONS = dict(first_month="2023-05", last_month="2024-01", engine="matrix")
+READER_OPTIONS = dict(
+    amount_field="amount",
+    date_field=["bookingdate"],
+    envelope_field="envelope",
+    extraction_mode="columns",
+)
+
+
+def _write_transactions(filename, transactions):
+    with open(filename, "w") as f:
+        json.dump(transactions, f)
+
+
+def _full_stats(directory):
+    # stats of all files in directory calculated from scratch
+    calculator = EnvelopeStatsCalculator(**CALCULATOR_OPTIONS)
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if is_budget_file(path):
+            calculator.add_budgets(BudgetReader(filename=path))
+        else:
+            calculator.add_transactions(
+                TransactionsReader(filename=path, **READER_OPTIONS)
+            )
+    return calculator.get_envelope_stats()
+
+
+class TestDirectoryWatcher:
+    """Tests that new, changed and removed files are detected and debounced."""
+
+    def test_scan(self, tmp_path):
+        watcher = DirectoryWatcher(str(tmp_path))
+        transactions = str(tmp_path / "transactions.json")
+        _write_transactions(transactions, [])
+
+        assert watcher.scan() == ([transactions], [])
+        assert watcher.scan() == ([], [])
+        # a new modification time alone is no change
+        os.utime(transactions, ns=(0, 0))
+        assert watcher.scan() == ([], [])
+
+        _write_transactions(transactions, [{"amount": "1"}])
+        assert watcher.scan() == ([transactions], [])
+        os.remove(transactions)
+        assert watcher.scan() == ([], [transactions])
+
+    def test_burst_is_debounced(self, tmp_path):
+        watcher = DirectoryWatcher(str(tmp_path), debounce=0.3, interval=0.05)
+        first = str(tmp_path / "first.json")
+        second = str(tmp_path / "second.json")
+        _write_transactions(first, [])
+
+        # arrives within the debounce window of the first file
+        later = threading.Timer(0.1, _write_transactions, (second, []))
+        later.start()
+        started = time.monotonic()
+        assert watcher.wait() == ([first, second], [])
+        assert time.monotonic() - started >= 0.3
+        later.join()
+
+    def test_is_budget_file(self):
+        assert is_budget_file("examples/envelope_budgets.csv")
+        assert is_budget_file("examples/envelope_adjustments.csv")
+        assert not is_budget_file("examples/transactions-car.csv")
+        assert not is_budget_file("examples/transactions-petstore.json")
+
+
+class TestWatchedInputs:
+    """Tests that the stats are updated like a calculation from scratch."""
+
+    def test_update(self, tmp_path):
+        for filename in ["envelope_budgets.csv", "envelope_adjustments.csv"]:
+            shutil.copy(os.path.join("examples", filename), tmp_path)
+        with open("examples/transactions-petstore.json") as f:
+            petstore = json.load(f)
+        transactions = str(tmp_path / "transactions-petstore.json")
+        _write_transactions(transactions, petstore[:2])
+
+        watcher = DirectoryWatcher(str(tmp_path))
+        changed, _ = watcher.scan()
+        inputs = WatchedInputs(CALCULATOR_OPTIONS, READER_OPTIONS, {}, {})
+        assert inputs.update(changed, [])
+        assert inputs.service.stats.equals(_full_stats(tmp_path))
+
+        # appended transactions only update the envelopes they touch
+        service = inputs.service
+        _write_transactions(transactions, petstore)
+        assert inputs.update(*watcher.scan())
+        assert inputs.service is service
+        assert inputs.service.stats.equals(_full_stats(tmp_path))
+
+        # new transaction file
+        _write_transactions(
+            str(tmp_path / "more.json"),
+            [{"bookingdate": "2023-09-01", "amount": "12", "envelope": "Car:Gas"}],
+        )
+        assert inputs.update(*watcher.scan())
+        assert inputs.service is service
+        assert inputs.service.stats.equals(_full_stats(tmp_path))
+
+        # changed transactions and removed files recalculate everything
+        _write_transactions(transactions, petstore[1:])
+        os.remove(tmp_path / "envelope_adjustments.csv")
+        assert inputs.update(*watcher.scan())
+        assert inputs.service is not service
+        assert inputs.service.stats.equals(_full_stats(tmp_path))
+
+    def test_reader_options(self, tmp_path):
+        # files found later are read like the files given at startup
+        shutil.copy("examples/envelope_budgets.csv", tmp_path)
+        shutil.copy("examples/transactions-petstore.json", tmp_path)
+        inputs = WatchedInputs(
+            CALCULATOR_OPTIONS,
+            READER_OPTIONS,
+            {},
+            {},
+            budget_options=dict(compact_dtypes=True, sparse_budgets=True),
+            chunksize=2,
+        )
+        assert inputs.update(*DirectoryWatcher(str(tmp_path)).scan())
+        assert all(
+            reader.compact_dtypes and isinstance(reader.budgets, SparseBudgets)
+            for reader in inputs.budgets.values()
+        )
+        assert all(reader.chunksize == 2 for reader in inputs.transactions.values())
+        assert inputs.service.stats.equals(_full_stats(tmp_path))
+
+
+class TestWatchCli:
+    """Tests that the watch mode writes its output."""
+
+    def test_writes_current_state(self, tmp_path, monkeypatch):
+        shutil.copy("examples/envelope_budgets.csv", tmp_path)
+        shutil.copy("examples/transactions-petstore.json", tmp_path)
+
+        def interrupt(self):
+            raise KeyboardInterrupt
+
+        monkeypatch.setattr(DirectoryWatcher, "wait", interrupt)
+        output_file = str(tmp_path / "out" / "envelope-stats.json")
+        os.makedirs(os.path.dirname(output_file))
+        result = CliRunner().invoke(
+            cli,
+            ["run", "--watch", str(tmp_path), "-o", output_file, "--no-cache"]
+            + ["-$", "amount", "-D", "bookingdate", "-E", "envelope"]
+            + ["--first-month", "2023-05", "--last-month", "2024-01"],
+        )
+        assert result.exit_code == 0, result.output
+        with open(output_file) as f:
+            state = json.load(f)
+        assert {row["month"] for row in state} == {"2024-01"}
+
+
+if __name__ == "__main__":
+    pass